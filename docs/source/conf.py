@@ -66,9 +66,7 @@ autodoc_default_options = {
     'members': True,
     'private-members': # from controller.tasks
                        '_api_simulation_request, '
-                       '_create_pickle_path_disk, '
                        '_create_plot_path_disk, '
-                       '_pickle, '
                        '_plot_solution, '
                        '_run_simulation, '
                        '_sim_form_to_sim_request, '
@@ -2,7 +2,6 @@
 """
 import sys
 import os
-from time import sleep
 
 import requests
 
@@ -55,17 +54,26 @@ print("    }")
 
 ########################## Simulation Status Example ##########################
 
-# Wait until the simulation is done
-sleep(5)
-
 # Get simulation ID
 sim_id = sim_request_response.json()["sim_id"]
 
 # Simulation status route
 sim_status_route = f"/api/simulate/status/{sim_id}"
 
-# Request simulation status via HTTP using `requests` module
-sim_status_response = requests.get(url + sim_status_route)
+# Request simulation status via HTTP using `requests` module. The server
+# answers as soon as the simulation is done, or after 'wait' seconds (then we
+# show its progress and ask again)
+while True:
+    sim_status_response = requests.get(url + sim_status_route,
+                                       params={"wait": 60})
+    job_state = sim_status_response.json().get("job_state")
+    if job_state not in ("queued", "running"):
+        break
+    progress = sim_status_response.json()["progress"]
+    if progress:
+        eta = progress["eta"]
+        print(f"Progress: {100 * progress['fraction']:.1f} %, "
+              f"ETA: {'?' if eta is None else f'{eta:.1f}'} s")
 
 # Print response
 sim_status_response_json = sim_status_response.json()
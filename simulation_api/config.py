@@ -5,14 +5,125 @@ import os
 # Path of this directory
 this_dir = os.path.dirname(__file__)
 
+# Path of directory of the database and of the results of the simulations. It
+# can be changed with the environment variable SIMULATION_API_DB_DIR (e.g. the
+# tests use a temporary directory)
+PATH_DB_DIR = os.environ.get("SIMULATION_API_DB_DIR",
+                             os.path.join(this_dir, 'model', 'db'))
+
 # Path of database
-PATH_DB = os.path.join(this_dir, 'model', 'db', 'simulations.db')
+PATH_DB = os.path.join(PATH_DB_DIR, 'simulations.db')
 
 # Path of directory of generated pickles
-PATH_PICKLES = os.path.join(this_dir, 'model', 'db', 'sim_results', 'pickles/')
+PATH_PICKLES = os.path.join(PATH_DB_DIR, 'sim_results', 'pickles/')
+
+# Path of directory of the results of the simulations (arrays of the solution,
+# see simulation_api.model.results). Pickles are only kept for results stored
+# by older versions
+PATH_RESULTS = os.path.join(PATH_DB_DIR, 'sim_results', 'arrays/')
 
 # Path of directory of generated plots
-PATH_PLOTS = os.path.join(this_dir, 'model', 'db', 'sim_results', 'plots/')
+PATH_PLOTS = os.path.join(PATH_DB_DIR, 'sim_results', 'plots/')
+
+# Path of directory of the contents of the files of results and plots, which
+# are hard links to them (see simulation_api.model.storage)
+PATH_OBJECTS = os.path.join(PATH_DB_DIR, 'sim_results', 'objects/')
 
 # Image format of plots
 PLOTS_FORMAT = ".png"
+
+# Size (in pixels, largest side) of the scaled down versions of each plot, used
+# in the results pages
+PLOTS_SIZES = {"thumb": 320, "medium": 800}
+
+# Image format of the scaled down versions of the plots. PNG is used instead of
+# WebP if Pillow does not support the latter
+PLOTS_SCALED_FORMAT = ".webp"
+
+# Default and maximum number of points of the trajectories served for
+# interactive plots (route /api/results/{sim_id}/series)
+SERIES_DEFAULT_POINTS = 2000
+SERIES_MAX_POINTS = 20000
+
+# Maximum number of members of an ensemble drawn in each plot
+PLOTS_MAX_MEMBERS = 50
+
+# Number of processes (workers) that run the simulations
+SIM_WORKERS = os.cpu_count()
+
+# Number of processes that render the plots of the simulations
+RENDER_WORKERS = max(1, os.cpu_count() // 4)
+
+# Niceness added to the processes that render the plots (lower priority than
+# the simulations)
+RENDER_NICENESS = 10
+
+# Render the plots of each simulation as soon as it finishes. Otherwise plots
+# are only rendered the first time they are requested
+PLOTS_EAGER = True
+
+# Maximum number of times a job that failed before starting (e.g. because
+# another job broke the pool of workers) is submitted again. Then it fails
+MAX_JOB_ATTEMPTS = 3
+
+# Maximum number of points (simulations) in a parameter sweep
+SWEEP_MAX_POINTS = 1000
+
+# Maximum number of simulations in a batch request
+BATCH_MAX_SIMULATIONS = 1000
+
+# Maximum number of entries in the cache of simulation results (least recently
+# used entries are evicted first)
+RESULT_CACHE_MAX_ENTRIES = 10000
+
+# Time to live (in seconds) of each entry in the cache of simulation results
+RESULT_CACHE_TTL = 30 * 24 * 3600
+
+# Minimum time (in seconds) between two collections of the stored objects that
+# no file links anymore (see simulation_api.model.storage._collect_garbage),
+# which are run after entries of the cache of simulation results are evicted
+OBJECTS_GC_INTERVAL = 600
+
+# Maximum number of queued and running simulations. Further requests are
+# rejected (503) until the queue drains. Sweeps and batches are admitted as a
+# whole, so it must not be smaller than SWEEP_MAX_POINTS nor
+# BATCH_MAX_SIMULATIONS
+MAX_PENDING_JOBS = 5000
+
+# Maximum number of queued and running simulations of a single user. Further
+# requests of the user are rejected (429). As MAX_PENDING_JOBS, it must not be
+# smaller than SWEEP_MAX_POINTS nor BATCH_MAX_SIMULATIONS
+MAX_PENDING_JOBS_PER_USER = 1000
+
+# Time window (in seconds) used to measure the rate at which the queue drains,
+# which sets the Retry-After of rejected requests
+RETRY_AFTER_WINDOW = 300
+
+# Retry-After (in seconds) when no simulation finished in the last window
+RETRY_AFTER_DEFAULT = 30
+
+# Maximum number of points where the solution of a simulation is stored (per
+# member of an ensemble)
+MAX_OUTPUT_POINTS = int(2e5)
+
+# Maximum estimated runtime (in seconds) of a simulation
+MAX_RUNTIME_ESTIMATE = 300
+
+# Maximum estimated peak memory (in bytes) of a simulation
+MAX_MEMORY_ESTIMATE = 1024 ** 3
+
+# Minimum time (in seconds) between two checks of a running simulation for
+# cancellation
+CANCEL_CHECK_INTERVAL = 0.5
+
+# Minimum time (in seconds) between two updates of the progress of a running
+# simulation
+PROGRESS_INTERVAL = 1.
+
+# Time (in seconds) without events after which a comment is sent to the
+# clients subscribed to events of simulations, to keep the connection alive
+EVENTS_KEEPALIVE = 15
+
+# Maximum time (in seconds) a request of the status of a simulation waits for
+# the simulation to finish (wait query parameter)
+MAX_STATUS_WAIT = 60
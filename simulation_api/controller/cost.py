@@ -0,0 +1,277 @@
+"""This module estimates the cost (runtime and peak memory) of simulation
+requests before they are admitted, see :func:`_check_cost`.
+
+The estimate is a simple model fitted to the history of the finished
+simulations of each system and integration method (``cost_stats`` table):
+
+* Number of evaluations of the right hand side of the system (``nfev``): known
+  beforehand for fixed step methods, proportional to the length of
+  ``t_span`` for adaptive methods (with the ``nfev`` per unit time measured in
+  past simulations).
+* Time spent by the solver: proportional to ``nfev`` times the number of
+  members of the ensemble.
+* Time spent storing the results: proportional to the number of points of the
+  solution. Plots are rendered later, in another pool of workers.
+* Peak memory: proportional to the size of the solution.
+"""
+from typing import Tuple, Optional, Dict, Any
+import math
+
+from sqlalchemy.orm import Session
+
+from .schemas import *
+from simulation_api.config import (MAX_OUTPUT_POINTS, MAX_RUNTIME_ESTIMATE,
+                                   MAX_MEMORY_ESTIMATE)
+from simulation_api.simulation.simulations import Simulations
+from simulation_api.model import crud
+
+
+# Estimates used while there are no finished simulations of a system and method
+_PRIOR_NFEV_PER_TIME = 200.
+"""Evaluations of the right hand side per unit of simulated time (adaptive
+methods)."""
+_PRIOR_SECONDS_PER_FEV = 2e-5
+"""Seconds per evaluation of the right hand side, per member of the ensemble."""
+_PRIOR_SECONDS_PER_SAMPLE = 5e-6
+"""Seconds spent storing each point of the solution, per member
+of the ensemble."""
+
+# Evaluations of the right hand side per step of each fixed step method
+_FIXED_STEP_NFEV = {
+    IntegrationMethods.RK4.value: 4,
+    IntegrationMethods.Leapfrog.value: 2,
+    IntegrationMethods.Yoshida4.value: 7,
+}
+
+# Evaluations of the right hand side per step of adaptive methods, only used to
+# guess the number of points of the solution when t_eval is not given
+_ADAPTIVE_NFEV_PER_STEP = 6
+
+# Peak memory over the size of the solution: solvers accumulate the solution
+# in lists before stacking it, the solution is then pickled
+_MEMORY_OVERHEAD = 4
+
+# Weight of each new simulation in the (exponential) moving averages of
+# cost_stats table
+_STATS_SMOOTHING = 0.2
+
+
+def _estimate_cost(db: Session, sim_params: SimRequest,
+                   cost_stats: Optional[Dict[Tuple[str, str], Any]] = None
+                   ) -> CostEstimate:
+    """Estimates runtime and peak memory of a simulation request.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_params : SimRequest
+        Contains all the information about the simulation request.
+    cost_stats : dict or None, optional
+        Cost statistics of every system and integration method (see
+        :func:`_load_cost_stats`), to estimate the cost of many requests
+        without querying the database for each of them. If ``None`` the
+        statistics are queried. Default is None.
+
+    Returns
+    -------
+    CostEstimate
+        Estimated cost of the simulation.
+    """
+    system = SimSystem(sim_params.system).value
+    method = IntegrationMethods(sim_params.method).value
+    dim = Simulations[system].dim
+    n_members = _n_members(sim_params)
+    t_length = abs(sim_params.t_span[1] - sim_params.t_span[0]) \
+               if len(sim_params.t_span) == 2 else 0.
+
+    stats = cost_stats.get((system, method)) if cost_stats is not None \
+            else crud._get_cost_stats(db, system, method)
+    nfev_per_time = stats.nfev_per_time if stats else _PRIOR_NFEV_PER_TIME
+    seconds_per_fev = stats.seconds_per_fev if stats else _PRIOR_SECONDS_PER_FEV
+    seconds_per_sample = stats.seconds_per_sample if stats \
+                         else _PRIOR_SECONDS_PER_SAMPLE
+
+    n_points = _n_output_points(sim_params)
+    if method == IntegrationMethods.analytic.value:
+        nfev = 0
+    elif method in _FIXED_STEP_NFEV:
+        nfev = _FIXED_STEP_NFEV[method] * max(n_points - 1, 0)
+    else:
+        nfev = int(nfev_per_time * t_length)
+    if n_points is None:
+        n_points = nfev // _ADAPTIVE_NFEV_PER_STEP + 1
+
+    runtime = nfev * n_members * seconds_per_fev \
+              + n_points * n_members * seconds_per_sample
+    memory = 8 * n_points * (n_members * dim + 1) * _MEMORY_OVERHEAD
+
+    return CostEstimate(runtime=runtime, memory=memory, nfev=nfev,
+                        n_points=n_points)
+
+
+def _check_cost(db: Session, sim_params: SimRequest,
+                cost_stats: Optional[Dict[Tuple[str, str], Any]] = None
+                ) -> Tuple[CostEstimate, str]:
+    """Checks the estimated cost of a simulation request against the quotas
+    :data:`~simulation_api.config.MAX_OUTPUT_POINTS`,
+    :data:`~simulation_api.config.MAX_MEMORY_ESTIMATE` and
+    :data:`~simulation_api.config.MAX_RUNTIME_ESTIMATE`.
+
+    Requests over the quota of points or memory are downgraded when possible:
+    the number of points where the solution is stored (``t_steps`` or
+    ``t_eval``) is reduced. This does not change the accuracy of adaptive
+    methods nor of the analytic method, but it does change the step of fixed
+    step methods, so the latter are rejected instead. Requests that are still
+    over the memory quota once downgraded are rejected too.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_params : SimRequest
+        Contains all the information about the simulation request. It is
+        modified in place if the request is downgraded.
+    cost_stats : dict or None, optional
+        See :func:`_estimate_cost`. Default is None.
+
+    Returns
+    -------
+    cost_estimate : CostEstimate
+        Estimated cost of the (possibly downgraded) simulation.
+    error_message : str
+        Explanation of why the request was rejected. Empty string if the
+        request is OK.
+    """
+    cost_estimate = _estimate_cost(db, sim_params, cost_stats)
+
+    # Maximum number of points allowed by the memory quota
+    bytes_per_point = cost_estimate.memory / max(cost_estimate.n_points, 1)
+    max_points = min(MAX_OUTPUT_POINTS,
+                     int(MAX_MEMORY_ESTIMATE // bytes_per_point))
+
+    if cost_estimate.n_points > max_points:
+        method = IntegrationMethods(sim_params.method).value
+        if method in _FIXED_STEP_NFEV:
+            return cost_estimate, \
+                   f"Error: the solution would have {cost_estimate.n_points} " \
+                   f"points per member, the maximum is {max_points}. Use " \
+                   f"fewer time steps."
+        _downgrade_output(sim_params, max_points)
+        cost_estimate = _estimate_cost(db, sim_params, cost_stats)
+        cost_estimate.downgraded = True
+
+    # Even the smallest output may not fit in memory (e.g. huge ensembles)
+    if cost_estimate.memory > MAX_MEMORY_ESTIMATE:
+        return cost_estimate, \
+               f"Error: the estimated peak memory of the simulation is " \
+               f"{cost_estimate.memory / 1024 ** 2:.0f} MiB, the maximum is " \
+               f"{MAX_MEMORY_ESTIMATE / 1024 ** 2:.0f} MiB. Use fewer " \
+               f"initial conditions."
+
+    if cost_estimate.runtime > MAX_RUNTIME_ESTIMATE:
+        return cost_estimate, \
+               f"Error: the estimated runtime of the simulation is " \
+               f"{cost_estimate.runtime:.0f} s, the maximum is " \
+               f"{MAX_RUNTIME_ESTIMATE} s. Shorten t_span or use fewer " \
+               f"initial conditions."
+
+    return cost_estimate, ""
+
+
+def _load_cost_stats(db: Session) -> Dict[Tuple[str, str], Any]:
+    """Cost statistics of every system and integration method, by system and
+    method, read with a single query. See :func:`_estimate_cost`."""
+    return {(stats.system, stats.method): stats
+            for stats in crud._get_all_cost_stats(db)}
+
+
+def _record_cost(db: Session, sim_params: SimRequest, nfev: int,
+                 solve_time: float, n_points: int, output_time: float) -> None:
+    """Updates the cost model with a finished simulation.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_params : SimRequest
+        Simulation request.
+    nfev : int
+        Number of evaluations of the right hand side of the system.
+    solve_time : float
+        Seconds spent by the solver.
+    n_points : int
+        Number of points of the solution (per member of the ensemble).
+    output_time : float
+        Seconds spent storing the results.
+    """
+    system = SimSystem(sim_params.system).value
+    method = IntegrationMethods(sim_params.method).value
+    n_members = _n_members(sim_params)
+    t_length = abs(sim_params.t_span[1] - sim_params.t_span[0])
+
+    sample = {
+        "nfev_per_time": nfev / t_length if t_length else None,
+        "seconds_per_fev": solve_time / (nfev * n_members) if nfev else None,
+        "seconds_per_sample": output_time / (n_points * n_members)
+                              if n_points else None,
+    }
+
+    stats = crud._get_cost_stats(db, system, method)
+    priors = {
+        "nfev_per_time": _PRIOR_NFEV_PER_TIME,
+        "seconds_per_fev": _PRIOR_SECONDS_PER_FEV,
+        "seconds_per_sample": _PRIOR_SECONDS_PER_SAMPLE,
+    }
+    values = {}
+    for key, prior in priors.items():
+        old = getattr(stats, key) if stats else None
+        new = sample[key]
+        if new is None:
+            values[key] = old if old is not None else prior
+        elif old is None:
+            values[key] = new
+        else:
+            values[key] = (1 - _STATS_SMOOTHING) * old + _STATS_SMOOTHING * new
+
+    cost_stats = CostStatsDBSchCreate(
+        system=system, method=method,
+        n_samples=(stats.n_samples if stats else 0) + 1, **values
+    )
+    crud._update_cost_stats(db, cost_stats)
+
+
+def _n_members(sim_params: SimRequest) -> int:
+    """Number of members of the ensemble of initial conditions (1 if there is a
+    single initial condition)."""
+    ini_cndtn = sim_params.ini_cndtn
+    if ini_cndtn and isinstance(ini_cndtn[0], list):
+        return len(ini_cndtn)
+    return 1
+
+
+def _n_output_points(sim_params: SimRequest) -> Optional[int]:
+    """Number of points where the solution is stored, ``None`` if the solver
+    chooses them (no ``t_eval`` nor ``t_steps``)."""
+    if sim_params.t_steps:
+        return sim_params.t_steps
+    if sim_params.t_eval:
+        return len(sim_params.t_eval)
+    return None
+
+
+def _downgrade_output(sim_params: SimRequest, max_points: int) -> None:
+    """Reduces the number of points where the solution is stored to at most
+    ``max_points``.
+
+    ``t_steps`` is reduced, ``t_eval`` is decimated (keeping its first point)
+    and if there is none of them, ``t_steps`` is set.
+    """
+    max_points = max(max_points, 2)
+    if sim_params.t_steps:
+        sim_params.t_steps = min(sim_params.t_steps, max_points)
+    elif sim_params.t_eval:
+        stride = math.ceil(len(sim_params.t_eval) / max_points)
+        sim_params.t_eval = sim_params.t_eval[::stride]
+    else:
+        sim_params.t_steps = max_points
@@ -0,0 +1,298 @@
+"""This module reduces the trajectories of the simulations to the points that
+can actually be told apart in a plot, before they are drawn.
+
+A figure is a few hundred pixels wide, but a solution may have up to
+:data:`~simulation_api.config.MAX_OUTPUT_POINTS` points per member: drawing
+all of them is slow and uses a lot of memory, and the result looks the same.
+Two kinds of decimation are used, both of them preserve the shape of the
+curves up to one pixel:
+
+* :func:`_minmax_decimate`: for series drawn against time. Time is split in
+  (roughly) one bucket per pixel and only the minimum and the maximum of each
+  bucket are kept, so that the envelope of the series is drawn exactly.
+* :func:`_grid_decimate`: for parametric curves (phase space trajectories),
+  which may cross the figure many times. Space is split in a grid of cells of
+  (roughly) one pixel, and consecutive points that fall in the same cell are
+  dropped.
+
+Trajectories served to clients that plot them themselves (route
+``/api/results/{sim_id}/series``) are decimated at points shared by all the
+components instead, since the client may draw any component against any other
+one. Clients ask for many (zoomed) views of the same trajectories, so when the
+results of a simulation are stored a min-max pyramid is stored along with them
+(see :func:`~simulation_api.model.pyramid._minmax_pyramid`): views are then decimated by
+:func:`_pyramid_indices` in a time proportional to the number of points served,
+not to the number of points stored. :func:`_minmax_indices` decimates results
+stored without pyramid.
+"""
+from typing import Tuple, Optional, Sequence, List
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from simulation_api.model.pyramid import _PYRAMID_BASE, _pyramid_levels
+
+
+def _figure_pixels(fig: Figure) -> int:
+    """Size (in pixels) of the largest side of ``fig``. It is used as the
+    resolution of the decimation of the curves drawn in ``fig``."""
+    return int(np.ceil(max(fig.get_size_inches()) * fig.dpi))
+
+
+def _minmax_decimate(t: np.ndarray, y: np.ndarray,
+                     n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Min-max decimation of series sampled at times ``t``.
+
+    The points are split in ``n_buckets`` buckets of consecutive points, and
+    the minimum and maximum of each bucket are kept (in the order they
+    appear). All the series are reduced to the same number of points, so they
+    can still be drawn with a single call to ``ax.plot``.
+
+    Parameters
+    ----------
+    t : ndarray, shape (N,)
+        Times.
+    y : ndarray, shape (..., N)
+        Series. Each series (last axis) is decimated independently.
+    n_buckets : int
+        Number of buckets, typically the width in pixels of the figure.
+
+    Returns
+    -------
+    t_out : ndarray, shape (..., n_out)
+        Times of the points kept from each series.
+    y_out : ndarray, shape (..., n_out)
+        Points kept from each series. ``n_out`` is at most ``2 * n_buckets``.
+        If the series have no more than ``2 * n_buckets`` points they are
+        returned unchanged (``t`` broadcast to the shape of ``y``).
+    """
+    t = np.asarray(t)
+    y = np.asarray(y)
+    n_points = t.shape[0]
+    if n_points <= 2 * n_buckets:
+        return np.broadcast_to(t, y.shape), y
+
+    # Buckets of bucket_size consecutive points, the last one is padded with
+    # its last point
+    bucket_size = -(-n_points // n_buckets)
+    n_buckets = -(-n_points // bucket_size)
+    padding = n_buckets * bucket_size - n_points
+    y_buckets = np.pad(y, [(0, 0)] * (y.ndim - 1) + [(0, padding)], mode='edge')
+    y_buckets = y_buckets.reshape(y.shape[:-1] + (n_buckets, bucket_size))
+
+    offsets = np.arange(n_buckets) * bucket_size
+    i_min = y_buckets.argmin(axis=-1) + offsets
+    i_max = y_buckets.argmax(axis=-1) + offsets
+    indices = np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)],
+                       axis=-1).reshape(y.shape[:-1] + (2 * n_buckets,))
+    indices = np.minimum(indices, n_points - 1)
+
+    return t[indices], np.take_along_axis(y, indices, axis=-1)
+
+
+def _grid_decimate(y: np.ndarray, resolution: int,
+                   limits: Optional[Sequence[Tuple[float, float]]] = None
+                   ) -> np.ndarray:
+    """Grid decimation of a parametric curve.
+
+    The bounding box of the curve (or ``limits``) is split in a grid of
+    ``resolution`` cells along each axis. A point is dropped if it falls in
+    the same cell as the previous point; the first and last points are always
+    kept.
+
+    Parameters
+    ----------
+    y : ndarray, shape (d, N)
+        Curve: ``y[i]`` is its ``i``-th coordinate.
+    resolution : int
+        Number of cells along each axis, typically the size in pixels of the
+        figure.
+    limits : sequence of (float, float) or None, optional
+        Limits of each coordinate in the plot. Default is the bounding box of
+        the curve.
+
+    Returns
+    -------
+    ndarray, shape (d, n_out)
+        Points kept.
+    """
+    y = np.asarray(y)
+    if y.shape[-1] <= 2:
+        return y
+
+    if limits is None:
+        lower = y.min(axis=-1)
+        upper = y.max(axis=-1)
+    else:
+        lower, upper = np.asarray(limits, dtype=float).T
+    scale = resolution / np.where(upper > lower, upper - lower, 1.)
+    cells = np.floor((y - lower[:, None]) * scale[:, None])
+
+    keep = np.empty(y.shape[-1], dtype=bool)
+    keep[0] = keep[-1] = True
+    keep[1:-1] = (cells[:, 1:-1] != cells[:, :-2]).any(axis=0)
+
+    return y[:, keep]
+
+
+def _uniform_indices(start: int, stop: int, n_points: int) -> np.ndarray:
+    """Sorted indices of ``n_points`` evenly spaced points of ``[start, stop)``
+    (fewer if the window is shorter), including both ends."""
+    return np.unique(np.linspace(start, stop - 1, n_points).round()
+                     .astype(np.int64))
+
+
+def _minmax_indices(y: np.ndarray, n_points: int) -> np.ndarray:
+    """Indices of a min-max decimation shared by several series.
+
+    Unlike :func:`_minmax_decimate`, all the series are decimated at the same
+    points, so that they can be drawn against each other (e.g. phase space
+    projections). The points are split in buckets of consecutive points and
+    the minimum and maximum of each series in each bucket are kept. The budget
+    of points is shared by all the series: the more series, the wider the
+    buckets. If it does not allow a bucket (i.e. ``n_points`` is smaller than
+    ``2 * S + 2`` for ``S`` series) evenly spaced points are kept instead.
+
+    Parameters
+    ----------
+    y : ndarray, shape (..., N)
+        Series.
+    n_points : int
+        Maximum number of points kept (at least the first and last points are
+        kept).
+
+    Returns
+    -------
+    ndarray
+        Sorted indices of the points kept.
+    """
+    y = np.asarray(y)
+    n_total = y.shape[-1]
+    if n_total <= n_points:
+        return np.arange(n_total)
+
+    series = y.reshape(-1, n_total)
+    n_buckets = (n_points - 2) // (2 * series.shape[0])
+    if n_buckets < 1:
+        return _uniform_indices(0, n_total, n_points)
+    bucket_size = -(-n_total // n_buckets)
+    n_buckets = -(-n_total // bucket_size)
+    padding = n_buckets * bucket_size - n_total
+    buckets = np.pad(series, [(0, 0), (0, padding)], mode='edge')
+    buckets = buckets.reshape(series.shape[0], n_buckets, bucket_size)
+
+    offsets = np.arange(n_buckets) * bucket_size
+    indices = np.concatenate([
+        (buckets.argmin(axis=-1) + offsets).ravel(),
+        (buckets.argmax(axis=-1) + offsets).ravel(),
+        [0, n_total - 1],
+    ])
+    return np.unique(np.minimum(indices, n_total - 1))
+
+
+def _range_extrema(series: np.ndarray, pyramid: np.ndarray,
+                   levels: List[Tuple[int, int, int]],
+                   start: int, stop: int) -> np.ndarray:
+    """Indices of the minimum and maximum of each series in ``[start, stop)``.
+
+    The range is covered by the largest buckets of the pyramid that fit in it
+    and by less than ``2 * _PYRAMID_BASE`` points at its ends, so the cost does
+    not depend on the length of the range (but on its logarithm).
+    """
+    n_total = series.shape[-1]
+    bucket_ids, points = [], []
+    position = start
+    while position < stop:
+        for size, offset, _ in reversed(levels):
+            end = min(position + size, n_total)
+            if position % size == 0 and end <= stop:
+                bucket_ids.append(offset + position // size)
+                position = end
+                break
+        else:
+            end = min((position // _PYRAMID_BASE + 1) * _PYRAMID_BASE, stop)
+            points.extend(range(position, end))
+            position = end
+
+    candidates = np.concatenate([
+        pyramid[0][:, bucket_ids],
+        pyramid[1][:, bucket_ids],
+        np.broadcast_to(np.asarray(points, dtype=pyramid.dtype),
+                        (series.shape[0], len(points))),
+    ], axis=-1)
+    values = np.take_along_axis(series, candidates, axis=-1)
+    rows = np.arange(series.shape[0])
+    return np.concatenate([candidates[rows, values.argmin(axis=-1)],
+                           candidates[rows, values.argmax(axis=-1)]])
+
+
+def _pyramid_indices(y: np.ndarray, pyramid: Optional[np.ndarray],
+                     start: int, stop: int, n_points: int) -> np.ndarray:
+    """Indices of a min-max decimation of the window ``[start, stop)`` of
+    several series, shared by all of them (see :func:`_minmax_indices`).
+
+    The buckets are those of the finest level of the pyramid with no more
+    than the buckets allowed by ``n_points`` in the window, so only the
+    indices stored in the pyramid and a few points of the series are read.
+    The buckets cut by the ends of the window are reduced to the extrema of
+    the part inside the window. If the budget does not allow a bucket (i.e.
+    ``n_points`` is smaller than ``6 * S + 2`` for ``S`` series) evenly spaced
+    points are kept instead.
+
+    Parameters
+    ----------
+    y : ndarray, shape (..., N)
+        Series, typically memory mapped.
+    pyramid : ndarray or None
+        Min-max pyramid of ``y``, as returned by
+        :func:`~simulation_api.model.pyramid._minmax_pyramid`. If
+        ``None`` the window is decimated by :func:`_minmax_indices`.
+    start, stop : int
+        Window of the series.
+    n_points : int
+        Maximum number of points kept (at least the first and last points of
+        the window are kept).
+
+    Returns
+    -------
+    ndarray
+        Sorted indices (in ``y``) of the points kept.
+    """
+    n_total = y.shape[-1]
+    width = stop - start
+    if width <= n_points:
+        return np.arange(start, stop)
+
+    series = y.reshape(-1, n_total)
+    if pyramid is None:
+        return _minmax_indices(series[:, start:stop], n_points) + start
+
+    # Each bucket takes 2 points per series, the 2 buckets cut by the ends of
+    # the window and the ends themselves are taken out of the budget too
+    n_series = series.shape[0]
+    n_buckets = (n_points - 2) // (2 * n_series) - 2
+    if n_buckets < 1:
+        return _uniform_indices(start, stop, n_points)
+    levels = _pyramid_levels(n_total)
+    size, offset, _ = next(
+        (level for level in levels if level[0] * n_buckets >= width),
+        levels[-1]
+    )
+
+    # Buckets of the level inside the window, and ends of the window
+    first = -(-start // size)
+    last = -(-n_total // size) if stop == n_total else stop // size
+    if first >= last:
+        return np.unique(np.concatenate([
+            _range_extrema(series, pyramid, levels, start, stop),
+            [start, stop - 1],
+        ]))
+    indices = [pyramid[:, :, offset + first:offset + last].ravel(),
+               [start, stop - 1]]
+    if start < first * size:
+        indices.append(_range_extrema(series, pyramid, levels,
+                                      start, first * size))
+    if last * size < stop:
+        indices.append(_range_extrema(series, pyramid, levels,
+                                      last * size, stop))
+    return np.unique(np.concatenate(indices))
@@ -0,0 +1,232 @@
+"""This module pushes events of the simulations to clients as Server-Sent
+Events (SSE), so that they do not need to poll the status of their
+simulations.
+
+Events are published by the job system itself (see
+:class:`~simulation_api.controller.schemas.SimEventType`): the server process
+publishes ``queued`` and ``cancelled`` events, the workers publish
+``started``, ``progress``, ``rendering`` and ``done`` events. Workers run in
+other processes, so every event goes through a multiprocessing queue. A thread
+of the server process reads this queue (see :func:`_listen_events`) and
+dispatches each event to the clients subscribed to its simulation or to its
+user, each of them with its own ``asyncio.Queue``.
+"""
+from typing import Optional, Dict, Set, Tuple, AsyncIterator
+from collections import defaultdict
+import asyncio
+import multiprocessing as mp
+import threading
+
+from fastapi import Request
+
+from .schemas import *
+from simulation_api.config import EVENTS_KEEPALIVE
+
+
+# Queue through which events reach the server process, see _get_event_queue
+_event_queue: Optional[mp.Queue] = None
+
+# Thread of the server process that dispatches the events
+_listener: Optional[threading.Thread] = None
+
+# Subscribed clients: event loop and queue of each client, by sim_id and by
+# username
+_sim_subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop,
+                                      asyncio.Queue]]] = defaultdict(set)
+_user_subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop,
+                                       asyncio.Queue]]] = defaultdict(set)
+_subscribers_lock = threading.Lock()
+
+# Events after which the simulation does not change anymore
+_final_events = (SimEventType.done, SimEventType.cancelled)
+
+
+def _get_event_queue() -> mp.Queue:
+    """Returns the queue of events. In the server process it is created (and
+    the thread that dispatches the events started) the first time it is
+    needed; in the workers it is the one set by :func:`_set_event_queue`."""
+    global _event_queue, _listener
+    if _event_queue is None:
+        _event_queue = mp.get_context('spawn').Queue()
+        _listener = threading.Thread(target=_listen_events,
+                                     args=(_event_queue,), daemon=True)
+        _listener.start()
+    return _event_queue
+
+
+def _set_event_queue(event_queue: mp.Queue) -> None:
+    """Sets the queue of events of a worker (inherited from the server
+    process)."""
+    global _event_queue
+    _event_queue = event_queue
+
+
+def _publish_event(event: SimEvent) -> None:
+    """Publishes an event of a simulation. It can be called from the server
+    process or from the workers.
+
+    Parameters
+    ----------
+    event : SimEvent
+        The event.
+    """
+    _get_event_queue().put(event.json())
+
+
+def _stop_event_listener() -> None:
+    """Stops the thread that dispatches the events (if it was started)."""
+    global _event_queue, _listener
+    if _listener is not None:
+        _event_queue.put(None)
+        _listener.join()
+        _event_queue = _listener = None
+
+
+def _listen_events(event_queue: mp.Queue) -> None:
+    """Dispatches the events of ``event_queue`` to the subscribed clients
+    until it gets ``None``. Runs in a thread of the server process."""
+    while True:
+        try:
+            message = event_queue.get()
+        except (EOFError, OSError):
+            # The queue was closed (e.g. the interpreter is exiting)
+            return
+        if message is None:
+            return
+        event = SimEvent.parse_raw(message)
+        with _subscribers_lock:
+            subscribers = _sim_subscribers.get(event.sim_id, set()) \
+                          | _user_subscribers.get(event.username, set())
+        for loop, queue in subscribers:
+            # The loop of a client may be closed before it unsubscribes
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass
+
+
+def _subscribe(sim_id: Optional[str] = None,
+               username: Optional[str] = None) -> asyncio.Queue:
+    """Subscribes a client to the events of a simulation or of a user. Must
+    be called from the event loop of the client.
+
+    Parameters
+    ----------
+    sim_id : str or None, optional
+        Simulation ID. Default is None.
+    username : str or None, optional
+        Username. Default is None.
+
+    Returns
+    -------
+    asyncio.Queue
+        Queue where the events will be put.
+    """
+    _get_event_queue()
+    queue = asyncio.Queue()
+    subscriber = (asyncio.get_event_loop(), queue)
+    with _subscribers_lock:
+        if sim_id is not None:
+            _sim_subscribers[sim_id].add(subscriber)
+        if username is not None:
+            _user_subscribers[username].add(subscriber)
+    return queue
+
+
+def _unsubscribe(queue: asyncio.Queue, sim_id: Optional[str] = None,
+                 username: Optional[str] = None) -> None:
+    """Undoes :func:`_subscribe`."""
+    with _subscribers_lock:
+        for key, subscribers in ((sim_id, _sim_subscribers),
+                                 (username, _user_subscribers)):
+            if key is None:
+                continue
+            subscribers[key] = {subscriber for subscriber in subscribers[key]
+                                if subscriber[1] is not queue}
+            if not subscribers[key]:
+                del subscribers[key]
+
+
+async def _wait_final_event(queue: asyncio.Queue, sim_id: str,
+                            timeout: float) -> bool:
+    """Waits until the final event (``done`` or ``cancelled``) of a simulation
+    is put in ``queue``, a queue returned by :func:`_subscribe`.
+
+    Parameters
+    ----------
+    queue : asyncio.Queue
+        Queue of events of the client.
+    sim_id : str
+        Simulation ID.
+    timeout : float
+        Maximum time to wait (seconds).
+
+    Returns
+    -------
+    bool
+        ``True`` if the simulation finished, ``False`` if the timeout expired.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        try:
+            event = await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            return False
+        if event.sim_id == sim_id and event.event in _final_events:
+            return True
+
+
+async def _event_stream(request: Request, queue: asyncio.Queue,
+                        sim_id: Optional[str] = None,
+                        username: Optional[str] = None,
+                        status: Optional[SimStatus] = None
+                        ) -> AsyncIterator[str]:
+    """Formats as Server-Sent Events the events put in ``queue``, a queue
+    returned by :func:`_subscribe` (with the same ``sim_id`` and
+    ``username``), until the client disconnects.
+
+    A comment is sent every :data:`~simulation_api.config.EVENTS_KEEPALIVE`
+    seconds without events, so that proxies do not close the connection.
+
+    Parameters
+    ----------
+    request : Request
+        HTTP request of the client.
+    queue : asyncio.Queue
+        Queue of events of the client.
+    sim_id : str or None, optional
+        If given, the stream ends after the final event of this simulation.
+        Default is None.
+    username : str or None, optional
+        Username the client subscribed to. Default is None.
+    status : SimStatus or None, optional
+        If given, it is sent first as a ``status`` event. If the simulation
+        already finished, the stream ends right after it. Default is None.
+
+    Yields
+    ------
+    str
+        Server-Sent Events.
+    """
+    try:
+        if status is not None:
+            yield f"event: status\ndata: {status.json()}\n\n"
+            if status.success is not None:
+                return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event.event.value}\ndata: {event.json()}\n\n"
+            if event.sim_id == sim_id and event.event in _final_events:
+                return
+    finally:
+        _unsubscribe(queue, sim_id, username)
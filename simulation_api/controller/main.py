@@ -2,31 +2,62 @@
 """
 # TODO|FIXME|BUG|HACK|NOTE| Some nice colored tags for comments.
 
-from os.path import isfile
+from os.path import isfile, basename
 from uuid import UUID
+import asyncio
 
-from fastapi import Request, BackgroundTasks, HTTPException, Depends, Form
+from fastapi import Request, HTTPException, Depends, Form, Query
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from starlette.responses import FileResponse, RedirectResponse
+from starlette.responses import (FileResponse, RedirectResponse, JSONResponse,
+                                 StreamingResponse, Response)
+from starlette.concurrency import run_in_threadpool
 from starlette.status import HTTP_303_SEE_OTHER, HTTP_404_NOT_FOUND
 from sqlalchemy.orm import Session
+from pydantic import conlist, conint
 
 # App instance and templates
 from simulation_api import app, templates
 # Schemas
 from .schemas import *
 # Simulation handler
-from .tasks import (_create_pickle_path_disk, _create_plot_path_disk, 
-                    _sim_form_to_sim_request, _api_simulation_request,
-                    _check_chen_lee_params)
+from .tasks import (_sim_form_to_sim_request, _api_simulation_request,
+                    _check_chen_lee_params,
+                    _api_sweep_request, _get_sim_status,
+                    _integration_methods, _recover_jobs, QueueFullError,
+                    _cancel_simulation, _get_sim_progress,
+                    _api_batch_request, _submit_render, _load_sim_series,
+                    _load_sim_data, _encode_series)
+from .rendering import _create_plot_path_disk
+from .workers import _shutdown_executor
+from .events import (_subscribe, _unsubscribe, _event_stream,
+                     _wait_final_event, _stop_event_listener)
 # Database-related
 from simulation_api.model import crud, models
+from simulation_api.model.results import (_results_exist, _export_pickle,
+                                          _export_pickle_gzip,
+                                          _legacy_pickle_path)
 from simulation_api.model.db_manager import SessionLocal, engine
-from simulation_api.config import PLOTS_FORMAT
+from simulation_api.config import (MAX_OUTPUT_POINTS,
+                                   MAX_STATUS_WAIT, BATCH_MAX_SIMULATIONS,
+                                   SERIES_DEFAULT_POINTS, SERIES_MAX_POINTS)
 
 # Creates all tables (defined in models) in database (simulations.db)
 models.Base.metadata.create_all(bind=engine)
 
+
+@app.on_event("startup")
+def recover_jobs():
+    """Runs the simulations that were queued (or running) when the server was
+    stopped."""
+    _recover_jobs()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    """Waits for the running simulations and stops the pool of workers."""
+    _shutdown_executor()
+    _stop_event_listener()
+
 """
 From FastAPI docs https://fastapi.tiangolo.com/tutorial/sql-databases/#alembic-note:
 
@@ -156,7 +187,7 @@ async def simulate_sim_system(request: Request,
         {
             "sim_system": str(sim_system.value),
             "request": request,
-            "integration_methods": integration_methods,
+            "integration_methods": _integration_methods(sim_system),
             "error_message": error_message,
             **sim_form.dict(),
         }
@@ -165,7 +196,6 @@ async def simulate_sim_system(request: Request,
 
 @app.post("/simulate/{sim_system}")
 async def simulate_sim_system_post(request: Request, sim_system: SimSystem,
-                                   background_tasks: BackgroundTasks,
                                    db: Session = Depends(get_db),
                                    sim_sys: SimSystem = Form(...),
                                    username: str = Form(...),
@@ -191,9 +221,6 @@ async def simulate_sim_system_post(request: Request, sim_system: SimSystem,
         HTTP request, used internally by FastAPI.
     sim_system : SimSystem
         System to be simulated.
-    background_tasks : BackgroundTasks
-        Needed to request simulation to the backend (in background). Handled
-        internally by the API.
     db : Session
         Database Session, needed to interact with database. This is handled 
         internally.
@@ -251,9 +278,10 @@ async def simulate_sim_system_post(request: Request, sim_system: SimSystem,
             error_message = "in Time Stamp, dt must be within 0 and tf - t0"
 
     # Maximum number of steps: 2e5
-    maxsteps = 2e5
-    maxsteps_reached_message = "maximum number of time steps is 2e5. " \
-                               "Increase dt or decrease t_steps."
+    maxsteps = MAX_OUTPUT_POINTS
+    maxsteps_reached_message = f"maximum number of time steps is " \
+                               f"{maxsteps:.0e}. Increase dt or decrease " \
+                               f"t_steps."
     if t_steps and t_steps > maxsteps:
         error_message = maxsteps_reached_message
     elif (tf - t0) / dt > maxsteps:
@@ -266,20 +294,13 @@ async def simulate_sim_system_post(request: Request, sim_system: SimSystem,
             error_message = "Chen-Lee parameters must satisfy a > 0, and " \
                             "b < 0, and c < 0 and a < -(b + c)"
 
+    # Check integration method is available for the system
+    if method.value not in _integration_methods(sim_sys):
+        error_message = f"{method.value} integration method is not " \
+                        f"available for this system."
+
     if error_message:
-        SysSimForm = SimFormDict[sim_system.value]
-        sim_form = SysSimForm()
-        return templates.TemplateResponse(
-            "request-simulation.html",
-            {
-                "sim_system": str(sim_system.value),
-                "request": request,
-                "integration_methods": integration_methods,
-                "error_message": error_message,
-                **sim_form.dict(),
-            },
-            status_code=400
-        )
+        return _simulation_form_error(request, sim_system, error_message)
     ############################## End of check ###############################
 
     # Change format from form data to SimRequest schema.
@@ -307,9 +328,24 @@ async def simulate_sim_system_post(request: Request, sim_system: SimSystem,
     # route "/api/simulate/{sim_system}" (calling _api_simulation_request as
     # done below)
     
-    # Request simulation from backend and get sim_id_response
-    sim_id_response = _api_simulation_request(sim_sys, sim_request,
-                                              background_tasks, db)
+    # Request simulation from backend and get sim_id_response. If the queue
+    # of simulations is full, render the form again with the explanation.
+    try:
+        sim_id_response = _api_simulation_request(sim_sys, sim_request, db)
+    except QueueFullError as e:
+        return _simulation_form_error(
+            request, sim_system,
+            e.message + f" (retry in {e.retry_after} s)",
+            status_code=e.status_code,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    # The backend may also reject the request (e.g. its cost is over quota)
+    if not sim_id_response.sim_id:
+        return _simulation_form_error(
+            request, sim_system,
+            sim_id_response.message.replace("Error: ", "", 1)
+        )
     
     # Redirect client to 'success' page
     # POST/REDIRECT/GET Strategy with 303 status code
@@ -324,6 +360,45 @@ async def simulate_sim_system_post(request: Request, sim_system: SimSystem,
     return req
 
 
+def _simulation_form_error(request: Request, sim_system: SimSystem,
+                           error_message: str, status_code: int = 400,
+                           headers: Optional[Dict[str, str]] = None):
+    """Renders the simulation's form web page again, displaying an error.
+
+    Parameters
+    ----------
+    request : Request
+        HTTP request.
+    sim_system : SimSystem
+        System to be simulated.
+    error_message : str
+        Error displayed in the form.
+    status_code : int, optional
+        Status code of the response. Default is 400.
+    headers : Dict[str, str] or None, optional
+        Headers of the response. Default is None.
+
+    Returns
+    -------
+    ``fastapi.templating.Jinja2Templates.TemplateResponse``
+        Template displaying the simulation request form.
+    """
+    SysSimForm = SimFormDict[sim_system.value]
+    sim_form = SysSimForm()
+    return templates.TemplateResponse(
+        "request-simulation.html",
+        {
+            "sim_system": str(sim_system.value),
+            "request": request,
+            "integration_methods": _integration_methods(sim_system),
+            "error_message": error_message,
+            **sim_form.dict(),
+        },
+        status_code=status_code,
+        headers=headers
+    )
+
+
 @app.get("/simulate/id/{sim_id}", name="frontend_simulation_id")
 async def simulate_id_sim_id(request: Request, sim_id: str):
     """Shows simulation id after asking for simulation in frontend form.
@@ -387,6 +462,8 @@ async def simulate_status_sim_id(request: Request, sim_id: str,
         sim_info = crud._get_simulation(db, sim_id)
         username = crud._get_username(db, sim_info.user_id)
     except:
+        # Queued or running simulations are only in the queue of jobs
+        job = crud._get_job(db, sim_id)
         return templates.TemplateResponse(
             "simulation-id-or-status.html",
             {
@@ -394,6 +471,10 @@ async def simulate_status_sim_id(request: Request, sim_id: str,
                 "sim_id": sim_id,
                 "status": True,
                 "not_finished": True,
+                "job_state": job.state if job else None,
+                "progress": _get_sim_progress(db, sim_id) if job else None,
+                "cancel_url": app.url_path_for("frontend_cancel_simulation",
+                                               sim_id=sim_id),
             }
         )
 
@@ -424,6 +505,35 @@ async def simulate_status_sim_id(request: Request, sim_id: str,
     )
 
 
+@app.post("/simulate/cancel/{sim_id}", name="frontend_cancel_simulation")
+async def simulate_cancel_sim_id(sim_id: str, db: Session = Depends(get_db)):
+    """Cancels a queued or running simulation from frontend and redirects to
+    its status.
+
+    \f
+    Parameters
+    ----------
+    sim_id : str
+        ID of the simulation.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    ``starlette.responses.RedirectResponse``
+        Redirects to the status of the simulation.
+    """
+    _cancel_simulation(db, sim_id)
+
+    sim_status_url = app.url_path_for(
+        "fronted_simulation_status",
+        sim_id=sim_id
+    )
+
+    return RedirectResponse(sim_status_url, status_code=HTTP_303_SEE_OTHER)
+
+
 # Let the user see all the available results including his/her results
 @app.get("/results", name="frontend_results")
 async def results(request: Request, db: Session = Depends(get_db)):
@@ -482,6 +592,9 @@ async def results_sim_system_sim_id(request: Request, sim_system: SimSystem,
     # Pickle download route
     route_pickle = app.url_path_for("api_download_pickle", sim_id=sim_id)
 
+    # Trajectories for the interactive plot
+    route_series = app.url_path_for("api_results_series", sim_id=sim_id)
+
     # Plot download routes
     plot_paths = app.url_path_for("api_download_plots", sim_id=sim_id)
     if sim_system == SimSystem.HO.value:
@@ -505,6 +618,7 @@ async def results_sim_system_sim_id(request: Request, sim_system: SimSystem,
         "sim_sys": sim_system.value,
         "sim_id": sim_id,
         "route_pickle": route_pickle,
+        "route_series": route_series,
     }
 
     return templates.TemplateResponse(
@@ -517,10 +631,46 @@ async def results_sim_system_sim_id(request: Request, sim_system: SimSystem,
     )
 
 
+# Must be declared before /api/simulate/{sim_system}, otherwise "batch" would be
+# taken as sim_system
+@app.post("/api/simulate/batch", name="api_request_batch")
+async def api_simulate_batch(
+    sim_requests: conlist(SimRequest, min_items=1,
+                          max_items=BATCH_MAX_SIMULATIONS),
+    db: Session = Depends(get_db)
+) -> List[SimIdResponse]:
+    """In this route the client can request several simulations at once, of
+    any of the available systems.
+
+    \f
+    Note
+    ----
+    Requests are checked one by one, the ones with errors are rejected
+    without affecting the rest. The accepted ones are stored in a single
+    transaction. If the accepted simulations do not fit in the queue, the
+    whole batch is rejected with status code 503 (or 429) and a
+    ``Retry-After`` header, as in ``/api/simulate/{sim_system}``.
+
+    Parameters
+    ----------
+    sim_requests : List[SimRequest]
+        Simulation requests, at most
+        :data:`~simulation_api.config.BATCH_MAX_SIMULATIONS`.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    List[SimIdResponse]
+        Response to each simulation request, in the same order.
+    """
+    return _api_batch_request(sim_requests, db)
+
+
 @app.post("/api/simulate/{sim_system}", name="api_request_sim")
 async def api_simulate_sim_system(sim_system: SimSystem,
                                   sim_params: SimRequest,
-                                  background_tasks: BackgroundTasks,
                                   db: Session = Depends(get_db)) -> SimIdResponse:
     """In this route the client can request a simulation.
 
@@ -531,8 +681,12 @@ async def api_simulate_sim_system(sim_system: SimSystem,
     \f
     Note 
     ----
-    Here we use ``fastapi.BackgroudTasks`` to make the simulation in the
-    background.
+    The simulation runs in the background, in the pool of workers defined in
+    :mod:`~simulation_api.controller.workers`. If there are too many pending
+    simulations the request is rejected with status code 503 (or 429 if the
+    limit of the user was reached) and a ``Retry-After`` header (413 without
+    it if the request alone exceeds the limits), see
+    :func:`~simulation_api.controller.tasks._check_admission`.
     
     Parameters
     ----------
@@ -541,8 +695,6 @@ async def api_simulate_sim_system(sim_system: SimSystem,
     sim_params : SimRequest
         Simulation request information with schema given by SimRequest and
         decalared in schemas.py.
-    background_tasks : BackgroundTasks
-        Background task FastAPI manager (Class). This is handled internally.
     db : Session
         Database Session, needed to interact with database. This is handled 
         internally.
@@ -555,22 +707,29 @@ async def api_simulate_sim_system(sim_system: SimSystem,
     """
 
     sim_id_response = _api_simulation_request(sim_system, sim_params,
-                                              background_tasks, db)
+                                              db)
 
     return sim_id_response
 
 
 @app.get("/api/simulate/status/{sim_id}", name="api_simulate_status")
 async def api_simulate_status_sim_id(
-    sim_id: str, db: Session = Depends(get_db)
+    sim_id: str, wait: float = 0, db: Session = Depends(get_db)
 ) -> SimStatus:
     """Obtains status of requested simulation.
 
+    If ``wait`` is given and the simulation is queued or running, the request
+    waits until the simulation finishes (or ``wait`` seconds, at most
+    :data:`~simulation_api.config.MAX_STATUS_WAIT`) before answering.
+
     \f
     Parameters
     ----------
     sim_id : str
         ID of the simulation.
+    wait : float, optional
+        Maximum time (seconds) to wait for the simulation to finish. Default
+        is 0.
     db : Session
         Database Session, needed to interact with database. This is handled 
         internally.
@@ -580,57 +739,246 @@ async def api_simulate_status_sim_id(
     SimStatus
         Status information of the simulation and how to get the results.
     """
+    wait = min(max(wait, 0), MAX_STATUS_WAIT)
+    if not wait:
+        return _get_sim_status(db, sim_id)
 
-    # Simulation status
-    sim_status = crud._get_simulation(db, sim_id)
-    # Plot query params possible values
-    plot_query_values = crud._get_plot_query_values(db, sim_id)
+    # Subscribe before reading the status, so that the end of the simulation
+    # is not missed
+    queue = _subscribe(sim_id=sim_id)
+    try:
+        sim_status = _get_sim_status(db, sim_id)
+        if sim_status.job_state in (JobState.queued, JobState.running) \
+                or (sim_status.job_state == JobState.cancelled
+                    and sim_status.success is None):
+            # Do not hold the database connection while waiting
+            db.close()
+            await _wait_final_event(queue, sim_id, wait)
+            # Answer with the current status, also if the wait timed out: the
+            # simulation may have started running meanwhile
+            sim_status = _get_sim_status(db, sim_id)
+    finally:
+        _unsubscribe(queue, sim_id=sim_id)
 
-    # Parameters
-    params = crud._get_parameters(db, sim_id, ParamType.param)
-    # Initial conditions
-    ini_cndtn = crud._get_parameters(db, sim_id, ParamType.ini_cndtn)
+    return sim_status
 
-    sim_status_NA = {
-        "sim_id": sim_id,
-        "user_id": 0,
-        "date": str(datetime.utcnow()),
-        "system": None,
-        "success": None,
-        "message": sim_id_not_found_message
-    }
 
-    sim_status = sim_status.__dict__ if sim_status else sim_status_NA
+@app.get("/api/simulate/events/{sim_id}", name="api_simulate_events")
+async def api_simulate_events_sim_id(request: Request, sim_id: str,
+                                     db: Session = Depends(get_db)):
+    """Pushes the events of a simulation as Server-Sent Events
+    (``text/event-stream``).
 
-    sim_status_complete = {
-        "ini_cndtn": ini_cndtn,
-        "params": params,
-        "plot_query_values": plot_query_values,
-        **sim_status,
-    }
+    The first event (``status``) is the current status of the simulation, as
+    returned by ``/api/simulate/status/{sim_id}``. Then the events of the
+    simulation are pushed as they happen: ``queued``, ``started``,
+    ``progress``, ``rendering`` and finally ``done`` or ``cancelled``, after
+    which the stream ends. If the simulation already finished, the stream ends
+    right after the ``status`` event.
 
-    return SimStatus(**sim_status_complete)
+    \f
+    Parameters
+    ----------
+    request : Request
+        HTTP request, used internally by FastAPI.
+    sim_id : str
+        ID of the simulation.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    ``starlette.responses.StreamingResponse``
+        Stream of events.
+    """
+    # Subscribe before reading the status, so that no event is missed
+    queue = _subscribe(sim_id=sim_id)
+    sim_status = _get_sim_status(db, sim_id)
+    db.close()
+
+    if sim_status.system is None:
+        _unsubscribe(queue, sim_id=sim_id)
+        raise HTTPException(status_code=404, detail=sim_id_not_found_message)
+
+    return StreamingResponse(
+        _event_stream(request, queue, sim_id=sim_id, status=sim_status),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/api/simulate/events/user/{username}", name="api_user_events")
+async def api_user_events_username(request: Request, username: str):
+    """Pushes the events of all the simulations of a user as Server-Sent
+    Events (``text/event-stream``). See ``/api/simulate/events/{sim_id}`` for
+    the types of events.
+
+    \f
+    Parameters
+    ----------
+    request : Request
+        HTTP request, used internally by FastAPI.
+    username : str
+        Username.
+
+    Returns
+    -------
+    ``starlette.responses.StreamingResponse``
+        Stream of events.
+    """
+    queue = _subscribe(username=username)
+
+    return StreamingResponse(
+        _event_stream(request, queue, username=username),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.delete("/api/simulate/{sim_id}", name="api_cancel_sim")
+async def api_cancel_sim_id(
+    sim_id: str, db: Session = Depends(get_db)
+) -> SimStatus:
+    """Cancels a queued or running simulation.
+
+    A queued simulation never runs. A running simulation stops shortly, its
+    results are neither stored nor plotted. In both cases the simulation is
+    recorded as unsuccessful with a cancellation message. Finished
+    simulations are not modified.
+
+    \f
+    Parameters
+    ----------
+    sim_id : str
+        ID of the simulation.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    SimStatus
+        Status information of the simulation after the cancellation.
+    """
+    return _cancel_simulation(db, sim_id)
+
+
+@app.post("/api/sweep/{sim_system}", name="api_request_sweep")
+async def api_sweep_sim_system(sim_system: SimSystem,
+                               sweep_params: SweepRequest,
+                               db: Session = Depends(get_db)) -> SweepIdResponse:
+    """In this route the client can request a parameter sweep: one simulation
+    for each point of a grid or list of parameters.
+
+    All the simulations of the sweep land under a single sweep ID, which can
+    be used to follow their status via GET in ``/api/sweep/status/{sweep_id}``.
+
+    \f
+    Note
+    ----
+    The simulations of the sweep run in a pool of processes, see
+    :func:`simulation_api.controller.tasks._api_sweep_request`.
+
+    Parameters
+    ----------
+    sim_system : SimSystem
+        System to be simulated.
+    sweep_params : SweepRequest
+        Parameter sweep request information with schema given by SweepRequest
+        and declared in schemas.py.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    SweepIdResponse
+        Contains the sweep ID and the simulation ID of each point.
+    """
+    return _api_sweep_request(sim_system, sweep_params, db)
+
+
+@app.get("/api/sweep/status/{sweep_id}", name="api_sweep_status")
+async def api_sweep_status_sweep_id(
+    sweep_id: str, db: Session = Depends(get_db)
+) -> SweepStatus:
+    """Obtains status of a requested parameter sweep.
+
+    \f
+    Parameters
+    ----------
+    sweep_id : str
+        ID of the sweep.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    SweepStatus
+        Status of the sweep and of each one of its simulations.
+    """
+    sim_ids = crud._get_sweep_sim_ids(db, sweep_id)
+
+    if not sim_ids:
+        raise HTTPException(404, detail=sweep_not_found_message)
+
+    simulations = [_get_sim_status(db, sim_id) for sim_id in sim_ids]
+    finished = [status for status in simulations if status.success is not None]
+
+    return SweepStatus(
+        sweep_id=sweep_id,
+        n_points=len(simulations),
+        n_finished=len(finished),
+        n_success=sum(status.success for status in finished),
+        simulations=simulations,
+    )
+
+
+def _accepts_encoding(request: Request, encoding: str) -> bool:
+    """Whether the client accepts responses with content coding ``encoding``,
+    according to the ``Accept-Encoding`` header of ``request``. Codings with
+    ``q=0`` are not accepted, and ``encoding`` itself takes precedence over
+    ``*``."""
+    accepted = False
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        name = name.strip().lower()
+        if name not in (encoding, "*"):
+            continue
+        q = params.strip()
+        try:
+            acceptable = not q.startswith("q=") or float(q[2:]) > 0
+        except ValueError:
+            acceptable = False
+        if name == encoding:
+            return acceptable
+        accepted = acceptable
+    return accepted
 
 
 @app.get("/api/results/{sim_id}/pickle", name="api_download_pickle")
-async def api_results_sim_id_pickle(sim_id: str):
+async def api_results_sim_id_pickle(sim_id: str, request: Request):
     """Download pickle of previously requested simulation. 
 
+    The pickle is sent compressed (``Content-Encoding: gzip``) to clients that
+    accept it. The compressed pickle is written once, the first time it is
+    requested.
     \f
     Parameters
     ----------
     sim_id : str
         ID of the simulation.
+    request : Request
+        HTTP request, its ``Accept-Encoding`` header is used.
 
     Returns
     -------
-    starlette.responses.FileResponse
-        ``FileResponse`` containing the simulation results
-        in pickle format.
+    starlette.responses.Response
+        Response containing the simulation results in pickle format.
     """
-    pickle_path_disk = _create_pickle_path_disk(sim_id)
-
-    if not isfile(pickle_path_disk):
+    if not _results_exist(sim_id):
         message = "The file you requested is not in our database. " \
                   "If your smulation id (sim_id) is correct, there might be " \
                   "an internal server error and the file you requested is " \
@@ -639,19 +987,209 @@ async def api_results_sim_id_pickle(sim_id: str):
     
     # Media type application/octet-stream is any type of binary data
     # The technical name of media types is "MIME types"
-    return FileResponse(pickle_path_disk, media_type="application/octet-stream",
-                        filename=sim_id + ".pickle")
+    headers = {"Vary": "Accept-Encoding"}
+    if _accepts_encoding(request, "gzip"):
+        # The compressed pickle is written the first time it is requested,
+        # this blocks so it is done in a thread
+        gzip_path_disk = await run_in_threadpool(_export_pickle_gzip, sim_id)
+        if gzip_path_disk:
+            return FileResponse(gzip_path_disk,
+                                media_type="application/octet-stream",
+                                filename=sim_id + ".pickle",
+                                headers={**headers,
+                                         "Content-Encoding": "gzip"})
+
+    pickle_path_disk = _legacy_pickle_path(sim_id)
+    if isfile(pickle_path_disk):
+        # Results stored by older versions of the API
+        return FileResponse(pickle_path_disk,
+                            media_type="application/octet-stream",
+                            filename=sim_id + ".pickle", headers=headers)
+
+    # Pickle is generated from the stored arrays, this blocks so it is done in
+    # a thread
+    return Response(
+        await run_in_threadpool(_export_pickle, sim_id),
+        media_type="application/octet-stream",
+        headers={**headers, "Content-Disposition":
+                 f'attachment; filename="{sim_id}.pickle"'}
+    )
+
+
+@app.get("/api/results/{sim_id}/series", name="api_results_series",
+         response_model=SimSeries)
+async def api_results_sim_id_series(
+    sim_id: str,
+    points: conint(ge=2, le=SERIES_MAX_POINTS) = SERIES_DEFAULT_POINTS,
+    t0: Optional[float] = None,
+    t1: Optional[float] = None,
+    format: SeriesFormat = SeriesFormat.json,
+    db: Session = Depends(get_db)
+):
+    """Trajectories of a simulation, decimated to at most ``points`` points.
+
+    Meant for plotting the results in the client (any component against any
+    other one, or against time). The minimum and maximum of each component in
+    each interval of time are kept, so that the decimated trajectories look
+    like the full ones. Zoomed views are requested with ``t0`` and ``t1``,
+    they are served in a time proportional to ``points``. Use
+    ``format=binary`` for a compact encoding, see
+    :class:`~simulation_api.controller.schemas.SeriesFormat`.
+    \f
+    Parameters
+    ----------
+    sim_id : str
+        ID of the simulation.
+    points : int, optional
+        Maximum number of points. Default is
+        :data:`~simulation_api.config.SERIES_DEFAULT_POINTS`.
+    t0 : float or None, optional
+        Start of the view. Default is the start of the simulation.
+    t1 : float or None, optional
+        End of the view. Default is the end of the simulation.
+    format : SeriesFormat, optional
+        Encoding of the response. Default is ``SeriesFormat.json``.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    SimSeries or starlette.responses.Response
+        Decimated trajectories, binary encoded if ``format`` is
+        ``SeriesFormat.binary``.
+    """
+    sim_info = crud._get_simulation(db, sim_id)
+    db.close()
+
+    if not (sim_info and sim_info.success
+            and _results_exist(sim_id)):
+        raise HTTPException(404, detail=series_not_found_message)
+
+    if t0 is not None and t1 is not None and t0 > t1:
+        raise HTTPException(422, detail=data_window_message)
+
+    # Loading the results blocks, so it is done in a thread
+    t, y, n_total = await run_in_threadpool(_load_sim_series, sim_id, points,
+                                            t0, t1)
+    header = {
+        "sim_id": sim_id,
+        "system": sim_info.system,
+        "components": SimSystem_to_components[sim_info.system],
+        "n_points": n_total,
+    }
+
+    if format == SeriesFormat.binary:
+        return Response(_encode_series(header, t, y),
+                        media_type="application/octet-stream")
+
+    return SimSeries(t=t.tolist(), y=y.tolist(), **header)
+
+
+@app.get("/api/results/{sim_id}/data", name="api_results_data",
+         response_model=SimData)
+async def api_results_sim_id_data(
+    sim_id: str,
+    t0: Optional[float] = None,
+    t1: Optional[float] = None,
+    stride: conint(ge=1) = 1,
+    components: Optional[List[str]] = Query(None),
+    format: SeriesFormat = SeriesFormat.json,
+    db: Session = Depends(get_db)
+):
+    """Window ``t0 <= t <= t1`` of the trajectories of a simulation, at full
+    precision.
+
+    Unlike the pickle, only the requested part of the results is served: every
+    ``stride``-th point of the window, of the requested ``components`` (all of
+    them by default; repeat the query parameter or separate them by commas).
+    Use ``format=binary`` for a compact encoding, see
+    :class:`~simulation_api.controller.schemas.SeriesFormat`.
+    \f
+    Parameters
+    ----------
+    sim_id : str
+        ID of the simulation.
+    t0 : float or None, optional
+        Start of the window. Default is the start of the simulation.
+    t1 : float or None, optional
+        End of the window. Default is the end of the simulation.
+    stride : int, optional
+        Every ``stride``-th point of the window is served. Default is 1.
+    components : List[str] or None, optional
+        Names of the components served, see
+        :data:`~simulation_api.controller.schemas.SimSystem_to_components`.
+        Default is all of them.
+    format : SeriesFormat, optional
+        Encoding of the response. Default is ``SeriesFormat.json``.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
+
+    Returns
+    -------
+    SimData or starlette.responses.Response
+        Window of the trajectories, binary encoded if ``format`` is
+        ``SeriesFormat.binary``.
+    """
+    sim_info = crud._get_simulation(db, sim_id)
+    db.close()
+
+    if not (sim_info and sim_info.success and _results_exist(sim_id)):
+        raise HTTPException(404, detail=series_not_found_message)
+
+    if t0 is not None and t1 is not None and t0 > t1:
+        raise HTTPException(422, detail=data_window_message)
+
+    system_components = SimSystem_to_components[sim_info.system]
+    if components:
+        components = [name for names in components
+                      for name in names.split(",") if name]
+    else:
+        components = system_components
+    if not set(components) <= set(system_components):
+        raise HTTPException(
+            422, detail=data_components_message + ", ".join(system_components)
+        )
+
+    # Reading the results blocks, so it is done in a thread
+    t, y, n_total, start = await run_in_threadpool(
+        _load_sim_data, sim_id, t0, t1, stride,
+        [system_components.index(name) for name in components]
+    )
+    header = {
+        "sim_id": sim_id,
+        "system": sim_info.system,
+        "components": components,
+        "n_points": n_total,
+        "start": start,
+        "stride": stride,
+    }
+
+    if format == SeriesFormat.binary:
+        return Response(_encode_series(header, t, y, dtype="float64"),
+                        media_type="application/octet-stream")
+
+    return SimData(t=t.tolist(), y=y.tolist(), **header)
 
 
 # `value` is a query parameter and its value must match one of the plot_ids
 # given in simulation status via GET in route "/api/results/{sim_id}"
 @app.get("/api/results/{sim_id}/plot", name="api_download_plots")
-async def api_results_sim_id_plot(sim_id: str, value: PlotQueryValues):
+async def api_results_sim_id_plot(sim_id: str, value: PlotQueryValues,
+                                  size: PlotSize = PlotSize.full,
+                                  db: Session = Depends(get_db)):
     """Download plot of previously requested simulation.
     
-    Note one query param is required here.
+    Note one query param is required here. The optional query param ``size``
+    selects a scaled down version of the plot (``thumb`` or ``medium``,
+    encoded as WebP), by default the plot is served in its full size (PNG).
     \f
     Here we use FileResponse from starlette.responses
+
+    Plots are rendered the first time they are requested (unless they were
+    already rendered in the background, see
+    :data:`~simulation_api.config.PLOTS_EAGER`) and then kept on disk.
     
     Parameters
     ----------
@@ -660,6 +1198,11 @@ async def api_results_sim_id_plot(sim_id: str, value: PlotQueryValues):
     value : PlotQueryValues
         Query values. Must be a member of one of the Enum classes given in
         PlotQueryValues.
+    size : PlotSize, optional
+        Size of the plot. Default is ``PlotSize.full``.
+    db : Session
+        Database Session, needed to interact with database. This is handled 
+        internally.
 
     Returns
     -------
@@ -667,23 +1210,61 @@ async def api_results_sim_id_plot(sim_id: str, value: PlotQueryValues):
         ``FileResponse`` containing the requested plot.
     """
 
-    plot_path_disk = _create_plot_path_disk(sim_id, value.value, PLOTS_FORMAT)
+    plot_path_disk = _create_plot_path_disk(sim_id, value.value, size.value)
+
+    message = "The plot you requested is not in our database. " \
+              "If your smulation id (sim_id) and the query param " \
+              "'value' are correct, there might be an internal server " \
+              "error and the plot you requested is not available."
+
+    # Render the plot in the pool of workers that renders plots, without
+    # blocking the server. If it is already being rendered (e.g. eagerly,
+    # right after the simulation finished) that rendering is awaited
+    if not isfile(plot_path_disk) \
+            and value.value in crud._get_plot_query_values(db, sim_id):
+        db.close()
+        try:
+            await asyncio.wrap_future(_submit_render(sim_id, value.value))
+        except Exception:
+            raise HTTPException(404, detail=message)
 
     if not isfile(plot_path_disk):
-        message = "The plot you requested is not in our database. " \
-                  "If your smulation id (sim_id) and the query param " \
-                  "'value' are correct, there might be an internal server " \
-                  "error and the plot you requested is not available."
         raise HTTPException(404, detail=message)
 
-    return FileResponse(plot_path_disk, media_type="image/png",
-                        filename=sim_id + "_" + value.value + ".png")
+    plot_format = plot_path_disk.rsplit(".", 1)[-1]
+    return FileResponse(plot_path_disk, media_type="image/" + plot_format,
+                        filename=basename(plot_path_disk))
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_exception_handler(request: Request, exc: QueueFullError):
+    """Handles rejected simulation requests (the queue of simulations is full)
+    with 503 or 429 status code and ``Retry-After`` header, or 413 status code
+    (without ``Retry-After``) if the request alone does not fit in the
+    queue."""
+    headers = None
+    if exc.retry_after is not None:
+        headers = {"Retry-After": str(exc.retry_after)}
+    return JSONResponse(
+        {"detail": exc.message, "retry_after": exc.retry_after},
+        status_code=exc.status_code,
+        headers=headers
+    )
 
 
 @app.exception_handler(StarletteHTTPException)
 async def custom_http_exception_handler(request: Request,
                                         exc: StarletteHTTPException):
-    """Handles 404 exceptions by rendering a template."""
+    """Handles 404 exceptions by rendering a template.
+
+    Errors of the API (paths starting with ``/api/``) are answered with their
+    status code and detail in JSON instead, so that API clients can handle
+    them.
+    """
+    if request.url.path.startswith("/api/"):
+        return JSONResponse({"detail": exc.detail},
+                            status_code=exc.status_code,
+                            headers=getattr(exc, "headers", None))
     return templates.TemplateResponse(
         "404.html",
         {
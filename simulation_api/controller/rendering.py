@@ -0,0 +1,355 @@
+"""This module renders the plots of the simulations.
+
+Plots are rendered in the pool of workers that renders plots (see
+:mod:`~simulation_api.controller.workers`), one task per plot, so that the
+plots of a simulation are rendered concurrently. Nothing here changes the
+global state of matplotlib: figures are created with the class ``Figure``
+(pyplot is never used) and the style of each figure, e.g. its font size, is
+set on the figure itself (see :func:`_set_font_size`) instead of in
+``matplotlib.rcParams``. Hence the style of a plot does not depend on the
+plots previously rendered by the same worker.
+
+Note that plots are rendered in processes, not threads: some parts of
+matplotlib (e.g. the parser of math text in labels) are not thread-safe.
+"""
+from typing import Optional, List
+from io import BytesIO
+
+from PIL import Image, features
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d import Axes3D
+# import matplotlib.pyplot as plt
+from numpy import abs
+
+from .schemas import *
+from simulation_api.config import (PATH_PLOTS, PLOTS_FORMAT,
+                                   PLOTS_MAX_MEMBERS, PLOTS_SIZES,
+                                   PLOTS_SCALED_FORMAT)
+# Decimation of the trajectories before plotting them
+from .decimation import _figure_pixels, _minmax_decimate, _grid_decimate
+from simulation_api.model.storage import _sharded_path, _write_file
+
+# Next line of code avoids a warning when generating matplotlib figures: 
+# `UserWarning: Starting a Matplotlib GUI outside of the main thread will likely
+# fail.`
+
+# Found the solution in this post: 
+# https://stackoverflow.com/questions/50157759/runtimeerror-main-thread-is-not-in-main-loop-using-matplotlib-with-django
+# The latter cites this matplotlib documentation:
+# https://matplotlib.org/faq/howto_faq.html#matplotlib-in-a-web-application-server
+
+# From last link: 'You may be able to work on separate figures from separate
+# threads. However, you must in that case use a non-interactive backend
+# (typically Agg), because most GUI backends require being run from the main
+# thread as well.'
+
+# And also: 'In general, the simplest solution when using
+# Matplotlib in a web server is to completely avoid using pyplot.'
+
+# Next line of code is only needed if using pyplot (which is not recommended)
+
+# import matplotlib as mpl
+# mpl.use('Agg')
+
+
+# Font size of the plots
+_FONT_SIZE = 17
+
+# Font size of the projections of the phase portrait of Chen-Lee attractor
+# (a wider figure)
+_FONT_SIZE_PROJECTIONS = 25
+
+
+def _plot_solution(sim_results: SimResults, system: SimSystem,
+                   plots_basename: str = "00000",
+                   only: Optional[List[str]] = None) -> List[str]:
+    """Generates relevant simulation's plots and saves them.
+    
+    Parameters
+    ----------
+    sim_results : SimResults
+        Simulation results as returned by
+        :meth:`~simulation_api.simulation.simulations.Simulation.simulate`.
+    system : SimSystem
+        System to be simulated.
+    plots_basename : str
+        Base name of the plots. Actual name of each plot will be
+        ``<plotbasename>_<plot_query_value>.png``, where ``<plot_query_value>``
+        is a special tag for each type of plot. In this API, baseplot will
+        always be the value of
+        :attr:`~simulation_api.controller.schemas.SimIdResponse.sim_id`.
+    only : List[str] or None, optional
+        Plot query values of the plots to be generated. All of them are
+        generated if ``None``. Default is None.
+
+    Returns
+    -------
+    plot_query_values : List[str]
+        Names of each type of plot (also those not generated, see ``only``).
+        These are very important since they are needed to access the plots in
+        the API route (these are the possible values for the query param
+        "value" in route ``/api/results/{sim_id}/plot``).
+    """
+
+    # Get simulation results as OdeResult instance
+    sim_results = sim_results.sim_results
+
+    # Trajectories with shape (M, n, n_points). A single simulation is an
+    # ensemble of one member, for ensembles only the first PLOTS_MAX_MEMBERS
+    # members are drawn.
+    y = sim_results.y
+    y = y[:PLOTS_MAX_MEMBERS] if y.ndim == 3 else y[None]
+    
+    plot_query_values = []
+
+    if system == SimSystem.HO:    
+        ##################################
+        # Using pyplot (not recommended) #
+        ##################################
+        # # Phase space trajectory plot
+        # plot_query_value = 'phase'
+        # plot_query_values.append(plot_query_value)
+
+        # fig = plt.figure()
+        # ax = fig.add_subplot(111)
+        # plt.plot(sim_results.y[0], sim_results.y[1])
+        # ax.set_aspect('equal', adjustable='box')
+        # plt.xlabel('q')
+        # plt.ylabel('p')
+        # plt.title('Phase space')
+        # fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
+        # plt.close()
+
+        # # Canonical coordinates evolution plot
+        # plot_query_value = 'coord'
+        # plot_query_values.append(plot_query_value)
+
+        # fig = plt.figure()
+        # ax = fig.add_subplot(111)
+        # plt.plot(sim_results.t, sim_results.y[0], label='q(t)')
+        # plt.plot(sim_results.t, sim_results.y[1], label='p(t)')
+        # plt.xlabel('t')
+        # plt.ylabel('Canonical coordinate')
+        # plt.title('Canonical coordinates evolution')
+        # plt.legend()
+        # fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
+        # plt.close()
+
+        #######################################################################
+        # NOT using pyplot (RECOMMENDED, read comments provided after imports)#
+        #######################################################################
+
+        ##################### Phase space trajectory plot #####################
+        plot_query_value = PlotQueryValues_HO.phase.value
+        plot_query_values.append(plot_query_value)
+
+        if only is None or plot_query_value in only:
+            xlim = abs(y[:, 0]).max()
+            ylim = abs(y[:, 1]).max()
+            ax_lim = max([xlim, ylim]) * 1.05
+            dashed_line = [[-ax_lim, ax_lim], [0, 0]]
+
+            fig = Figure()
+            ax = fig.add_subplot(111)
+            limits = [(-ax_lim, ax_lim)] * 2
+            for y_i in y:
+                ax.plot(*_grid_decimate(y_i[:2], _figure_pixels(fig), limits))
+            ax.plot(dashed_line[0], dashed_line[1], 'k--')
+            ax.plot(dashed_line[1], dashed_line[0], 'k--')
+            ax.set_aspect('equal', adjustable='box')
+            ax.set_xlabel('q')
+            ax.set_ylabel('p')
+            # ax.set_title('Phase space')
+            ax.set_xlim(-ax_lim, ax_lim)
+            ax.set_ylim(-ax_lim, ax_lim)
+            _set_font_size(fig, _FONT_SIZE)
+            fig.tight_layout()
+            _save_figure(fig, plots_basename, plot_query_value)
+        
+
+        ################ Canonical coordinates evolution plot #################
+        plot_query_value = PlotQueryValues_HO.coord.value
+        plot_query_values.append(plot_query_value)
+
+        if only is None or plot_query_value in only:
+            fig = Figure()
+
+            ax = fig.add_subplot(111)
+            t_q, q = _minmax_decimate(sim_results.t, y[:, 0],
+                                      _figure_pixels(fig))
+            t_p, p = _minmax_decimate(sim_results.t, y[:, 1],
+                                      _figure_pixels(fig))
+            lines_q = ax.plot(t_q.T, q.T, c='C0')
+            lines_p = ax.plot(t_p.T, p.T, c='C1')
+            ax.set_xlabel('t')
+            ax.set_ylabel('Canonical coordinate')
+            ax.legend([lines_q[0], lines_p[0]], ['q(t)', 'p(t)'],
+                      fontsize=_FONT_SIZE)
+
+            _set_font_size(fig, _FONT_SIZE)
+            fig.tight_layout()
+            _save_figure(fig, plots_basename, plot_query_value)
+    
+    elif system == SimSystem.ChenLee:
+        
+        # Plot limits (shared by all the plots)
+        limx_max = y[:, 0].max()
+        limx_min = y[:, 0].min()
+        margin_x = 0.05 * (limx_max - limx_min)
+        limy_max = y[:, 1].max()
+        limy_min = y[:, 1].min()
+        margin_y = 0.05 * (limy_max - limy_min)
+        limz_max = y[:, 2].max()
+        limz_min = y[:, 2].min()
+        margin_z = 0.05 * (limz_max - limz_min)
+        xlim = (limx_min - margin_x, limx_max + margin_x)
+        ylim = (limy_min - margin_y, limy_max + margin_y)
+        zlim = (limz_min - margin_z, limz_max + margin_z)
+
+        ########################## 3D Phase portrait ##########################
+        plot_query_value = PlotQueryValues_ChenLee.threeD.value
+        plot_query_values.append(plot_query_value)
+
+        if only is None or plot_query_value in only:
+            fig = Figure() # figsize=(12,10))
+            ax = fig.add_subplot(111, projection='3d')    #Parametric 3D curve
+            # 3D axes do not accept 2D arrays, so each member is drawn separately
+            for y_i in y:
+                ax.plot(*_grid_decimate(y_i, _figure_pixels(fig),
+                                        [xlim, ylim, zlim]), c='navy')
+            ax.set_xlabel('$\Omega_x$')
+            ax.set_ylabel('$\Omega_y$')
+            ax.set_zlabel('$\Omega_z$')
+            ax.set_zlim(*zlim)
+            ax.set_xlim(*xlim)
+            ax.set_ylim(*ylim)
+            _set_font_size(fig, _FONT_SIZE)
+            fig.tight_layout()
+            _save_figure(fig, plots_basename, plot_query_value)
+
+        ##################### Phase portrait projections ######################
+        plot_query_value = PlotQueryValues_ChenLee.project.value
+        plot_query_values.append(plot_query_value)
+
+        if only is None or plot_query_value in only:
+            nrows = 1
+            ncols = 3
+
+            fig = Figure(figsize=(20,10))
+        
+            ax = fig.add_subplot(nrows, ncols, 1)
+            lines = [ax.plot(*_grid_decimate(y_i[[0, 1]], _figure_pixels(fig),
+                                             [xlim, ylim]), c='indianred')[0]
+                     for y_i in y]
+            ax.legend(lines[:1], ['Phase portrait $\Omega_x\Omega_y$'], loc='best',
+                      fontsize=_FONT_SIZE_PROJECTIONS)
+            ax.set_xlabel('$\Omega_x$')
+            ax.set_ylabel('$\Omega_y$')
+            ax.set_xlim(*xlim)
+            ax.set_ylim(*ylim)
+        
+            ax = fig.add_subplot(nrows, ncols, 2)
+            lines = [ax.plot(*_grid_decimate(y_i[[1, 2]], _figure_pixels(fig),
+                                             [ylim, zlim]), c='navy')[0]
+                     for y_i in y]
+            ax.legend(lines[:1], ['Phase portrait $\Omega_y\Omega_z$'], loc='best',
+                      fontsize=_FONT_SIZE_PROJECTIONS)
+            ax.set_xlabel('$\Omega_y$')
+            ax.set_ylabel('$\Omega_z$')
+            ax.set_xlim(*ylim)
+            ax.set_ylim(*zlim)
+        
+            ax = fig.add_subplot(nrows, ncols, 3)
+            lines = [ax.plot(*_grid_decimate(y_i[[0, 2]], _figure_pixels(fig),
+                                             [xlim, zlim]), c='olive')[0]
+                     for y_i in y]
+            ax.legend(lines[:1], ['Phase portrait $\Omega_x\Omega_z$'], loc='best',
+                      fontsize=_FONT_SIZE_PROJECTIONS)
+            ax.set_xlabel('$\Omega_x$')
+            ax.set_ylabel('$\Omega_z$')
+            ax.set_xlim(*xlim)
+            ax.set_ylim(*zlim)
+        
+            _set_font_size(fig, _FONT_SIZE_PROJECTIONS)
+            fig.tight_layout()
+            _save_figure(fig, plots_basename, plot_query_value)
+    
+    return plot_query_values
+
+
+def _save_figure(fig: Figure, plots_basename: str,
+                 plot_query_value: str) -> None:
+    """Saves ``fig`` in all the sizes of
+    :class:`~simulation_api.controller.schemas.PlotSize`.
+
+    The scaled down versions are resized from the full size image (rendering
+    the figure again would be much slower) and written first, so that if the
+    full size plot exists all of them exist.
+
+    Parameters
+    ----------
+    fig : Figure
+        Figure to be saved.
+    plots_basename : str
+        Base name of the plot, see :func:`_plot_solution`.
+    plot_query_value : str
+        Plot query value of the plot.
+    """
+    buffer = BytesIO()
+    fig.savefig(buffer, format=PLOTS_FORMAT.lstrip("."))
+    image = Image.open(buffer)
+
+    for size, max_pixels in PLOTS_SIZES.items():
+        scaled_image = image.copy()
+        scaled_image.thumbnail((max_pixels, max_pixels), Image.LANCZOS)
+        scaled_buffer = BytesIO()
+        if _plot_format(size) == ".webp":
+            scaled_image.save(scaled_buffer, format="WEBP", quality=85)
+        else:
+            scaled_image.save(scaled_buffer, format="PNG", optimize=True)
+        _write_file(
+            _create_plot_path_disk(plots_basename, plot_query_value, size),
+            scaled_buffer.getvalue()
+        )
+
+    _write_file(_create_plot_path_disk(plots_basename, plot_query_value),
+                buffer.getvalue())
+
+
+def _set_font_size(fig: Figure, size: float) -> None:
+    """Sets the font size of the titles, axis labels and tick labels of
+    ``fig``. Per figure equivalent of ``matplotlib.rcParams['font.size']``
+    (titles are a bit larger), which is global and thus shared by all the
+    figures rendered by a process.
+
+    The layout of legends depends on their font size, so it must be given
+    when they are created (``ax.legend(..., fontsize=size)``)."""
+    for ax in fig.axes:
+        axes = [ax.xaxis, ax.yaxis]
+        if hasattr(ax, 'zaxis'):
+            axes.append(ax.zaxis)
+        for axis in axes:
+            axis.label.set_fontsize(size)
+            axis.get_offset_text().set_fontsize(size)
+            axis.set_tick_params(labelsize=size)
+        ax.title.set_fontsize(1.2 * size)
+
+
+def _create_plot_path_disk(sim_id: str, query_param: PlotQueryValues,
+                           size: str = PlotSize.full.value) -> str:
+    """Creates disk path to plots of simulation results by
+    :attr:`~simulation_api.controller.schemas.SimIdResponse.sim_id`, in
+    size ``size`` (a :class:`~simulation_api.controller.schemas.PlotSize`
+    value). Plots are sharded, see :mod:`simulation_api.model.storage`."""
+    suffix = "" if size == PlotSize.full.value else "_" + size
+    file_name = sim_id + "_" + query_param + suffix + _plot_format(size)
+    return _sharded_path(PATH_PLOTS, sim_id, file_name)
+
+
+def _plot_format(size: str = PlotSize.full.value) -> str:
+    """Image format (extension) of the plots of size ``size``."""
+    if size == PlotSize.full.value:
+        return PLOTS_FORMAT
+    if PLOTS_SCALED_FORMAT == ".webp" and not features.check("webp"):
+        return ".png"
+    return PLOTS_SCALED_FORMAT
@@ -58,7 +58,8 @@ class IntegrationMethods(str, Enum):
     Please update this class with relvant simulation methods available in 
     `scipy.integrate.solve_ivp`_ –only the ones that do not require more
     parameters than the ones provided in
-    :py:class:`SimRequest`.
+    :py:class:`SimRequest`– or in
+    :mod:`simulation_api.simulation.integrators`.
 
     .. _scipy.integrate.solve_ivp: https://docs.scipy.org/doc/scipy/reference/generated/scipy.integrate.solve_ivp.html
     """
@@ -66,6 +67,24 @@ class IntegrationMethods(str, Enum):
     """Explicit Runge-Kutta method of order 5(4)."""
     RK23 = "RK23"
     """Explicit Runge-Kutta method of order 3(2)."""
+    Radau = "Radau"
+    """Implicit Runge-Kutta method of the Radau IIA family of order 5."""
+    BDF = "BDF"
+    """Implicit multi-step variable-order (1 to 5) method based on a backward
+    differentiation formula."""
+    LSODA = "LSODA"
+    """Adams/BDF method with automatic stiffness detection and switching."""
+    RK4 = "RK4"
+    """Classic fixed step Runge-Kutta method of order 4."""
+    Leapfrog = "Leapfrog"
+    """Fixed step velocity Verlet (leapfrog) symplectic method of order 2.
+    Only available for Hamiltonian systems."""
+    Yoshida4 = "Yoshida4"
+    """Fixed step Yoshida symplectic method of order 4. Only available for
+    Hamiltonian systems."""
+    analytic = "analytic"
+    """Evaluation of the closed form solution. Only available for analytically
+    solvable systems."""
 
 
 # Needed to generate dict used to display available integration methods in frontend
@@ -81,6 +100,13 @@ class IntegrationMethodsFrontend(str, Enum):
     """
     RK45 = "Runge-Kutta 5(4)"
     RK23 = "Runge-Kutta 3(2)"
+    Radau = "Radau IIA 5 (implicit)"
+    BDF = "Backward Differentiation Formula (implicit)"
+    LSODA = "LSODA (Adams/BDF switching)"
+    RK4 = "Runge-Kutta 4 (fixed step)"
+    Leapfrog = "Velocity Verlet / Leapfrog (symplectic)"
+    Yoshida4 = "Yoshida 4 (symplectic)"
+    analytic = "Exact solution (closed form)"
 
 # Used in frontend and generated automatically from IntegrationMethodsFrontend
 integration_methods = {
@@ -286,12 +312,34 @@ appropiate schema given by
 
 ########################## Simulation Request schema ##########################
 
-class SimRequest(BaseModel):
+class SimRequestBase(BaseModel):
+    """Attributes shared by simulation requests (:py:class:`SimRequest`) and
+    parameter sweep requests (:py:class:`SweepRequest`), which differ in their
+    ``params``. Fields and validators of both are defined here, so that they
+    do not drift apart.
+
+    \f
+    For the attributes that do not have a description see
+    :py:class:`simulation_api.simulation.simulations.Simulation`.
+    """
+    system: SimSystem = SimSystem.HO
+    t_span: List[float] = []
+    t_eval: Optional[List[float]] = []
+    t_steps: Optional[int] = 0
+    ini_cndtn: Union[List[float], List[List[float]]] = []
+    """Initial condition of simulation. A list of initial conditions defines
+    an ensemble: all of its members are integrated in one single run."""
+    method: Optional[IntegrationMethods] = 'RK45'
+    username: str = "Pepito Perez"
+
+
+class SimRequest(SimRequestBase):
     """Schema needed to request simulations via POST in
     ``/api/request/{sim_system}``.
     
     \f
     For the attributes that do not have a description see
+    :py:class:`SimRequestBase` and
     :py:class:`simulation_api.simulation.simulations.Simulation`.
     
     Note
@@ -300,13 +348,7 @@ class SimRequest(BaseModel):
     classes defined in the module :mod:`simulation_api.simulation.simulations`,
     for more information please refer to It.
     """
-    system: SimSystem = SimSystem.HO
-    t_span: List[float] = []
-    t_eval: Optional[List[float]] = []
-    t_steps: Optional[int] = 0
-    ini_cndtn: List[float] = []
     params: Dict[str, float]
-    method: Optional[IntegrationMethods] = 'RK45'
     # The backend will assign a sim_id, so it is not necessary to provide one.
     sim_id: Optional[str] = None
     """ID of simulation. This is handled internally, leave it blank when
@@ -316,12 +358,28 @@ class SimRequest(BaseModel):
     user_id: Optional[int] = 0
     """User id number stored in database. This is handled internally, leave it
     blank when requesting a simulation."""
-    username: str = "Pepito Perez"
 
 
 
 ### Simulation ID response schema when simulation is requested in frontend. ###
 
+class CostEstimate(BaseModel):
+    """Estimated cost of a simulation, see
+    :func:`~simulation_api.controller.cost._estimate_cost`."""
+    runtime: float
+    """Estimated runtime (seconds)."""
+    memory: int
+    """Estimated peak memory (bytes)."""
+    nfev: int
+    """Estimated number of evaluations of the right hand side of the system."""
+    n_points: int
+    """Number of points where the solution is stored (per member of the
+    ensemble)."""
+    downgraded: bool = False
+    """Tells if the number of points of the solution was reduced to fit in the
+    quotas."""
+
+
 class SimIdResponse(BaseModel):
     """Schema for the response of a simulation request (requested via POST in
     route ``/api/simulate/{sim_sys}``.)
@@ -343,6 +401,47 @@ class SimIdResponse(BaseModel):
     """Path to GET the status of the simulation."""
     sim_pickle_path: Optional[str]
     """Path to GET (download) a pickle with the results of the simulation."""
+    cost_estimate: Optional[CostEstimate]
+    """Estimated cost of the simulation."""
+    message: Optional[str]
+    """Explanatory message."""
+
+
+
+############################ Parameter Sweep schemas ##########################
+
+class SweepRequest(SimRequestBase):
+    """Schema needed to request parameter sweeps via POST in
+    ``/api/sweep/{sim_system}``.
+
+    A sweep runs one simulation for each point (set of parameters) in
+    :attr:`params`. All the other attributes (see :py:class:`SimRequestBase`)
+    are shared by every simulation of the sweep and have the same meaning as in
+    :py:class:`SimRequest`.
+    """
+    params: Union[Dict[str, List[float]], List[Dict[str, float]]]
+    """Points of the sweep. Either a ``dict`` mapping each parameter name to a
+    list of values –the points are all the combinations of these values (a
+    grid)– or a list of ``dict`` with the parameters of each point."""
+
+
+class SweepIdResponse(BaseModel):
+    """Schema for the response of a parameter sweep request (requested via
+    POST in route ``/api/sweep/{sim_sys}``.)
+    """
+    sweep_id: Optional[str]
+    """ID of the sweep."""
+    user_id: Optional[int]
+    """User id number stored in database."""
+    username: Optional[str]
+    sim_sys: Optional[SimSystem]
+    """Simulated system."""
+    n_points: Optional[int]
+    """Number of points (simulations) in the sweep."""
+    sim_ids: Optional[List[str]]
+    """ID of the simulation of each point, in the same order as the points."""
+    sweep_status_path: Optional[str]
+    """Path to GET the status of the sweep."""
     message: Optional[str]
     """Explanatory message."""
 
@@ -394,6 +493,31 @@ PlotQueryValues = Union[
 This is needed in :py:class:`~simualtion_API.controller.schemas.SimStatus`."""
 
 
+# NOTE Needs update each time a new system is added
+SimSystem_to_PlotQueryValues = {
+    SimSystem.HO.value: [PlotQueryValues_HO.phase.value,
+                         PlotQueryValues_HO.coord.value],
+    SimSystem.ChenLee.value: [PlotQueryValues_ChenLee.threeD.value,
+                              PlotQueryValues_ChenLee.project.value],
+}
+"""Maps the name of each available system to the plot query values of its
+plots, in the order they are shown. Plots are rendered on demand, so these are
+known before rendering them."""
+
+
+class PlotSize(str, Enum):
+    """Sizes in which each plot is available.
+
+    These are the possible values of the query param ``size`` in route
+    ``/api/results/{sim_id}/plot?value=<plot_query_value>&size=<size>``.
+    ``full`` is the plot as rendered, ``medium`` and ``thumb`` are scaled down
+    versions of it, see :data:`~simulation_api.config.PLOTS_SIZES`.
+    """
+    thumb = "thumb"
+    medium = "medium"
+    full = "full"
+
+
 
 ######################### Simulation Results Schemas ##########################
 
@@ -402,9 +526,103 @@ class SimResults(BaseModel):
     sim_results: OdeResult
 
 
+# NOTE Needs update each time a new system is added
+SimSystem_to_components = {
+    SimSystem.HO.value: ["q", "p"],
+    SimSystem.ChenLee.value: ["Omega_x", "Omega_y", "Omega_z"],
+}
+"""Maps the name of each available system to the names of the components of
+its state (rows of the solution ``y``)."""
+
+
+class SeriesFormat(str, Enum):
+    """Encodings of the trajectories served in routes
+    ``/api/results/{sim_id}/series`` and ``/api/results/{sim_id}/data``.
+
+    ``json`` is :class:`SimSeries` (:class:`SimData`). ``binary`` is a
+    little-endian ``uint32`` with the length of a JSON header (the fields of
+    the schema but ``t`` and ``y``, plus the ``shape`` and ``dtype`` of ``y``),
+    the header (padded with spaces, so that the arrays start at a multiple of
+    8 bytes) and ``t`` and ``y`` (C order) as little-endian arrays of type
+    ``dtype``: ``float32`` for ``/series``, ``float64`` (the precision of the
+    stored solution) for ``/data``.
+    """
+    json = "json"
+    binary = "binary"
+
+
+class SimSeries(BaseModel):
+    """Trajectories of a simulation decimated to a budget of points. This
+    information can be accessed via GET in ``/api/results/{sim_id}/series``.
+    """
+    sim_id: str
+    """ID of simulation."""
+    system: SimSystem
+    """Simulated system."""
+    components: List[str]
+    """Names of the components of the state, see
+    :data:`SimSystem_to_components`."""
+    n_points: int
+    """Number of points of the stored solution (before decimation)."""
+    t: List[float]
+    """Times of the points served."""
+    y: Union[List[List[float]], List[List[List[float]]]]
+    """Trajectories at times ``t``, shape ``(n, len(t))`` or
+    ``(M, n, len(t))`` for ensembles of ``M`` initial conditions."""
+
+
+class SimData(BaseModel):
+    """Window of the stored trajectories of a simulation. This information can
+    be accessed via GET in ``/api/results/{sim_id}/data``.
+    """
+    sim_id: str
+    """ID of simulation."""
+    system: SimSystem
+    """Simulated system."""
+    components: List[str]
+    """Names of the components served (rows of ``y``), see
+    :data:`SimSystem_to_components`."""
+    n_points: int
+    """Number of points of the stored solution."""
+    start: int
+    """Index (in the stored solution) of the first point served."""
+    stride: int
+    """Every ``stride``-th point of the window is served."""
+    t: List[float]
+    """Times of the points served."""
+    y: Union[List[List[float]], List[List[List[float]]]]
+    """Trajectories at times ``t``, shape ``(len(components), len(t))`` or
+    ``(M, len(components), len(t))`` for ensembles of ``M`` initial
+    conditions."""
+
+
 
 ########################### Simulation Status Schema ##########################
 
+class JobState(str, Enum):
+    """States of a simulation in the queue of jobs (``jobs`` table in
+    ``simulations.db`` database)."""
+    queued = "queued"
+    running = "running"
+    done = "done"
+    cancelled = "cancelled"
+
+
+class SimProgress(BaseModel):
+    """Progress of a running simulation."""
+    fraction: float
+    """Fraction of ``t_span`` already integrated (between 0 and 1)."""
+    elapsed: float
+    """Wall time (seconds) since the integration started."""
+    nfev: int
+    """Evaluations of the right hand side of the system so far."""
+    eta: Optional[float]
+    """Estimated time (seconds) until the integration finishes. Plotting and
+    storing the results is not included."""
+    updated: datetime
+    """Date of the last update of the progress."""
+
+
 class SimStatus(BaseModel):
     """Schema of the status of simulations.
 
@@ -423,7 +641,7 @@ class SimStatus(BaseModel):
     # Simulation-related attributes
     system: Optional[SimSystem]
     """Simulated system."""
-    ini_cndtn: Optional[List[float]]
+    ini_cndtn: Optional[Union[List[float], List[List[float]]]]
     params: Optional[Dict[str, float]]
     method: Optional[IntegrationMethods]
 
@@ -445,6 +663,62 @@ class SimStatus(BaseModel):
     message : Optional[str]
     """Additional information on status of simulation."""
 
+    # Job-related attributes
+    job_state: Optional[JobState]
+    """State of the simulation in the queue of jobs."""
+    submitted: Optional[datetime]
+    """Date at which the simulation was queued."""
+    started: Optional[datetime]
+    """Date at which the simulation started running."""
+    finished: Optional[datetime]
+    """Date at which the simulation finished."""
+    progress: Optional[SimProgress]
+    """Progress of the integration, published periodically while the
+    simulation runs."""
+
+
+class SimEventType(str, Enum):
+    """Types of events of a simulation, pushed to clients in
+    ``/api/simulate/events/{sim_id}`` and
+    ``/api/simulate/events/user/{username}``."""
+    queued = "queued"
+    started = "started"
+    progress = "progress"
+    rendering = "rendering"
+    done = "done"
+    cancelled = "cancelled"
+
+
+class SimEvent(BaseModel):
+    """Schema of the events of simulations."""
+    sim_id: str
+    """ID of simulation."""
+    username: str
+    """Username of the owner of the simulation."""
+    event: SimEventType
+    """Type of event."""
+    date: datetime
+    """Date of the event."""
+    progress: Optional[SimProgress]
+    """Progress of the integration (``progress`` events)."""
+    success: Optional[bool]
+    """Success status of simulation (``done`` events)."""
+
+
+class SweepStatus(BaseModel):
+    """Schema of the status of parameter sweeps. This information can be
+    accessed via GET in ``/api/sweep/status/{sweep_id}``.
+    """
+    sweep_id: str
+    """ID of the sweep."""
+    n_points: int
+    """Number of points (simulations) in the sweep."""
+    n_finished: int
+    """Number of simulations of the sweep that already finished."""
+    n_success: int
+    """Number of simulations of the sweep that finished successfully."""
+    simulations: List[SimStatus]
+    """Status of each simulation, in the same order as the points."""
 
 
 
@@ -565,6 +839,127 @@ class PlotDBSchCreate(PlotDBSchBase):
     plot_query_value: str
 
 
+############################ Jobs ############################
+class JobDBSchBase(BaseModel):
+    """Basemodel for API type checking when querrying ``jobs`` table in
+    ``simulations.db`` database.
+    """
+    sim_id: Optional[str]
+    user_id: Optional[int]
+    username: Optional[str]
+    system: Optional[str]
+    method: Optional[str]
+    state: Optional[JobState]
+    request: Optional[str]
+    submitted: Optional[float]
+    started: Optional[float]
+    finished: Optional[float]
+
+
+class JobDBSchCreate(JobDBSchBase):
+    """Model for API type checking when creating a row in ``jobs`` table in
+    ``simulations.db`` database.
+    """
+    sim_id: str
+    user_id: int
+    username: str
+    system: str
+    state: JobState = JobState.queued
+    request: str
+    submitted: float
+
+
+############################ Job progress ############################
+class JobProgressDBSchBase(BaseModel):
+    """Basemodel for API type checking when querrying ``job_progress`` table
+    in ``simulations.db`` database.
+    """
+    sim_id: Optional[str]
+    fraction: Optional[float]
+    elapsed: Optional[float]
+    nfev: Optional[int]
+    eta: Optional[float]
+    updated: Optional[float]
+
+
+class JobProgressDBSchCreate(JobProgressDBSchBase):
+    """Model for API type checking when creating (or updating) a row in
+    ``job_progress`` table in ``simulations.db`` database.
+    """
+    sim_id: str
+    fraction: float
+    elapsed: float
+    nfev: int
+    updated: float
+
+
+############################ Cost statistics ############################
+class CostStatsDBSchBase(BaseModel):
+    """Basemodel for API type checking when querrying ``cost_stats`` table in
+    ``simulations.db`` database.
+    """
+    system: Optional[str]
+    method: Optional[str]
+    n_samples: Optional[int]
+    nfev_per_time: Optional[float]
+    seconds_per_fev: Optional[float]
+    seconds_per_sample: Optional[float]
+
+
+class CostStatsDBSchCreate(CostStatsDBSchBase):
+    """Model for API type checking when creating (or updating) a row in
+    ``cost_stats`` table in ``simulations.db`` database.
+    """
+    system: str
+    method: str
+    n_samples: int
+    nfev_per_time: float
+    seconds_per_fev: float
+    seconds_per_sample: float
+
+
+############################ Sweeps ############################
+class SweepDBSchBase(BaseModel):
+    """Basemodel for API type checking when querrying ``sweeps`` table in
+    ``simulations.db`` database.
+    """
+    sweep_id: Optional[str]
+    sim_id: Optional[str]
+    point_id: Optional[int]
+
+
+class SweepDBSchCreate(SweepDBSchBase):
+    """Model for API type checking when creating a row in ``sweeps`` table in
+    ``simulations.db`` database.
+    """
+    sweep_id: str
+    sim_id: str
+    point_id: int
+
+
+############################ Result cache ############################
+class ResultCacheDBSchBase(BaseModel):
+    """Basemodel for API type checking when querrying ``result_cache`` table in
+    ``simulations.db`` database.
+    """
+    request_hash: Optional[str]
+    sim_id: Optional[str]
+    created: Optional[float]
+    last_used: Optional[float]
+    hits: Optional[int]
+
+
+class ResultCacheDBSchCreate(ResultCacheDBSchBase):
+    """Model for API type checking when creating a row in ``result_cache``
+    table in ``simulations.db`` database.
+    """
+    request_hash: str
+    sim_id: str
+    created: float
+    last_used: float
+    hits: int = 0
+
+
 ############################ Parameters ############################
 class ParamType(str, Enum):
     """These are the possible values of ``param_type`` column in ``parameters``
@@ -630,3 +1025,31 @@ sim_status_finished_message = "Finished. You can request via GET: download " \
                               "query params the ones given in " \
                               "'plot_query_values', or; see results online " \
                               "in route 'route_results'."
+sweep_requested_message = "Your sweep was requested. Request via GET the " \
+                          "status of the sweep in route " \
+                          "'sweep_status_path'. The simulation of each " \
+                          "point can be followed individually by its sim_id."
+sweep_not_found_message = "The sweep ID (sweep_id) you provided is not in " \
+                          "our database."
+sim_cached_message = "An identical simulation was already computed, your " \
+                     "results are available right away: request via GET " \
+                     "your simulation's status in route 'sim_status_path' " \
+                     "or download your results (pickle format) via GET in " \
+                     "route 'sim_pickle_path'."
+sim_queued_message = "Your simulation is queued, it will start as soon as " \
+                     "a worker is available. Please come back later."
+sim_running_message = "Your simulation is running. Please come back later."
+sim_cancelled_message = "The simulation was cancelled by the user."
+sim_cancelling_message = "Your simulation was cancelled, it will stop " \
+                         "shortly."
+sim_cancel_finished_message = " The simulation had already finished, it " \
+                              "could not be cancelled."
+series_not_found_message = "There are no results for the simulation ID " \
+                           "(sim_id) you provided. Either it is not in our " \
+                           "database, it has not finished or it failed."
+data_window_message = "Invalid window: 't0' must not be greater than 't1'."
+data_components_message = "Invalid components, the components of the " \
+                          "system are: "
+sim_downgraded_message = " The number of points of the solution was " \
+                         "reduced to fit in our quotas, see " \
+                         "'cost_estimate'."
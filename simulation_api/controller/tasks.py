@@ -1,56 +1,94 @@
 """This file will do background tasks e.g. the simulation"""
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Union, Callable, Tuple, Dict
+from concurrent.futures import Future
 from datetime import datetime
 from uuid import uuid4
-
-# Needed to simulate in backgroung
-from fastapi import BackgroundTasks, HTTPException
+from itertools import product
+from collections import Counter
+from hashlib import sha256
+import json
+import os
+import time
+import math
+import threading
+
+from fastapi import HTTPException
 # Database-related
 from sqlalchemy.orm import Session
-import matplotlib as mpl
-from matplotlib.figure import Figure
-from mpl_toolkits.mplot3d import Axes3D
-# import matplotlib.pyplot as plt
-import pickle as pkl
-from numpy import linspace, abs
+from numpy import linspace, asarray, ndarray, searchsorted
 
 from simulation_api import app
 # Import pydantic schemas
 from .schemas import *
 # Import paths to save plots and pickles
-from simulation_api.config import PATH_PLOTS, PATH_PICKLES, PLOTS_FORMAT
+from simulation_api.config import (SWEEP_MAX_POINTS,
+                                   RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL,
+                                   MAX_PENDING_JOBS, MAX_PENDING_JOBS_PER_USER,
+                                   RETRY_AFTER_WINDOW, RETRY_AFTER_DEFAULT,
+                                   CANCEL_CHECK_INTERVAL, PROGRESS_INTERVAL,
+                                   PLOTS_EAGER, MAX_JOB_ATTEMPTS)
 # Import simulation module
-from simulation_api.simulation.simulations import Simulations
+from simulation_api.simulation.simulations import (Simulations,
+                                                   SimulationCancelled)
 # Database-related
 from simulation_api.model.db_manager import SessionLocal
-from simulation_api.model import crud
-
-# Next line of code avoids a warning when generating matplotlib figures: 
-# `UserWarning: Starting a Matplotlib GUI outside of the main thread will likely
-# fail.`
+from simulation_api.model import crud, models
+from simulation_api.model.results import (_save_results, _load_results,
+                                          _load_pyramid, _results_exist,
+                                          _link_results)
+from simulation_api.model.storage import _link_file, _collect_garbage
+# Pool of processes that runs the simulations
+from .workers import _submit
+# Events of the simulations pushed to clients
+from .events import _publish_event
+# Cost model of the simulations
+from .cost import _check_cost, _record_cost, _load_cost_stats
+# Rendering of the plots of the simulations
+from .rendering import _plot_solution, _create_plot_path_disk
+# Decimation of the trajectories served for interactive plots
+from .decimation import _pyramid_indices
+
+class QueueFullError(Exception):
+    """Raised when a simulation request is not admitted because there are too
+    many pending (queued or running) simulations. See :func:`_check_admission`.
 
-# Found the solution in this post: 
-# https://stackoverflow.com/questions/50157759/runtimeerror-main-thread-is-not-in-main-loop-using-matplotlib-with-django
-# The latter cites this matplotlib documentation:
-# https://matplotlib.org/faq/howto_faq.html#matplotlib-in-a-web-application-server
-
-# From last link: 'You may be able to work on separate figures from separate
-# threads. However, you must in that case use a non-interactive backend
-# (typically Agg), because most GUI backends require being run from the main
-# thread as well.'
+    Parameters
+    ----------
+    status_code : int
+        503 if the global limit was reached, 429 if the limit of the user was
+        reached, 413 if the request alone exceeds one of the limits.
+    retry_after : int or None
+        Seconds after which the client should try again, ``None`` if retrying
+        will never succeed (status code 413).
+    message : str
+        Explanation for the client.
+    """
+    def __init__(self, status_code: int, retry_after: Optional[int],
+                 message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.message = message
 
-# And also: 'In general, the simplest solution when using
-# Matplotlib in a web server is to completely avoid using pyplot.'
 
-# Next line of code is only needed if using pyplot (which is not recommended)
+# Plots being rendered, by simulation ID and plot query value. See
+# _submit_render
+_renders: Dict[Tuple[str, str], Future] = {}
+_renders_lock = threading.Lock()
 
-# mpl.use('Agg')
 
 def _api_simulation_request(sim_system: SimSystem,
                             sim_params: SimRequest,
-                            background_tasks: BackgroundTasks,
                             db: Session) -> SimIdResponse:
-    """Requests simulation to BackgroundTasks.
+    """Requests simulation to the pool of workers (see
+    :mod:`~simulation_api.controller.workers`).
+
+    If an identical simulation was already computed (see
+    :func:`_get_cached_simulation`) the results are reused and nothing is
+    simulated. Otherwise, the request must be admitted in the queue of jobs
+    (see :func:`_check_admission`). Before that, requests whose estimated cost
+    is over quota are downgraded or rejected (see
+    :func:`~simulation_api.controller.cost._check_cost`).
 
     Parameters
     ----------
@@ -58,8 +96,6 @@ def _api_simulation_request(sim_system: SimSystem,
         System to be simulated.
     sim_params : SimRequest
         Contains all the information about the simulation request.
-    background_tasks : ``fastapi.BackgroundTasks``
-        Object needed to request simulation in the background.
     db : ``sqlalchemy.orm.Session``
         Needed for interaction with database.
     
@@ -70,34 +106,54 @@ def _api_simulation_request(sim_system: SimSystem,
         and others. See
         :class:`~simulation_api.controller.schemas.SimIdResponse` for more
         information.
+
+    Raises
+    ------
+    HTTPException
+        With status code 403 if ``sim_system`` is not the system of
+        ``sim_params``.
+    QueueFullError
+        If the request is not cached and it is not admitted in the queue.
     """
     
+    # Check that the client is accessing the right path for the right simulation
+    # sim_system.value NEEDS to match the request given in JSON as
+    # sim_params.system. This is checked before anything else (cost,
+    # admission, database), so that a forbidden request has no effect
+    if not sim_system.value == sim_params.system.value:
+        raise HTTPException(
+            status_code=403,
+            detail=r"403 - Forbidden : URI's {sim_system} value must coincide "
+                   r"with 'system' key value in posted JSON file"
+        )
+
     ########################## Check for some errors ##########################
-    # Check that the simulation parameters are the ones needed for the
-    # requested simulation. This is not checked by the pydantic model.
-    error_message = ""
-    try:
-        ParamsModel = SimSystem_to_SimParams[sim_system.value]
-        ParamsModel(**sim_params.params)
-    except:
-        error_message = "Error: you provided the wrong set of parameters. " \
-                        "Your simulation was not requested."
+    error_message = _check_sim_request(sim_system, sim_params)
 
-    # Check Chen-Lee parameters
-    if sim_system.value == SimSystem.ChenLee.value and not error_message:
-        params = sim_params.params
-        if not _check_chen_lee_params(params["a"], params["b"], params["c"]):
-            error_message = "Chen-Lee parameters must satisfy a > 0, and " \
-                            "b < 0, and c < 0 and a < -(b + c)"
+    if error_message:
+        sim_id_response = SimIdResponse(
+            username=sim_params.username,
+            message=error_message
+        )
+        return sim_id_response
+
+    # Requests over quota are downgraded (sim_params is modified) or rejected
+    cost_estimate, error_message = _check_cost(db, sim_params)
 
     if error_message:
         sim_id_response = SimIdResponse(
             username=sim_params.username,
+            cost_estimate=cost_estimate,
             message=error_message
         )
         return sim_id_response
     ############################## End of check ###############################
 
+    # Identical simulations are reused, the rest must be admitted in the queue
+    cached_sim_id = _get_cached_simulation(db, _sim_request_hash(sim_params))
+    if not cached_sim_id:
+        _check_admission(db, sim_params.username)
+
     # Create user in database (meanwhile)
     # FIXME FIXME FIXME
     # In production user can NOT be created here, login will be required.
@@ -109,24 +165,37 @@ def _api_simulation_request(sim_system: SimSystem,
     # Create an id for the simulation store it in hex notation
     sim_params.sim_id = uuid4().hex
 
+    # Reuse the results of an identical simulation if there is one, otherwise
+    # simulate system in a worker. Clients can follow it in
+    # /api/simulate/events/{sim_id}
+    if cached_sim_id:
+        _copy_cached_simulation(db, cached_sim_id, sim_params)
+    else:
+        _queue_simulations(db, [sim_params])
+
     # Close ccurrent db connection, so that _run_simulation can update table
     db.close()
 
-    # Check that the client is accessing the right path for the right simulation
-    # sim_system.value NEEDS to match the request given in JSON as
-    # sim_params.system
-    if not sim_system.value == sim_params.system.value:
-        raise HTTPException(
-            status_code=403,
-            detail=r"403 - Forbidden : URI's {sim_system} value must coincide "
-                   r"with 'system' key value in posted JSON file"
-        )
+    return _sim_id_response(sim_params, cost_estimate, bool(cached_sim_id))
+
 
-    # Simulate system in BACKGROUND
-    # TODO TODO TODO Por dentro _run_simulation puede abrir un websocket para
-    # TODO TODO TODO indicar que la simulación ya se completó
-    background_tasks.add_task(_run_simulation, sim_params)
+def _sim_id_response(sim_params: SimRequest, cost_estimate: CostEstimate,
+                     cached: bool) -> SimIdResponse:
+    """Builds the response of an accepted simulation request.
+
+    Parameters
+    ----------
+    sim_params : SimRequest
+        Simulation request, with ``sim_id`` and ``user_id``.
+    cost_estimate : CostEstimate
+        Estimated cost of the simulation.
+    cached : bool
+        Tells if the results of an identical simulation were reused.
 
+    Returns
+    -------
+    SimIdResponse
+    """
     # Declare some variables needed as params to SimIdResponse
     sim_status_path = app.url_path_for("api_simulate_status",
                                        sim_id=sim_params.sim_id)
@@ -139,6 +208,9 @@ def _api_simulation_request(sim_system: SimSystem,
                "(pickle fomat) via GET in route 'sim_pickle_path'"
     message2 = na_message
     message = message1 if sim_params.system in SimSystem else message2
+    message = sim_cached_message if cached else message
+    if cost_estimate.downgraded:
+        message += sim_downgraded_message
 
     sim_id_response = SimIdResponse(
         sim_id=sim_params.sim_id,
@@ -147,20 +219,608 @@ def _api_simulation_request(sim_system: SimSystem,
         sim_sys=sim_params.system,
         sim_status_path=sim_status_path,
         sim_pickle_path=sim_pickle_path,
+        cost_estimate=cost_estimate,
         message=message
     )
 
     return sim_id_response
 
 
+def _check_sim_request(sim_system: SimSystem, sim_params: SimRequest) -> str:
+    """Checks the parameters, initial conditions and integration method of a
+    simulation request.
+
+    These checks are not done by the pydantic model
+    :class:`~simulation_api.controller.schemas.SimRequest`.
+
+    Parameters
+    ----------
+    sim_system : SimSystem
+        System to be simulated.
+    sim_params : SimRequest
+        Contains all the information about the simulation request.
+
+    Returns
+    -------
+    error_message : str
+        Explanation of the error found in the request. Empty string if the
+        request is OK.
+    """
+    # Check that the simulation parameters are the ones needed for the
+    # requested simulation. This is not checked by the pydantic model.
+    params = sim_params.params
+    error_message = ""
+    try:
+        ParamsModel = SimSystem_to_SimParams[sim_system.value]
+        ParamsModel(**params)
+    except:
+        error_message = "Error: you provided the wrong set of parameters. " \
+                        "Your simulation was not requested."
+
+    # Check that the initial condition –or each initial condition of the
+    # ensemble– has as many components as the phase space of the system.
+    if not error_message:
+        if not _check_ini_cndtn(sim_system, sim_params.ini_cndtn):
+            dim = Simulations[sim_system.value].dim
+            error_message = f"Error: each initial condition of " \
+                            f"{sim_system.value} must have {dim} components. " \
+                            f"Your simulation was not requested."
+
+    # Check Chen-Lee parameters
+    if sim_system.value == SimSystem.ChenLee.value and not error_message:
+        if not _check_chen_lee_params(params["a"], params["b"], params["c"]):
+            error_message = "Chen-Lee parameters must satisfy a > 0, and " \
+                            "b < 0, and c < 0 and a < -(b + c)"
+
+    # Check the integration method is available for the system. Fixed step
+    # methods need the times at which the solution is stored.
+    LocalSimulation = Simulations[sim_system.value]
+    method = IntegrationMethods(sim_params.method).value
+    if not error_message:
+        if method not in _integration_methods(sim_system):
+            error_message = f"Error: {method} integration method is not " \
+                            f"available for {sim_system.value}."
+        elif method in LocalSimulation.fixed_step_methods and \
+                not (sim_params.t_steps or sim_params.t_eval):
+            error_message = f"Error: {method} is a fixed step integration " \
+                            f"method, you must provide t_steps or t_eval."
+        elif method == IntegrationMethods.analytic.value and \
+                not (sim_params.t_steps or sim_params.t_eval):
+            error_message = "Error: the analytic method evaluates the " \
+                            "solution at t_eval, you must provide t_steps " \
+                            "or t_eval."
+        elif method == IntegrationMethods.analytic.value and \
+                sim_system.value == SimSystem.HO.value and \
+                not (params["k"] > 0 and params["m"] > 0):
+            # The closed form solution is oscillatory, it divides by
+            # sqrt(k / m)
+            error_message = "Error: the analytic method of " \
+                            f"{sim_system.value} needs k > 0 and m > 0."
+
+    return error_message
+
+
+def _integration_methods(sim_system: SimSystem) -> Dict[str, str]:
+    """Integration methods available for ``sim_system``.
+
+    Symplectic methods are only available for Hamiltonian systems (see
+    :attr:`~simulation_api.simulation.simulations.Simulation.hamiltonian`) and
+    the analytic method for solvable systems (see
+    :attr:`~simulation_api.simulation.simulations.Simulation.solvable`).
+
+    Parameters
+    ----------
+    sim_system : SimSystem
+        System to be simulated.
+
+    Returns
+    -------
+    Dict[str, str]
+        Same as :data:`~simulation_api.controller.schemas.integration_methods`
+        but only with the methods available for ``sim_system``.
+    """
+    LocalSimulation = Simulations[sim_system.value]
+    return {
+        method: caption for method, caption in integration_methods.items()
+        if (LocalSimulation.hamiltonian
+            or method not in LocalSimulation.symplectic_methods)
+        and (LocalSimulation.solvable
+             or method != IntegrationMethods.analytic.value)
+    }
+
+
+def _api_batch_request(sim_requests: List[SimRequest],
+                       db: Session) -> List[SimIdResponse]:
+    """Requests several simulations (of any system) at once.
+
+    Each request is checked and handled as in :func:`_api_simulation_request`,
+    but the bookkeeping is shared: users (one per username), simulations
+    reused from the cache and jobs are all stored in a single transaction,
+    and identical requests in the batch are looked up once in the cache.
+
+    Parameters
+    ----------
+    sim_requests : List[SimRequest]
+        Simulation requests.
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+
+    Returns
+    -------
+    List[SimIdResponse]
+        Response to each request, in the same order. Rejected requests have
+        no ``sim_id`` and their ``message`` explains the error.
+
+    Raises
+    ------
+    QueueFullError
+        If the requests that are not cached are not admitted in the queue, in
+        which case none of the requests is accepted.
+    """
+    responses: List[Optional[SimIdResponse]] = [None] * len(sim_requests)
+
+    ########################## Check for some errors ##########################
+    # accepted: index, request, cost estimate and request hash. The cost
+    # statistics are read once for the whole batch
+    cost_stats = _load_cost_stats(db)
+    accepted = []
+    for i, sim_request in enumerate(sim_requests):
+        cost_estimate = None
+        error_message = _check_sim_request(sim_request.system, sim_request)
+        if not error_message:
+            cost_estimate, error_message = _check_cost(db, sim_request,
+                                                       cost_stats)
+        if error_message:
+            responses[i] = SimIdResponse(username=sim_request.username,
+                                         cost_estimate=cost_estimate,
+                                         message=error_message)
+            continue
+        accepted.append((i, sim_request, cost_estimate,
+                         _sim_request_hash(sim_request)))
+    ############################## End of check ###############################
+
+    # Identical simulations are reused, the rest must be admitted in the queue
+    cached_sim_ids = {}
+    for _, _, _, request_hash in accepted:
+        if request_hash not in cached_sim_ids:
+            cached_sim_ids[request_hash] = \
+                _get_cached_simulation(db, request_hash)
+
+    n_jobs = Counter(sim_request.username
+                     for _, sim_request, _, request_hash in accepted
+                     if not cached_sim_ids[request_hash])
+    for username, n_user_jobs in n_jobs.items():
+        _check_admission(db, username, n_user_jobs, sum(n_jobs.values()))
+
+    # Create users in database (meanwhile), one for each username
+    # FIXME In production user can NOT be created here, login will be required.
+    user_ids = {}
+    for _, sim_request, _, _ in accepted:
+        if sim_request.username not in user_ids:
+            user = UserDBSchCreate(username=sim_request.username)
+            user = crud._create_user(db, user, commit=False)
+            user_ids[sim_request.username] = user.user_id
+
+    queued, copied = [], []
+    for i, sim_request, cost_estimate, request_hash in accepted:
+        sim_request.sim_id = uuid4().hex
+        sim_request.user_id = user_ids[sim_request.username]
+        cached_sim_id = cached_sim_ids[request_hash]
+        if cached_sim_id:
+            _copy_cached_simulation(db, cached_sim_id, sim_request,
+                                    commit=False)
+            copied.append((cached_sim_id, sim_request.sim_id))
+        else:
+            queued.append(sim_request)
+        responses[i] = _sim_id_response(sim_request, cost_estimate,
+                                        bool(cached_sim_id))
+
+    # Storing the jobs commits the whole batch
+    if queued:
+        _queue_simulations(db, queued)
+    else:
+        db.commit()
+
+    # The files of the reused simulations are linked once the batch is stored
+    plot_query_values = {
+        cached_sim_id: crud._get_plot_query_values(db, cached_sim_id)
+        for cached_sim_id in set(cached_sim_ids.values()) if cached_sim_id
+    }
+    db.close()
+    for cached_sim_id, sim_id in copied:
+        _link_cached_simulation(cached_sim_id, sim_id,
+                                plot_query_values[cached_sim_id])
+
+    return responses
+
+
+def _api_sweep_request(sim_system: SimSystem, sweep_params: SweepRequest,
+                       db: Session) -> SweepIdResponse:
+    """Requests a parameter sweep: one simulation for each point in
+    ``sweep_params.params``.
+
+    The simulations are run by :func:`_run_simulation` in the pool of workers
+    (see :mod:`~simulation_api.controller.workers`) so that they can use all
+    the cores of the machine.
+
+    Parameters
+    ----------
+    sim_system : SimSystem
+        System to be simulated.
+    sweep_params : SweepRequest
+        Contains all the information about the sweep request.
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+
+    Returns
+    -------
+    sweep_id_response : SweepIdResponse
+        Contains the sweep ID and the simulation ID of each point of the sweep.
+    """
+    # Check that the client is accessing the right path for the right simulation
+    if not sim_system.value == sweep_params.system.value:
+        raise HTTPException(
+            status_code=403,
+            detail=r"403 - Forbidden : URI's {sim_system} value must coincide "
+                   r"with 'system' key value in posted JSON file"
+        )
+
+    # One simulation request for each point of the sweep
+    points = _sweep_points(sweep_params.params)
+    # The rest of the attributes (see SimRequestBase) are shared by all of them
+    shared = sweep_params.dict(exclude={"params"})
+    sim_requests = [SimRequest(**shared, params=point) for point in points]
+
+    ########################## Check for some errors ##########################
+    error_message = ""
+    if not points:
+        error_message = "Error: the sweep has no points."
+    elif len(points) > SWEEP_MAX_POINTS:
+        error_message = f"Error: maximum number of points in a sweep is " \
+                        f"{SWEEP_MAX_POINTS}, your sweep has {len(points)}."
+
+    for sim_request in sim_requests:
+        if error_message:
+            break
+        error_message = _check_sim_request(sim_system, sim_request)
+        if not error_message:
+            _, error_message = _check_cost(db, sim_request)
+
+    if error_message:
+        return SweepIdResponse(username=sweep_params.username,
+                               message=error_message)
+    ############################## End of check ###############################
+
+    _check_admission(db, sweep_params.username, len(sim_requests))
+
+    # Create user in database (meanwhile)
+    # FIXME In production user can NOT be created here, login will be required.
+    user = UserDBSchCreate(username=sweep_params.username)
+    user = crud._create_user(db, user)
+    user_id = user.user_id
+
+    sweep_id = uuid4().hex
+    for sim_request in sim_requests:
+        sim_request.sim_id = uuid4().hex
+        sim_request.user_id = user_id
+
+    # Store the sweep in database, all its simulations land under sweep_id
+    sweep_rows = [
+        SweepDBSchCreate(sweep_id=sweep_id, sim_id=sim_request.sim_id,
+                         point_id=i)
+        for i, sim_request in enumerate(sim_requests)
+    ]
+    crud._create_sweep(db, sweep_rows)
+
+    # Fan out the simulations over the pool of workers
+    _queue_simulations(db, sim_requests)
+    db.close()
+
+    sweep_status_path = app.url_path_for("api_sweep_status", sweep_id=sweep_id)
+
+    return SweepIdResponse(
+        sweep_id=sweep_id,
+        user_id=user_id,
+        username=sweep_params.username,
+        sim_sys=sweep_params.system,
+        n_points=len(points),
+        sim_ids=[sim_request.sim_id for sim_request in sim_requests],
+        sweep_status_path=sweep_status_path,
+        message=sweep_requested_message,
+    )
+
+
+def _sweep_points(params: Union[Dict[str, List[float]],
+                                List[Dict[str, float]]]) -> List[Dict[str, float]]:
+    """Expands the parameters of a sweep into a list of points.
+
+    Parameters
+    ----------
+    params : Dict[str, List[float]] or List[Dict[str, float]]
+        If it is a ``dict``, it maps each parameter name to the list of values
+        it takes, and the points are those of the cartesian product (grid) of
+        all these lists. If it is a ``list``, it already is the list of points.
+
+    Returns
+    -------
+    List[Dict[str, float]]
+        Parameters of each simulation of the sweep.
+    """
+    if isinstance(params, list):
+        return params
+    keys = list(params.keys())
+    return [
+        dict(zip(keys, values))
+        for values in product(*[params[key] for key in keys])
+    ]
+
+
+################################## Job queue ##################################
+
+def _check_admission(db: Session, username: str, n_jobs: int = 1,
+                     n_total: Optional[int] = None) -> None:
+    """Checks that ``n_jobs`` new simulations of ``username`` fit in the queue
+    of jobs.
+
+    The queue admits at most :data:`~simulation_api.config.MAX_PENDING_JOBS`
+    pending (queued or running) simulations, and at most
+    :data:`~simulation_api.config.MAX_PENDING_JOBS_PER_USER` of a single user.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    username : str
+        User requesting the simulations.
+    n_jobs : int, optional
+        Number of simulations requested. Default is 1.
+    n_total : int or None, optional
+        Number of simulations requested by all users at once (batches), used
+        to check the size of the whole queue. Default is ``n_jobs``.
+
+    Raises
+    ------
+    QueueFullError
+        If the simulations are not admitted. Its ``retry_after`` is the time
+        the queue needs to drain the excess of jobs at its current rate, or
+        ``None`` (status code 413) if the request alone exceeds the limits.
+    """
+    n_total = n_jobs if n_total is None else n_total
+    if n_jobs > MAX_PENDING_JOBS_PER_USER or n_total > MAX_PENDING_JOBS:
+        raise QueueFullError(
+            413, None,
+            f"Too many simulations in a single request: at most "
+            f"{min(MAX_PENDING_JOBS_PER_USER, MAX_PENDING_JOBS)} simulations "
+            f"can be queued at once. Split the request."
+        )
+
+    excess = crud._count_pending_jobs(db) + n_total - MAX_PENDING_JOBS
+    if excess > 0:
+        raise QueueFullError(
+            503, _retry_after(db, excess),
+            f"The server is busy: there are too many simulations in the "
+            f"queue (maximum {MAX_PENDING_JOBS}). Try again later."
+        )
+
+    user_excess = crud._count_pending_jobs(db, username) + n_jobs \
+                  - MAX_PENDING_JOBS_PER_USER
+    if user_excess > 0:
+        raise QueueFullError(
+            429, _retry_after(db, user_excess),
+            f"You have too many simulations in the queue (maximum "
+            f"{MAX_PENDING_JOBS_PER_USER} per user). Try again later."
+        )
+
+
+def _retry_after(db: Session, excess: int) -> int:
+    """Seconds the queue of jobs needs to drain ``excess`` jobs, at the rate
+    measured in the last :data:`~simulation_api.config.RETRY_AFTER_WINDOW`
+    seconds."""
+    n_finished = crud._count_finished_jobs(db, time.time() - RETRY_AFTER_WINDOW)
+    if not n_finished:
+        return RETRY_AFTER_DEFAULT
+    drain_rate = n_finished / RETRY_AFTER_WINDOW
+    return max(1, math.ceil(excess / drain_rate))
+
+
+def _queue_simulations(db: Session, sim_requests: List[SimRequest]) -> None:
+    """Queues simulations in ``jobs`` table and submits them to the pool of
+    workers, where they are run by :func:`_run_job`.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_requests : List[SimRequest]
+        Simulation requests, with ``sim_id`` and ``user_id``.
+
+    Returns
+    -------
+    None
+    """
+    submitted = time.time()
+    jobs = [
+        JobDBSchCreate(
+            sim_id=sim_request.sim_id,
+            user_id=sim_request.user_id,
+            username=sim_request.username,
+            system=SimSystem(sim_request.system).value,
+            method=IntegrationMethods(sim_request.method).value,
+            request=sim_request.json(),
+            submitted=submitted,
+        )
+        for sim_request in sim_requests
+    ]
+    # All the jobs are stored before any of them is submitted
+    crud._create_jobs(db, jobs)
+
+    for sim_request in sim_requests:
+        _publish_sim_event(sim_request.sim_id, sim_request.username,
+                           SimEventType.queued)
+        _submit_job(sim_request.sim_id)
+
+
+def _submit_job(sim_id: str) -> None:
+    """Submits the job of simulation ``sim_id`` to the pool of workers. Its
+    plots are then rendered (see :func:`_render_plots_later`) and its errors
+    reported (see :func:`_simulation_error_reporter`) in the server
+    process."""
+    _submit(_run_job, sim_id, on_error=_simulation_error_reporter(sim_id),
+            on_success=_render_plots_later)
+
+
+def _run_job(sim_id: str) -> Optional[str]:
+    """Claims the job of simulation ``sim_id`` and runs it. Runs in the pool of
+    workers.
+
+    If the job is not queued (e.g. it was already claimed by another worker)
+    nothing is done.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID.
+
+    Returns
+    -------
+    str or None
+        ``sim_id`` if the job ran, ``None`` otherwise.
+    """
+    db = SessionLocal()
+    if not crud._claim_job(db, sim_id, time.time()):
+        db.close()
+        return None
+    sim_params = SimRequest.parse_raw(crud._get_job(db, sim_id).request)
+    db.close()
+    _publish_sim_event(sim_id, sim_params.username, SimEventType.started)
+
+    try:
+        _run_simulation(sim_params)
+    finally:
+        db = SessionLocal()
+        crud._finish_job(db, sim_id, time.time())
+        db.close()
+
+    # Failed jobs are published by _simulation_error_reporter
+    _publish_finished(sim_id, sim_params.username)
+    return sim_id
+
+
+def _recover_jobs() -> None:
+    """Submits again to the pool of workers the jobs that did not finish, e.g.
+    because the server was stopped.
+
+    Jobs that were ``running`` are queued again and then all the ``queued``
+    jobs are submitted in order of submission. Jobs cancelled while running
+    whose worker did not store the cancellation are stored as cancelled.
+
+    Note
+    ----
+    It assumes a single server process owns the queue, so it must only be
+    called at startup.
+    """
+    db = SessionLocal()
+    crud._requeue_running_jobs(db)
+    for sim_id in crud._get_jobs_sim_ids(db, JobState.cancelled.value):
+        if not crud._get_simulation(db, sim_id):
+            _save_cancelled_job(db, crud._get_job(db, sim_id))
+    sim_ids = crud._get_jobs_sim_ids(db, JobState.queued.value)
+    db.close()
+
+    for sim_id in sim_ids:
+        _submit_job(sim_id)
+
+
+def _simulation_error_reporter(sim_id: str) -> Callable[[BaseException], None]:
+    """Returns a function that stores in the database the failure of a
+    simulation that raised an exception in its worker.
+
+    :func:`_run_simulation` already stores the errors of the simulation itself,
+    this is needed for any other error (e.g. while plotting or if the worker
+    died). Otherwise the simulation would never appear in the database. Jobs
+    that failed before being claimed by a worker are submitted again, at most
+    :data:`~simulation_api.config.MAX_JOB_ATTEMPTS` times.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID (of a job in ``jobs`` table).
+    """
+    def _report_error(exception: BaseException) -> None:
+        db = SessionLocal()
+        job = crud._get_job(db, sim_id)
+
+        # The job did not even start (e.g. another job broke the pool of
+        # workers), so it is submitted again. If the pool keeps failing, the
+        # job fails after a few attempts instead of being submitted forever
+        if job and job.state == JobState.queued.value \
+                and crud._count_job_attempt(db, sim_id) <= MAX_JOB_ATTEMPTS:
+            db.close()
+            _submit_job(sim_id)
+            return
+
+        if job and not crud._get_simulation(db, sim_id):
+            create_simulation_status_db = SimulationDBSchCreate(
+                sim_id=sim_id,
+                user_id=job.user_id,
+                date=str(datetime.utcnow()),
+                system=job.system,
+                method=job.method,
+                success=False,
+                message="Internal Server Error: " + repr(exception),
+            )
+            crud._create_simulation(db, create_simulation_status_db)
+        if job:
+            crud._finish_job(db, sim_id, time.time())
+            # Read before closing the session, commits expire the job
+            username = job.username
+        db.close()
+        if job:
+            _publish_finished(sim_id, username)
+    return _report_error
+
+
+def _publish_sim_event(sim_id: str, username: str, event: SimEventType,
+                       **kwargs: Any) -> None:
+    """Publishes an event of a simulation, see
+    :mod:`~simulation_api.controller.events`.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID.
+    username : str
+        Username of the owner of the simulation.
+    event : SimEventType
+        Type of event.
+    **kwargs : Any
+        Other fields of :class:`~simulation_api.controller.schemas.SimEvent`.
+    """
+    _publish_event(SimEvent(sim_id=sim_id, username=username, event=event,
+                            date=datetime.utcnow(), **kwargs))
+
+
+def _publish_finished(sim_id: str, username: str) -> None:
+    """Publishes the final event (``done`` or ``cancelled``) of a job."""
+    db = SessionLocal()
+    job = crud._get_job(db, sim_id)
+    sim_status = crud._get_simulation(db, sim_id)
+    db.close()
+    if job and job.state == JobState.cancelled.value:
+        _publish_sim_event(sim_id, username, SimEventType.cancelled)
+    else:
+        _publish_sim_event(sim_id, username, SimEventType.done,
+                           success=sim_status.success if sim_status else None)
+
+
 # NOTE Maybe this function is overloaded, we could split some of the tasks
 # maybe its ok, just consider it
 def _run_simulation(sim_params: SimRequest) -> None: 
     """Runs the requested simulation and stores the outcome in a database.
 
     This function runs the simulation, stores the simulation parameters in a
-    database, stores the simulation result in a pickle and creates and saves
-    relevant plots of the simulation.
+    database and stores the simulation results (see
+    :mod:`simulation_api.model.results`). Plots are rendered later.
 
     Parameters
     ----------
@@ -174,13 +834,18 @@ def _run_simulation(sim_params: SimRequest) -> None:
     # Start session in dbase
     db = SessionLocal()
 
+    # Identifies the request in the cache of results
+    request_hash = _sim_request_hash(sim_params)
+
     # If t_steps is provided in sim_params, generate t_eval
     if sim_params.t_steps:
         sim_params.t_eval = linspace(
             sim_params.t_span[0], sim_params.t_span[1], sim_params.t_steps
         )
 
-    # Convert the SimRequest instance to dict
+    # Convert the SimRequest instance to dict (the instance is kept to update
+    # the cost model)
+    sim_request = sim_params
     sim_params = sim_params.dict()
 
     # Pop some values Simulation __init__ method does not accept.
@@ -189,7 +854,7 @@ def _run_simulation(sim_params: SimRequest) -> None:
     sim_id = sim_params.pop("sim_id")
     user_id = sim_params.pop("user_id")
     sim_params.pop("t_steps")
-    sim_params.pop("username")
+    username = sim_params.pop("username")
 
     basic_info = {
         "sim_id": sim_id,
@@ -219,7 +884,24 @@ def _run_simulation(sim_params: SimRequest) -> None:
         # Run simulation and get results as returned by scipy.integrate.solve_ivp
         LocalSimulation = Simulations[system.value]
         simulation_instance = LocalSimulation(**sim_params)
+        simulation_instance.monitor = _job_monitor(
+            sim_id, username,
+            simulation_instance.t_span or simulation_instance.t_eval
+        )
+        start = time.perf_counter()
         simulation = simulation_instance.simulate()
+        solve_time = time.perf_counter() - start
+        # Methods that do not evaluate the system (analytic) are never
+        # monitored, neither is the last stretch of the integration
+        if _job_cancelled(db, sim_id):
+            raise SimulationCancelled
+        _publish_progress(db, sim_id, username, 1., solve_time,
+                          int(simulation.nfev))
+    except SimulationCancelled:
+        # Results are neither stored nor plotted
+        _save_cancelled_simulation(db, basic_info, sim_params["method"])
+        db.close()
+        return
     except Exception as e:
         create_simulation_status_db = SimulationDBSchCreate(
             success=False,
@@ -232,16 +914,238 @@ def _run_simulation(sim_params: SimRequest) -> None:
         # FIXME FIXME FIXME is it better to raise an exception at this point?
         return
 
-    # Store simulation result in pickle
-    _pickle(sim_id + ".pickle", PATH_PICKLES, dict(simulation))
+    # Store simulation results (see simulation_api.model.results). Plots are
+    # rendered later, see _render_plots
+    start = time.perf_counter()
+    _save_results(sim_id, dict(simulation))
+    plot_query_values = SimSystem_to_PlotQueryValues[system.value]
+    output_time = time.perf_counter() - start
+
+    # Update the cost model with the measured cost
+    _record_cost(db, sim_request, simulation.nfev, solve_time,
+                 len(simulation.t), output_time)
+
+    # Save simulation status, plot query values and parameters in database
+    _save_simulation_db(db, basic_info, sim_params["method"],
+                        plot_query_values, simulation_instance.params,
+                        simulation_instance.ini_cndtn)
+
+    # Identical requests will reuse these results
+    now = time.time()
+    cached_result = ResultCacheDBSchCreate(request_hash=request_hash,
+                                           sim_id=sim_id, created=now,
+                                           last_used=now)
+    crud._create_cached_result(db, cached_result)
+    _evict_cached_results(db, now)
     
-    # Create and save plots
-    plot_query_values = _plot_solution(SimResults(sim_results=simulation),
-                                       system, sim_id)
+    # Close db session
+    db.close()
+
+    return 
+
+
+def _job_monitor(sim_id: str, username: str,
+                 t_span: List[float]) -> Callable[[float, int], None]:
+    """Returns a :attr:`~simulation_api.simulation.simulations.Simulation.monitor`
+    that publishes the progress of the simulation and stops it if its job is
+    cancelled.
+
+    The progress is published at most once every
+    :data:`~simulation_api.config.PROGRESS_INTERVAL` seconds and the job is
+    looked up in the database at most once every
+    :data:`~simulation_api.config.CANCEL_CHECK_INTERVAL` seconds.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID (of a job in ``jobs`` table).
+    username : str
+        Username of the owner of the simulation.
+    t_span : list or array
+        Interval of integration (or times where the solution is stored), used
+        to compute the fraction of the integration that is done.
+    """
+    start = time.monotonic()
+    last_check = last_progress = start
+
+    def _monitor(t: float, nfev: int) -> None:
+        nonlocal last_check, last_progress
+        now = time.monotonic()
+        check = now - last_check >= CANCEL_CHECK_INTERVAL
+        progress = now - last_progress >= PROGRESS_INTERVAL
+        if not (check or progress):
+            return
+        db = SessionLocal()
+        if progress:
+            last_progress = now
+            t0, tf = t_span[0], t_span[-1]
+            fraction = (t - t0) / (tf - t0) if tf != t0 else 1.
+            _publish_progress(db, sim_id, username, fraction, now - start,
+                              nfev)
+        if check:
+            last_check = now
+            cancelled = _job_cancelled(db, sim_id)
+        db.close()
+        if check and cancelled:
+            raise SimulationCancelled
+    return _monitor
+
+
+def _publish_progress(db: Session, sim_id: str, username: str,
+                      fraction: float, elapsed: float, nfev: int) -> None:
+    """Stores the progress of a running simulation in ``job_progress`` table
+    and publishes it as a ``progress`` event.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_id : str
+        Simulation ID.
+    username : str
+        Username of the owner of the simulation.
+    fraction : float
+        Fraction of ``t_span`` already integrated. It is clipped to [0, 1]
+        since solvers evaluate the system slightly ahead of the current time.
+    elapsed : float
+        Wall time (seconds) since the integration started.
+    nfev : int
+        Evaluations of the right hand side of the system so far.
+    """
+    fraction = min(max(fraction, 0.), 1.)
+    eta = elapsed * (1 - fraction) / fraction if fraction else None
+    updated = time.time()
+    progress = JobProgressDBSchCreate(sim_id=sim_id, fraction=fraction,
+                                      elapsed=elapsed, nfev=nfev, eta=eta,
+                                      updated=updated)
+    crud._update_job_progress(db, progress)
+    _publish_sim_event(
+        sim_id, username, SimEventType.progress,
+        progress=SimProgress(fraction=fraction, elapsed=elapsed, nfev=nfev,
+                             eta=eta,
+                             updated=_timestamp_to_datetime(updated))
+    )
+
+
+def _job_cancelled(db: Session, sim_id: str) -> bool:
+    """Tells if the job of simulation ``sim_id`` was cancelled."""
+    job = crud._get_job(db, sim_id)
+    return bool(job) and job.state == JobState.cancelled.value
+
+
+def _save_cancelled_simulation(db: Session, basic_info: Dict[str, Any],
+                               method: str) -> None:
+    """Stores in ``simulations`` table a simulation that was cancelled.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    basic_info : dict
+        Contains ``sim_id``, ``user_id``, ``date`` and ``system``.
+    method : str
+        Integration method.
+    """
+    create_simulation_status_db = SimulationDBSchCreate(
+        success=False,
+        message=sim_cancelled_message,
+        method=method,
+        **basic_info
+    )
+    crud._create_simulation(db, create_simulation_status_db)
+
+
+def _save_cancelled_job(db: Session, job: models.JobDB) -> None:
+    """Stores in ``simulations`` table the cancelled simulation of ``job``."""
+    basic_info = {
+        "sim_id": job.sim_id,
+        "user_id": job.user_id,
+        "date": str(datetime.utcnow()),
+        "system": job.system,
+    }
+    _save_cancelled_simulation(db, basic_info, job.method)
+
+
+def _cancel_simulation(db: Session, sim_id: str) -> SimStatus:
+    """Cancels a queued or running simulation.
+
+    A queued simulation is stored as cancelled right away and will never run.
+    A running simulation is marked as cancelled, its worker stops the
+    integration at the next check (see :func:`_job_monitor`), does not save
+    its results and stores it as cancelled. Cancelling it again before that
+    answers with its current status.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_id : str
+        ID of the simulation.
+
+    Raises
+    ------
+    HTTPException
+        404 if there is no simulation with ID ``sim_id``.
+
+    Returns
+    -------
+    SimStatus
+        Status of the simulation after the cancellation.
+    """
+    if crud._cancel_job(db, sim_id, JobState.queued.value, time.time()):
+        job = crud._get_job(db, sim_id)
+        _save_cancelled_job(db, job)
+        _publish_sim_event(sim_id, job.username, SimEventType.cancelled)
+    elif not crud._cancel_job(db, sim_id, JobState.running.value,
+                              time.time()):
+        # A running simulation already cancelled is in jobs table only,
+        # until its worker stores it
+        if not crud._get_simulation(db, sim_id) \
+                and not crud._get_job(db, sim_id):
+            raise HTTPException(status_code=404,
+                                detail=sim_id_not_found_message)
+        sim_status = _get_sim_status(db, sim_id)
+        if sim_status.job_state != JobState.cancelled:
+            sim_status.message += sim_cancel_finished_message
+        return sim_status
+
+    return _get_sim_status(db, sim_id)
+
+
+def _save_simulation_db(db: Session, basic_info: Dict[str, Any], method: str,
+                        plot_query_values: List[str], params: Dict[str, float],
+                        ini_cndtn: Union[List[float], List[List[float]]],
+                        commit: bool = True) -> None:
+    """Stores a successful simulation in ``simulations``, ``plots`` and
+    ``parameters`` tables.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    basic_info : Dict[str, Any]
+        ``sim_id``, ``user_id``, ``date`` and ``system`` of the simulation.
+    method : str
+        Integration method.
+    plot_query_values : List[str]
+        Plot query values as returned by :func:`_plot_solution`.
+    params : Dict[str, float]
+        Parameters of the simulation.
+    ini_cndtn : List[float] or List[List[float]]
+        Initial condition (or ensemble of initial conditions).
+    commit : bool, optional
+        If ``False`` the rows are only flushed, the caller commits them.
+        Default is True.
+
+    Returns
+    -------
+    None
+    """
+    sim_id = basic_info["sim_id"]
 
     # Save simulation status in database
     create_simulation_status_db = SimulationDBSchCreate(
-        method=sim_params["method"],
+        method=method,
         route_pickle=app.url_path_for("api_download_pickle", sim_id=sim_id),
         route_results=app.url_path_for("api_simulate_status", sim_id=sim_id),
         route_plots= app.url_path_for("api_download_plots", sim_id=sim_id),
@@ -249,278 +1153,148 @@ def _run_simulation(sim_params: SimRequest) -> None:
         message=sim_status_finished_message,
         **basic_info
     )
-    crud._create_simulation(db, create_simulation_status_db)
+    crud._create_simulation(db, create_simulation_status_db, commit)
 
     #  Save plot query values to database
     plot_query_values = [
         PlotDBSchCreate(sim_id=sim_id, plot_query_value=plot_qb)
         for plot_qb in plot_query_values
     ]
-    crud._create_plot_query_values(db, plot_query_values)
+    crud._create_plot_query_values(db, plot_query_values, commit)
 
     # Store simulation parameters in database
     parameters = []
-    for key, value in simulation_instance.params.items():
+    for key, value in params.items():
         parameter = ParameterDBSchCreate(sim_id=sim_id,
                                          param_type=ParamType.param.value,
                                          param_key=key, value=value)
         parameters.append(parameter)
-    for i, ini_cndtn_val in enumerate(simulation_instance.ini_cndtn):
-        ini_cndtn = ParameterDBSchCreate(sim_id=sim_id,
-                                         param_type=ParamType.ini_cndtn,
-                                         ini_cndtn_id=i, value=ini_cndtn_val)
-        parameters.append(ini_cndtn)
-    crud._create_parameters(db, parameters)
-    
-    # Close db session
-    db.close()
-
-    return 
-
+    # Ensembles are stored flattened, each row keeps the index of its member
+    # in param_key (None for a single initial condition), so that an ensemble
+    # of one member is told apart from a single initial condition
+    ini_cndtn = asarray(ini_cndtn, dtype=float)
+    ensemble = ini_cndtn.ndim == 2
+    members = ini_cndtn if ensemble else ini_cndtn[None]
+    dim = members.shape[-1]
+    for member_id, member in enumerate(members):
+        for j, ini_cndtn_val in enumerate(member):
+            ini_cndtn_row = ParameterDBSchCreate(
+                sim_id=sim_id,
+                param_type=ParamType.ini_cndtn,
+                param_key=str(member_id) if ensemble else None,
+                ini_cndtn_id=member_id * dim + j,
+                value=float(ini_cndtn_val)
+            )
+            parameters.append(ini_cndtn_row)
+    crud._create_parameters(db, parameters, commit)
+    return
+
+
+def _render_plots(sim_id: str,
+                  plot_query_values: Optional[List[str]] = None) -> List[str]:
+    """Renders the plots of a finished simulation from its results. Runs in
+    the pool of workers that renders plots (see
+    :mod:`~simulation_api.controller.workers`).
+
+    Plots already on disk are not rendered again.
 
-def _plot_solution(sim_results: SimResults, system: SimSystem,
-                   plots_basename: str = "00000") -> List[str]:
-    """Generates relevant simulation's plots and saves them.
-    
     Parameters
     ----------
-    sim_results : SimResults
-        Simulation results as returned by
-        :meth:`~simulation_api.simulation.simulations.Simulation.simulate`.
-    system : SimSystem
-        System to be simulated.
-    plots_basename : str
-        Base name of the plots. Actual name of each plot will be
-        ``<plotbasename>_<plot_query_value>.png``, where ``<plot_query_value>``
-        is a special tag for each type of plot. In this API, baseplot will
-        always be the value of
-        :attr:`~simulation_api.controller.schemas.SimIdResponse.sim_id`.
+    sim_id : str
+        Simulation ID.
+    plot_query_values : List[str] or None, optional
+        Plots to be rendered. All the plots of the simulation if ``None``.
+        Default is None.
 
     Returns
     -------
-    plot_query_values : List[str]
-        Names of each type of plot. These are very important since they are
-        needed to access the plots in the API route (these are the possible
-        values for the query param "value" in route
-        ``/api/results/{sim_id}/plot``).
+    List[str]
+        Plot query values of the plots that were rendered.
     """
-    
-    font_normal_size = 17
-    mpl.rcParams.update({'font.size': font_normal_size})
-
-    # Get simulation results as OdeResult instance
-    sim_results = sim_results.sim_results
-    
-    plot_query_values = []
-
-    if system == SimSystem.HO:    
-        ##################################
-        # Using pyplot (not recommended) #
-        ##################################
-        # # Phase space trajectory plot
-        # plot_query_value = 'phase'
-        # plot_query_values.append(plot_query_value)
-
-        # fig = plt.figure()
-        # ax = fig.add_subplot(111)
-        # plt.plot(sim_results.y[0], sim_results.y[1])
-        # ax.set_aspect('equal', adjustable='box')
-        # plt.xlabel('q')
-        # plt.ylabel('p')
-        # plt.title('Phase space')
-        # fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
-        # plt.close()
-
-        # # Canonical coordinates evolution plot
-        # plot_query_value = 'coord'
-        # plot_query_values.append(plot_query_value)
-
-        # fig = plt.figure()
-        # ax = fig.add_subplot(111)
-        # plt.plot(sim_results.t, sim_results.y[0], label='q(t)')
-        # plt.plot(sim_results.t, sim_results.y[1], label='p(t)')
-        # plt.xlabel('t')
-        # plt.ylabel('Canonical coordinate')
-        # plt.title('Canonical coordinates evolution')
-        # plt.legend()
-        # fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
-        # plt.close()
-
-        #######################################################################
-        # NOT using pyplot (RECOMMENDED, read comments provided after imports)#
-        #######################################################################
-
-        ##################### Phase space trajectory plot #####################
-        plot_query_value = PlotQueryValues_HO.phase.value
-        plot_query_values.append(plot_query_value)
-
-        xlim = max(abs(sim_results.y[0]))
-        ylim = max(abs(sim_results.y[1]))
-        ax_lim = max([xlim, ylim]) * 1.05
-        dashed_line = [[-ax_lim, ax_lim], [0, 0]]
-
-        fig = Figure()
-        ax = fig.add_subplot(111)
-        ax.plot(sim_results.y[0], sim_results.y[1])
-        ax.plot(dashed_line[0], dashed_line[1], 'k--')
-        ax.plot(dashed_line[1], dashed_line[0], 'k--')
-        ax.set_aspect('equal', adjustable='box')
-        ax.set_xlabel('q')
-        ax.set_ylabel('p')
-        # ax.set_title('Phase space')
-        ax.set_xlim(-ax_lim, ax_lim)
-        ax.set_ylim(-ax_lim, ax_lim)
-        fig.tight_layout()
-        fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
-        
-
-        ################ Canonical coordinates evolution plot #################
-        plot_query_value = PlotQueryValues_HO.coord.value
-        plot_query_values.append(plot_query_value)
-
-        fig = Figure()
-
-        ax = fig.add_subplot(111)
-        ax.plot(sim_results.t, sim_results.y[0], label='q(t)')
-        ax.plot(sim_results.t, sim_results.y[1], label='p(t)')
-        ax.set_xlabel('t')
-        ax.set_ylabel('Canonical coordinate')
-        ax.legend()
+    db = SessionLocal()
+    sim_status = crud._get_simulation(db, sim_id)
+    available = crud._get_plot_query_values(db, sim_id)
+    username = crud._get_username(db, sim_status.user_id)[0] \
+               if sim_status else None
+    db.close()
 
-        fig.tight_layout()
-        fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
-    
-    elif system == SimSystem.ChenLee:
-        
-        ########################## 3D Phase portrait ##########################
-        plot_query_value = PlotQueryValues_ChenLee.threeD.value
-        plot_query_values.append(plot_query_value)
-        
-        # Plot limits
-        limx_max = max(sim_results.y[0])
-        limx_min = min(sim_results.y[0])
-        margin_x = 0.05 * (limx_max - limx_min)
-        limy_max = max(sim_results.y[1])
-        limy_min = min(sim_results.y[1])
-        margin_y = 0.05 * (limy_max - limy_min)
-        limz_max = max(sim_results.y[2])
-        limz_min = min(sim_results.y[2])
-        margin_z = 0.05 * (limz_max - limz_min)
-        xlim = (limx_min - margin_x, limx_max + margin_x)
-        ylim = (limy_min - margin_y, limy_max + margin_y)
-        zlim = (limz_min - margin_z, limz_max + margin_z)
-
-        fig = Figure() # figsize=(12,10))
-        ax = fig.gca(projection='3d')    #Parametric 3D curve
-        ax.plot(
-            sim_results.y[0],
-            sim_results.y[1],
-            sim_results.y[2],
-            c='navy'
-        )
-        ax.set_xlabel('$\Omega_x$')
-        ax.set_ylabel('$\Omega_y$')
-        ax.set_zlabel('$\Omega_z$')
-        ax.set_zlim(*zlim)
-        ax.set_xlim(*xlim)
-        ax.set_ylim(*ylim)
-        fig.tight_layout()
-        fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
+    # Failed simulations have no results
+    if not (sim_status and sim_status.success):
+        return []
+
+    if plot_query_values is None:
+        plot_query_values = available
+    missing = [
+        plot_query_value for plot_query_value in plot_query_values
+        if plot_query_value in available
+        and not all(os.path.isfile(_create_plot_path_disk(sim_id,
+                                                          plot_query_value,
+                                                          size.value))
+                    for size in PlotSize)
+    ]
+    if not missing:
+        return []
 
-        ##################### Phase portrait projections ######################
-        mpl.rcParams.update({'font.size': 25})
+    _publish_sim_event(sim_id, username, SimEventType.rendering)
+    simulation = _load_results(sim_id)
+    _plot_solution(SimResults(sim_results=simulation),
+                   SimSystem(sim_status.system), sim_id, only=missing)
+    return missing
 
-        plot_query_value = PlotQueryValues_ChenLee.project.value
-        plot_query_values.append(plot_query_value)
 
-        nrows = 1
-        ncols = 3
+def _render_plots_later(sim_id: Optional[str]) -> None:
+    """Submits the rendering of the plots of a finished job to the pool of
+    workers that renders plots, if
+    :data:`~simulation_api.config.PLOTS_EAGER`. Otherwise they are rendered
+    the first time they are requested.
 
-        fig = Figure(figsize=(20,10))
-        
-        ax = fig.add_subplot(nrows, ncols, 1)
-        ax.plot(
-            sim_results.y[0],
-            sim_results.y[1],
-            label='Phase portrait $\Omega_x\Omega_y$',
-            c='indianred'
-        )
-        ax.legend(loc='best')
-        ax.set_xlabel('$\Omega_x$')
-        ax.set_ylabel('$\Omega_y$')
-        ax.set_xlim(*xlim)
-        ax.set_ylim(*ylim)
-        
-        ax = fig.add_subplot(nrows, ncols, 2)
-        ax.plot(
-            sim_results.y[1],
-            sim_results.y[2],
-            label='Phase portrait $\Omega_y\Omega_z$',
-            c='navy'
-        )
-        ax.legend(loc='best')
-        ax.set_xlabel('$\Omega_y$')
-        ax.set_ylabel('$\Omega_z$')
-        ax.set_xlim(*ylim)
-        ax.set_ylim(*zlim)
-        
-        ax = fig.add_subplot(nrows, ncols, 3)
-        ax.plot(
-            sim_results.y[0],
-            sim_results.y[2],
-            label='Phase portrait $\Omega_x\Omega_z$',
-            c='olive'
-        )
-        ax.legend(loc='best')
-        ax.set_xlabel('$\Omega_x$')
-        ax.set_ylabel('$\Omega_z$')
-        ax.set_xlim(*xlim)
-        ax.set_ylim(*zlim)
-        
-        fig.tight_layout()
-        fig.savefig(_create_plot_path_disk(plots_basename, plot_query_value))
-
-        mpl.rcParams.update({'font.size': 17})
-    
-    return plot_query_values
+    Each plot is submitted as a separate task, so that the plots of the
+    simulation are rendered concurrently."""
+    if not (PLOTS_EAGER and sim_id):
+        return
+    db = SessionLocal()
+    plot_query_values = crud._get_plot_query_values(db, sim_id)
+    db.close()
+    for plot_query_value in plot_query_values:
+        _submit_render(sim_id, plot_query_value)
 
 
-def _pickle(file_name: str, path: str = '',
-            data: Optional[dict] = None) -> Any:
-    """Saves ``data`` to pickle or reads Python object from pickle.
-    
-    Saves ``data`` to pickle if ``data``. Otherwise it will try to read a
-    pickle from ``path + '/' + file_name`` and return the python object stored
-    in it.
-    
+def _submit_render(sim_id: str, plot_query_value: str) -> Future:
+    """Submits the rendering of a plot of a simulation (see
+    :func:`_render_plots`) to the pool of workers that renders plots, unless
+    it is already being rendered.
 
     Parameters
     ----------
-    file_name : str
-        Name of file to be read from or to write on.
-    path : str
-        Path of directory in which the file will be saved or read from.
-    data : dict or None, optional
-        If you want to save data to a pickle, provide the data as dictionary.
-        Default is None.
-    
+    sim_id : str
+        Simulation ID.
+    plot_query_value : str
+        Plot query value of the plot.
+
     Returns
     -------
-    loaded_object : Any or None
-        Object loaded when no data is provided.
-
+    future : ``concurrent.futures.Future``
+        Future of the rendering, shared by all the requests of the plot while
+        it is being rendered.
     """
-    # Set mode to read or write
-    mode = "wb" if data else "rb"
-
-    with open(path + file_name, mode) as file:        
-        if data:
-            pkl.dump(data, file)
-            loaded_object = None
-        else:
-            loaded_object = pkl.load(file)
-
-    return loaded_object
+    key = (sim_id, plot_query_value)
+    with _renders_lock:
+        future = _renders.get(key)
+        if future is not None:
+            return future
+        future = _submit(_render_plots, sim_id, [plot_query_value],
+                         render=True)
+        _renders[key] = future
+    # Outside the lock: if the rendering already finished, the callback is
+    # called right away
+    future.add_done_callback(lambda _: _forget_render(key))
+    return future
+
+
+def _forget_render(key: Tuple[str, str]) -> None:
+    """Removes a finished rendering from the renderings in progress."""
+    with _renders_lock:
+        _renders.pop(key, None)
 
 
 def _sim_form_to_sim_request(form: Dict[str, str]) -> SimRequest:
@@ -579,19 +1353,176 @@ def _sim_form_to_sim_request(form: Dict[str, str]) -> SimRequest:
     return SimRequest(**sim_request)
 
 
-############################## Paths and routes ###############################
+################################ Result cache #################################
+
+def _sim_request_hash(sim_params: SimRequest) -> str:
+    """Hash of the canonical form of a simulation request.
+
+    Two requests have the same hash if and only if they define the same
+    simulation: system, parameters, initial conditions, ``t_span``, ``t_eval``
+    and integration method. ``t_steps`` is expanded into ``t_eval`` as in
+    :func:`_run_simulation`, and all numbers are hashed as float64, so that
+    e.g. ``1`` and ``1.0`` are the same value.
+
+    Parameters
+    ----------
+    sim_params : SimRequest
+        Contains all the information about the simulation request.
+
+    Returns
+    -------
+    str
+        SHA-256 hash (hex digest).
+    """
+    t_eval = sim_params.t_eval
+    if sim_params.t_steps:
+        t_eval = linspace(sim_params.t_span[0], sim_params.t_span[1],
+                          sim_params.t_steps)
+
+    arrays = {
+        "t_span": asarray(sim_params.t_span, dtype=float),
+        "t_eval": asarray(t_eval if t_eval is not None else [], dtype=float),
+        "ini_cndtn": asarray(sim_params.ini_cndtn, dtype=float),
+    }
+    header = {
+        "system": SimSystem(sim_params.system).value,
+        "method": IntegrationMethods(sim_params.method).value,
+        "params": {key: float(value)
+                   for key, value in sim_params.params.items()},
+        "shapes": {key: array.shape for key, array in arrays.items()},
+    }
+
+    request_hash = sha256(json.dumps(header, sort_keys=True).encode())
+    for key in sorted(arrays):
+        request_hash.update(arrays[key].tobytes())
+    return request_hash.hexdigest()
+
+
+def _get_cached_simulation(db: Session, request_hash: str) -> Optional[str]:
+    """Looks up the simulation that holds the results of a request in
+    ``result_cache`` table.
+
+    Expired entries, or entries whose results are no longer on disk, are deleted
+    and count as misses.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    request_hash : str
+        As returned by :func:`_sim_request_hash`.
+
+    Returns
+    -------
+    str or None
+        Simulation ID of the cached simulation, ``None`` if there is none.
+    """
+    cached_result = crud._get_cached_result(db, request_hash)
+    if not cached_result:
+        return None
+
+    now = time.time()
+    if (cached_result.created < now - RESULT_CACHE_TTL
+            or not _results_exist(cached_result.sim_id)):
+        _evict_cached_results(db, now, [request_hash])
+        return None
+
+    crud._touch_cached_result(db, request_hash, now)
+    return cached_result.sim_id
+
+
+def _evict_cached_results(db: Session, now: float,
+                          request_hashes: Optional[List[str]] = None) -> None:
+    """Evicts expired and least recently used entries of ``result_cache``
+    table (and ``request_hashes``), see
+    :func:`~simulation_api.model.crud._evict_cached_results`. If any entry was
+    evicted, the stored objects that no file links anymore are deleted (see
+    :func:`~simulation_api.model.storage._collect_garbage`).
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    now : float
+        UNIX timestamp.
+    request_hashes : List[str] or None, optional
+        Entries explicitly evicted. Default is None.
+    """
+    if crud._evict_cached_results(db, RESULT_CACHE_MAX_ENTRIES,
+                                  now - RESULT_CACHE_TTL, request_hashes):
+        _collect_garbage()
+
+
+def _copy_cached_simulation(db: Session, cached_sim_id: str,
+                            sim_params: SimRequest,
+                            commit: bool = True) -> None:
+    """Creates the simulation ``sim_params.sim_id`` from the results of
+    ``cached_sim_id``, without simulating.
+
+    The results and plots are hard links to those of ``cached_sim_id`` (see
+    :func:`_link_cached_simulation`). They are linked once the rows of the
+    simulation are committed, so that no files are left behind if the
+    transaction is rolled back.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    cached_sim_id : str
+        Simulation ID of the cached simulation.
+    sim_params : SimRequest
+        Contains all the information about the simulation request.
+    commit : bool, optional
+        If ``False`` the rows are only flushed, the caller commits them and
+        then calls :func:`_link_cached_simulation`. Default is True.
 
-def _create_pickle_path_disk(sim_id: str) -> str:
-    """Creates disk path to simulation results (pickle) by
-    :attr:`~simulation_api.controller.schemas.SimIdResponse.sim_id`."""
-    return PATH_PICKLES + sim_id + ".pickle"
+    Returns
+    -------
+    None
+    """
+    sim_id = sim_params.sim_id
+    plot_query_values = crud._get_plot_query_values(db, cached_sim_id)
 
+    basic_info = {
+        "sim_id": sim_id,
+        "user_id": sim_params.user_id,
+        "date": str(datetime.utcnow()),
+        "system": SimSystem(sim_params.system).value,
+    }
+    _save_simulation_db(db, basic_info,
+                        IntegrationMethods(sim_params.method).value,
+                        plot_query_values, sim_params.params,
+                        sim_params.ini_cndtn, commit)
+    if commit:
+        _link_cached_simulation(cached_sim_id, sim_id, plot_query_values)
+    return
 
-def _create_plot_path_disk(sim_id: str, query_param: PlotQueryValues,
-                           plot_format: str = PLOTS_FORMAT) -> str:
-    """Creates disk path to plots of simulation results by
-    :attr:`~simulation_api.controller.schemas.SimIdResponse.sim_id`."""
-    return PATH_PLOTS + sim_id + "_" + query_param + plot_format
+
+def _link_cached_simulation(cached_sim_id: str, sim_id: str,
+                            plot_query_values: List[str]) -> None:
+    """Hard links the results and plots of simulation ``sim_id`` to those of
+    ``cached_sim_id`` (copies them if the file system does not support hard
+    links). Plots not rendered yet will be rendered from the results.
+
+    Parameters
+    ----------
+    cached_sim_id : str
+        Simulation ID of the cached simulation.
+    sim_id : str
+        Simulation ID of the new simulation.
+    plot_query_values : List[str]
+        Plot query values of the plots of the simulation.
+    """
+    _link_results(cached_sim_id, sim_id)
+
+    for plot_query_value in plot_query_values:
+        for size in PlotSize:
+            src = _create_plot_path_disk(cached_sim_id, plot_query_value,
+                                         size.value)
+            if os.path.isfile(src):
+                _link_file(src, _create_plot_path_disk(sim_id,
+                                                       plot_query_value,
+                                                       size.value))
 
 
 ########################## Check Chen-Lee Parameters ##########################
@@ -622,3 +1553,236 @@ def _check_chen_lee_params(a: float, b:float, c: float):
         :math:`\omega_z` parameter.
     """ 
     return (a > 0) and (b < 0) and (c < 0) and (a < - (b + c))
+
+
+############################## Simulation status ##############################
+
+def _get_sim_status(db: Session, sim_id: str) -> SimStatus:
+    """Gathers the status of a simulation from the database.
+
+    Parameters
+    ----------
+    db : ``sqlalchemy.orm.Session``
+        Needed for interaction with database.
+    sim_id : str
+        ID of the simulation.
+
+    Returns
+    -------
+    SimStatus
+        Status information of the simulation and how to get the results.
+    """
+    # Simulation status
+    sim_status = crud._get_simulation(db, sim_id)
+    # State in queue of jobs
+    job = crud._get_job(db, sim_id)
+    # Plot query params possible values
+    plot_query_values = crud._get_plot_query_values(db, sim_id)
+
+    # Parameters
+    params = crud._get_parameters(db, sim_id, ParamType.param)
+    # Initial conditions
+    ini_cndtn = crud._get_parameters(db, sim_id, ParamType.ini_cndtn)
+
+    sim_status_NA = {
+        "sim_id": sim_id,
+        "user_id": 0,
+        "date": str(datetime.utcnow()),
+        "system": None,
+        "success": None,
+        "message": sim_id_not_found_message
+    }
+
+    # Queued or running simulations are not in simulations table yet
+    if job and not sim_status:
+        sim_status_NA.update({
+            "user_id": job.user_id,
+            "date": _timestamp_to_datetime(job.submitted),
+            "system": job.system,
+            "method": job.method,
+            "message": {
+                JobState.running.value: sim_running_message,
+                JobState.cancelled.value: sim_cancelling_message,
+            }.get(job.state, sim_queued_message),
+        })
+
+    job_info = {
+        "job_state": job.state,
+        "submitted": _timestamp_to_datetime(job.submitted),
+        "started": _timestamp_to_datetime(job.started),
+        "finished": _timestamp_to_datetime(job.finished),
+        "progress": _get_sim_progress(db, sim_id),
+    } if job else {}
+
+    sim_status = sim_status.__dict__ if sim_status else sim_status_NA
+
+    sim_status_complete = {
+        **job_info,
+        "ini_cndtn": ini_cndtn,
+        "params": params,
+        "plot_query_values": plot_query_values,
+        **sim_status,
+    }
+
+    return SimStatus(**sim_status_complete)
+
+
+def _get_sim_progress(db: Session, sim_id: str) -> Optional[SimProgress]:
+    """Gathers the progress of a simulation from the database, ``None`` if
+    it was never published (e.g. the simulation is queued)."""
+    progress = crud._get_job_progress(db, sim_id)
+    if not progress:
+        return None
+    return SimProgress(fraction=progress.fraction, elapsed=progress.elapsed,
+                       nfev=progress.nfev, eta=progress.eta,
+                       updated=_timestamp_to_datetime(progress.updated))
+
+
+def _timestamp_to_datetime(timestamp: Optional[float]) -> Optional[datetime]:
+    """Converts UNIX timestamp (as stored in ``jobs`` table) to UTC datetime,
+    the convention used in the rest of the database."""
+    if timestamp is None:
+        return None
+    return datetime.utcfromtimestamp(timestamp)
+
+
+##################### Trajectories (interactive plots) ########################
+
+def _load_sim_series(sim_id: str, n_points: int, t0: Optional[float] = None,
+                     t1: Optional[float] = None
+                     ) -> Tuple[ndarray, ndarray, int]:
+    """Loads the trajectories of a finished simulation in the window
+    ``t0 <= t <= t1``, decimated to ``n_points`` points (see
+    :func:`~simulation_api.controller.decimation._pyramid_indices`).
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID.
+    n_points : int
+        Maximum number of points.
+    t0, t1 : float or None, optional
+        The window is ``t0 <= t <= t1``. Default is ``None``, unbounded.
+
+    Returns
+    -------
+    t : ndarray
+        Times of the points kept.
+    y : ndarray
+        Trajectories at times ``t``.
+    n_total : int
+        Number of points of the stored solution.
+    """
+    sim_results = _load_results(sim_id)
+    t = sim_results.t
+    y = sim_results.y
+    start, stop = _time_window(t, t0, t1)
+    indices = _pyramid_indices(y, _load_pyramid(sim_id), start, stop,
+                               n_points)
+    return asarray(t[indices]), asarray(y[..., indices]), len(t)
+
+
+def _load_sim_data(sim_id: str, t0: Optional[float], t1: Optional[float],
+                   stride: int,
+                   components: List[int]) -> Tuple[ndarray, ndarray, int, int]:
+    """Loads a window of the trajectories of a finished simulation.
+
+    The stored solution is memory mapped (see
+    :func:`~simulation_api.model.results._load_results`): the window is found
+    by binary search on ``t`` and only the points served are read from disk.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID.
+    t0, t1 : float or None
+        The window is ``t0 <= t <= t1``. ``None`` means unbounded.
+    stride : int
+        Every ``stride``-th point of the window is loaded.
+    components : List[int]
+        Components loaded (rows of ``y``).
+
+    Returns
+    -------
+    t : ndarray
+        Times of the points loaded.
+    y : ndarray
+        Trajectories at times ``t``.
+    n_total : int
+        Number of points of the stored solution.
+    start : int
+        Index of the first point of the window in the stored solution.
+    """
+    sim_results = _load_results(sim_id)
+    t = sim_results.t
+    start, stop = _time_window(t, t0, t1)
+    window = slice(start, stop, stride)
+    return (asarray(t[window]), asarray(sim_results.y[..., components, window]),
+            len(t), start)
+
+
+def _time_window(t: ndarray, t0: Optional[float],
+                 t1: Optional[float]) -> Tuple[int, int]:
+    """Indices ``start, stop`` such that ``t[start:stop]`` are the times in
+    ``t0 <= t <= t1`` (``None`` means unbounded). Binary search, ``t`` must be
+    sorted."""
+    start = 0 if t0 is None else int(searchsorted(t, t0, side="left"))
+    stop = len(t) if t1 is None else int(searchsorted(t, t1, side="right"))
+    return start, stop
+
+
+def _encode_series(header: Dict[str, Any], t: ndarray, y: ndarray,
+                   dtype: str = "float32") -> bytes:
+    """Binary encoding of trajectories, see
+    :class:`~simulation_api.controller.schemas.SeriesFormat`.
+
+    Parameters
+    ----------
+    header : Dict[str, Any]
+        Fields of :class:`~simulation_api.controller.schemas.SimSeries` (or
+        :class:`~simulation_api.controller.schemas.SimData`) but ``t`` and
+        ``y``.
+    t : ndarray
+        Times.
+    y : ndarray
+        Trajectories at times ``t``.
+    dtype : str, optional
+        Type of the encoded arrays, ``"float32"`` or ``"float64"``. Default
+        is ``"float32"``.
+
+    Returns
+    -------
+    bytes
+        Encoded trajectories.
+    """
+    header = json.dumps(
+        {**header, "shape": list(y.shape), "dtype": dtype}
+    ).encode()
+    # Arrays start at a multiple of 8 bytes, so that clients can read them in
+    # place (e.g. with Float32Array or Float64Array)
+    header += b" " * (-(4 + len(header)) % 8)
+    dtype = "<f4" if dtype == "float32" else "<f8"
+    return (len(header).to_bytes(4, "little") + header
+            + asarray(t, dtype=dtype).tobytes()
+            + asarray(y, dtype=dtype).tobytes())
+
+
+######################### Initial conditions (ensembles) ######################
+
+def _check_ini_cndtn(sim_system: SimSystem,
+                     ini_cndtn: Union[List[float], List[List[float]]]) -> bool:
+    """Checks that ``ini_cndtn`` is a valid initial condition or a valid
+    (non empty) ensemble of initial conditions of ``sim_system``.
+
+    Parameters
+    ----------
+    sim_system : SimSystem
+        System to be simulated.
+    ini_cndtn : List[float] or List[List[float]]
+        Initial condition of the simulation or list of initial conditions.
+    """
+    dim = Simulations[sim_system.value].dim
+    if ini_cndtn and isinstance(ini_cndtn[0], list):
+        return all(len(member) == dim for member in ini_cndtn)
+    return len(ini_cndtn) == dim
+
@@ -0,0 +1,159 @@
+"""This module manages the pools of processes (workers) that run the
+simulations and render their plots.
+
+Simulations are CPU-bound: run in ``fastapi.BackgroundTasks`` they would share
+the GIL with the server, which would then answer requests slowly while
+simulating, and would use a single core. Here they run in a pool of
+:data:`~simulation_api.config.SIM_WORKERS` processes instead, each of them with
+its own database connections and with the heavy modules (scipy and
+matplotlib) already imported.
+
+Plots are rendered in a separate, smaller pool of
+:data:`~simulation_api.config.RENDER_WORKERS` low priority processes, so that
+rendering does not delay the simulations.
+"""
+from typing import Optional, Callable, Any
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import multiprocessing as mp
+import os
+
+from simulation_api.config import SIM_WORKERS, RENDER_WORKERS, RENDER_NICENESS
+from simulation_api.model.db_manager import engine
+from .events import _get_event_queue, _set_event_queue
+
+
+# Pool of processes that runs the simulations, see _get_executor
+_executor: Optional[ProcessPoolExecutor] = None
+
+# Pool of processes that renders the plots, see _get_render_executor
+_render_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Returns the pool of processes that runs the simulations. It is created
+    the first time it is needed.
+
+    Note
+    ----
+    Workers are spawned, not forked: the server process runs several threads
+    (event loop, thread pool, database connections) and forking it could copy
+    locks held by them, deadlocking the worker.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=SIM_WORKERS,
+                                        mp_context=mp.get_context('spawn'),
+                                        initializer=_init_worker,
+                                        initargs=(_get_event_queue(),))
+    return _executor
+
+
+def _get_render_executor() -> ProcessPoolExecutor:
+    """Returns the pool of processes that renders the plots. It is created the
+    first time it is needed. See :func:`_get_executor`."""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS, mp_context=mp.get_context('spawn'),
+            initializer=_init_renderer, initargs=(_get_event_queue(),)
+        )
+    return _render_executor
+
+
+def _init_worker(event_queue: mp.Queue) -> None:
+    """Initializes each process of :func:`_get_executor`.
+
+    The connections of the database engine inherited from the server process
+    must not be shared between processes, so they are discarded here. The
+    queue of events of the server process is set as the queue where the
+    worker publishes events (see :mod:`~simulation_api.controller.events`).
+    Then scipy and matplotlib are imported and a small figure is rendered, so
+    that the first simulation of the worker does not pay for it.
+    """
+    engine.dispose()
+    _set_event_queue(event_queue)
+
+    import scipy.integrate
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from mpl_toolkits.mplot3d import Axes3D
+
+    fig = Figure()
+    fig.add_subplot(111).plot([0, 1], [0, 1])
+    fig.savefig(BytesIO(), format='png')
+
+
+def _init_renderer(event_queue: mp.Queue) -> None:
+    """Initializes each process of :func:`_get_render_executor`: as
+    :func:`_init_worker`, with lower priority."""
+    _init_worker(event_queue)
+    os.nice(RENDER_NICENESS)
+
+
+def _submit(fn: Callable, *args: Any,
+            on_error: Optional[Callable[[BaseException], None]] = None,
+            on_success: Optional[Callable[[Any], None]] = None,
+            render: bool = False) -> Future:
+    """Submits ``fn(*args)`` to the pool of workers.
+
+    Parameters
+    ----------
+    fn : Callable
+        Function to run in a worker. It and its arguments must be picklable.
+    *args : Any
+        Arguments of ``fn``.
+    on_error : Callable or None, optional
+        Called (in the server process) with the exception raised by ``fn``,
+        if any. Default is None.
+    on_success : Callable or None, optional
+        Called (in the server process) with the value returned by ``fn``, if
+        it did not raise. Default is None.
+    render : bool, optional
+        If ``True``, ``fn`` is submitted to the pool that renders the plots
+        instead. Default is False.
+
+    Returns
+    -------
+    future : ``concurrent.futures.Future``
+        Future of the job.
+    """
+    global _executor, _render_executor
+    get_executor = _get_render_executor if render else _get_executor
+    try:
+        future = get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died abruptly, the pool can not be used anymore
+        if render:
+            _render_executor = None
+        else:
+            _executor = None
+        future = get_executor().submit(fn, *args)
+
+    if on_error or on_success:
+        def _done_callback(future: Future) -> None:
+            # Cancelled jobs did not run, they are left as they were
+            if future.cancelled():
+                return
+            exception = future.exception()
+            if exception and on_error:
+                on_error(exception)
+            elif not exception and on_success:
+                on_success(future.result())
+        future.add_done_callback(_done_callback)
+
+    return future
+
+
+def _shutdown_executor() -> None:
+    """Shuts down the pools of workers (if they were created), waiting for the
+    running simulations and plots."""
+    global _executor, _render_executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=True)
+        _render_executor = None
@@ -1,7 +1,7 @@
 """This program manages database querys.
 CRUD comes from: Create, Read, Update, and Delete.
 """
-from typing import Union, Tuple
+from typing import Union, Tuple, Optional
 
 from sqlalchemy.orm import Session
 
@@ -9,7 +9,8 @@ from .models import *
 from simulation_api.controller.schemas import *
 
 
-def _create_user(db: Session, user: UserDBSchCreate) -> UserDB:
+def _create_user(db: Session, user: UserDBSchCreate,
+                 commit: bool = True) -> UserDB:
     """Inserts ``user`` in ``users`` table.
     
     Parameters
@@ -18,6 +19,9 @@ def _create_user(db: Session, user: UserDBSchCreate) -> UserDB:
         Database Session.
     user : UserDBSchCreate
         User row in database.
+    commit : bool, optional
+        If ``False`` the changes are only flushed, so that several insertions
+        can be committed in a single transaction. Default is True.
 
     Returns
     -------
@@ -29,6 +33,9 @@ def _create_user(db: Session, user: UserDBSchCreate) -> UserDB:
     # Add db_user to session
     db.add(db_user)
     # Commit user to database (write data in disk)
+    if not commit:
+        db.flush()
+        return db_user
     db.commit()
     # Refresh db_user (this will refresh the user with other information
     # contained in db e.g. automatically generated ids) 
@@ -54,8 +61,8 @@ def _get_username(db: Session, user_id: int):
     return db.query(UserDB.username).filter(UserDB.user_id == user_id).first()
 
 
-def _create_simulation(db: Session,
-                       simulation: SimulationDBSchCreate) -> SimulationDB:
+def _create_simulation(db: Session, simulation: SimulationDBSchCreate,
+                       commit: bool = True) -> SimulationDB:
     """Inserts simulation in simulations table.
 
     Parameters
@@ -64,6 +71,9 @@ def _create_simulation(db: Session,
         Database Session.
     simulation : SimulationDBSchCreate
         Simulation row in ``simulations`` table.
+    commit : bool, optional
+        If ``False`` the changes are only flushed, so that several insertions
+        can be committed in a single transaction. Default is True.
 
     Returns
     -------
@@ -72,6 +82,9 @@ def _create_simulation(db: Session,
     """
     db_simulation = SimulationDB(**simulation.dict())
     db.add(db_simulation)
+    if not commit:
+        db.flush()
+        return db_simulation
     db.commit()
     db.refresh(db_simulation)
     return db_simulation
@@ -112,7 +125,8 @@ def _get_all_simulations(db: Session) -> Tuple[SimulationDB]:
 
 
 def _create_plot_query_values(db: Session,
-                              plot_query_params: List[PlotDBSchCreate]) -> None:
+                              plot_query_params: List[PlotDBSchCreate],
+                              commit: bool = True) -> None:
     """Insert row in plots table (contains plot query params)
 
     Parameters
@@ -121,6 +135,9 @@ def _create_plot_query_values(db: Session,
         Database Session.
     plot_query_params : List[PlotDBSchCreate]
         List of rows to be inserted in ``plots`` table.
+    commit : bool, optional
+        If ``False`` the changes are only flushed, so that several insertions
+        can be committed in a single transaction. Default is True.
 
     Returns
     -------
@@ -130,7 +147,8 @@ def _create_plot_query_values(db: Session,
         PlotDB(**plot_qp.dict()) for plot_qp in plot_query_params
     ]
     db.bulk_save_objects(db_plot_query_params)
-    db.commit()
+    if commit:
+        db.commit()
     return 
 
 
@@ -155,8 +173,492 @@ def _get_plot_query_values(db: Session, sim_id: str):
     ]
 
 
-def _create_parameters(db: Session,
-                       parameters: List[ParameterDBSchCreate]) -> None:
+def _create_sweep(db: Session, sweep_points: List[SweepDBSchCreate]) -> None:
+    """Insert the points of a parameter sweep into ``sweeps`` table.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sweep_points : List[SweepDBSchCreate]
+        Rows to be inserted in ``sweeps`` table.
+
+    Returns
+    -------
+    None
+    """
+    db_sweep_points = [
+        SweepDB(**sweep_point.dict()) for sweep_point in sweep_points
+    ]
+    db.bulk_save_objects(db_sweep_points)
+    db.commit()
+    return
+
+
+def _get_sweep_sim_ids(db: Session, sweep_id: str) -> List[str]:
+    """Return the simulation IDs of the points of a parameter sweep.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sweep_id : str
+        Sweep ID.
+
+    Returns
+    -------
+    List[str]
+        Simulation ID of each point of the sweep, ordered as the points.
+    """
+    return [
+        result[-1] for result in
+        db.query(SweepDB.sim_id).filter(SweepDB.sweep_id == sweep_id)
+                                .order_by(SweepDB.point_id.asc()).all()
+    ]
+
+
+def _get_cached_result(db: Session, request_hash: str) -> ResultCacheDB:
+    """Get entry of ``result_cache`` table with given ``request_hash``.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    request_hash : str
+        Hash of the simulation request.
+
+    Returns
+    -------
+    ``sqlalchemy.orm.Query``
+        Query with the cache entry (``None`` if there is no such entry).
+    """
+    return db.query(ResultCacheDB) \
+             .filter(ResultCacheDB.request_hash == request_hash).first()
+
+
+def _create_cached_result(db: Session,
+                          cached_result: ResultCacheDBSchCreate) -> None:
+    """Inserts (or replaces) an entry in ``result_cache`` table.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    cached_result : ResultCacheDBSchCreate
+        Row of ``result_cache`` table.
+
+    Returns
+    -------
+    None
+    """
+    # merge: two identical requests may finish at the same time
+    db.merge(ResultCacheDB(**cached_result.dict()))
+    db.commit()
+    return
+
+
+def _touch_cached_result(db: Session, request_hash: str,
+                         last_used: float) -> None:
+    """Updates the last time an entry of ``result_cache`` table was used and
+    counts the hit.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    request_hash : str
+        Hash of the simulation request.
+    last_used : float
+        UNIX timestamp.
+
+    Returns
+    -------
+    None
+    """
+    db.query(ResultCacheDB) \
+      .filter(ResultCacheDB.request_hash == request_hash) \
+      .update({ResultCacheDB.last_used: last_used,
+               ResultCacheDB.hits: ResultCacheDB.hits + 1},
+              synchronize_session=False)
+    db.commit()
+    return
+
+
+def _evict_cached_results(db: Session, max_entries: int,
+                          created_before: float,
+                          request_hashes: Optional[List[str]] = None) -> int:
+    """Deletes entries of ``result_cache`` table.
+
+    Deleted entries are: those in ``request_hashes``, those created before
+    ``created_before`` (expired) and the least recently used ones beyond the
+    first ``max_entries``.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    max_entries : int
+        Maximum number of entries kept in the table.
+    created_before : float
+        UNIX timestamp.
+    request_hashes : List[str] or None, optional
+        Entries explicitly deleted. Default is None.
+
+    Returns
+    -------
+    int
+        Number of entries deleted.
+
+    Note
+    ----
+    Only the entries are deleted: the simulations they point to, and so their
+    files, are still the results of the users that requested them. Stored
+    objects that no file links anymore are deleted by
+    :func:`~simulation_api.model.storage._collect_garbage`.
+    """
+    evicted = db.query(ResultCacheDB) \
+                .filter(ResultCacheDB.request_hash.in_(request_hashes or [])
+                        | (ResultCacheDB.created < created_before)) \
+                .delete(synchronize_session=False)
+
+    lru_hashes = db.query(ResultCacheDB.request_hash) \
+                   .order_by(ResultCacheDB.last_used.desc()) \
+                   .offset(max_entries)
+    evicted += db.query(ResultCacheDB) \
+                 .filter(ResultCacheDB.request_hash.in_(lru_hashes)) \
+                 .delete(synchronize_session=False)
+    db.commit()
+    return evicted
+
+
+def _create_jobs(db: Session, jobs: List[JobDBSchCreate]) -> None:
+    """Inserts jobs (queued simulations) in ``jobs`` table.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    jobs : List[JobDBSchCreate]
+        Rows to be inserted in ``jobs`` table.
+
+    Returns
+    -------
+    None
+    """
+    db_jobs = [JobDB(**job.dict()) for job in jobs]
+    db.bulk_save_objects(db_jobs)
+    db.commit()
+    return
+
+
+def _get_job(db: Session, sim_id: str) -> JobDB:
+    """Get job of simulation ``sim_id`` from ``jobs`` table.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sim_id : str
+        Simulation ID.
+
+    Returns
+    -------
+    ``sqlalchemy.orm.Query``
+        Query with the job (``None`` if there is no such job).
+    """
+    return db.query(JobDB).filter(JobDB.sim_id == sim_id).first()
+
+
+def _get_jobs_sim_ids(db: Session, state: JobState) -> List[str]:
+    """Get simulation IDs of jobs in a given state, in order of submission.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    state : JobState
+        State of the jobs.
+
+    Returns
+    -------
+    List[str]
+        Simulation IDs.
+    """
+    return [
+        result[-1] for result in
+        db.query(JobDB.sim_id).filter(JobDB.state == state)
+                              .order_by(JobDB.submitted.asc()).all()
+    ]
+
+
+def _claim_job(db: Session, sim_id: str, started: float) -> bool:
+    """Atomically changes the state of a job from ``queued`` to ``running``.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sim_id : str
+        Simulation ID.
+    started : float
+        UNIX timestamp.
+
+    Returns
+    -------
+    bool
+        ``True`` if the job was claimed, ``False`` if it was not queued (e.g.
+        another worker already claimed it).
+    """
+    claimed = db.query(JobDB) \
+                .filter((JobDB.sim_id == sim_id)
+                        & (JobDB.state == JobState.queued.value)) \
+                .update({JobDB.state: JobState.running.value,
+                         JobDB.started: started},
+                        synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def _count_job_attempt(db: Session, sim_id: str) -> int:
+    """Adds one to the attempts of a job.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sim_id : str
+        Simulation ID.
+
+    Returns
+    -------
+    int
+        Attempts of the job, after adding this one.
+    """
+    db.query(JobDB).filter(JobDB.sim_id == sim_id) \
+                   .update({JobDB.attempts: JobDB.attempts + 1},
+                           synchronize_session=False)
+    db.commit()
+    return db.query(JobDB.attempts).filter(JobDB.sim_id == sim_id).scalar()
+
+
+def _finish_job(db: Session, sim_id: str, finished: float) -> None:
+    """Changes the state of a job to ``done``, unless it was ``cancelled``.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sim_id : str
+        Simulation ID.
+    finished : float
+        UNIX timestamp.
+
+    Returns
+    -------
+    None
+    """
+    db.query(JobDB) \
+      .filter((JobDB.sim_id == sim_id)
+              & (JobDB.state != JobState.cancelled.value)) \
+      .update({JobDB.state: JobState.done.value, JobDB.finished: finished},
+              synchronize_session=False)
+    db.commit()
+    return
+
+
+def _cancel_job(db: Session, sim_id: str, state: JobState,
+                finished: float) -> bool:
+    """Atomically changes the state of a job from ``state`` to ``cancelled``.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sim_id : str
+        Simulation ID.
+    state : JobState
+        State the job must be in to be cancelled (``queued`` or ``running``).
+    finished : float
+        UNIX timestamp.
+
+    Returns
+    -------
+    bool
+        ``True`` if the job was cancelled, ``False`` if it was not in state
+        ``state``.
+    """
+    cancelled = db.query(JobDB) \
+                  .filter((JobDB.sim_id == sim_id) & (JobDB.state == state)) \
+                  .update({JobDB.state: JobState.cancelled.value,
+                           JobDB.finished: finished},
+                          synchronize_session=False)
+    db.commit()
+    return cancelled == 1
+
+
+def _count_pending_jobs(db: Session, username: Optional[str] = None) -> int:
+    """Counts the ``queued`` and ``running`` jobs.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    username : str or None, optional
+        If given, only the jobs of this user are counted. Default is None.
+
+    Returns
+    -------
+    int
+        Number of pending jobs.
+    """
+    query = db.query(JobDB).filter(
+        JobDB.state.in_([JobState.queued.value, JobState.running.value])
+    )
+    if username is not None:
+        query = query.filter(JobDB.username == username)
+    return query.count()
+
+
+def _count_finished_jobs(db: Session, finished_after: float) -> int:
+    """Counts the jobs that finished after a given time.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    finished_after : float
+        UNIX timestamp.
+
+    Returns
+    -------
+    int
+        Number of finished jobs.
+    """
+    return db.query(JobDB).filter(JobDB.finished > finished_after).count()
+
+
+def _requeue_running_jobs(db: Session) -> int:
+    """Changes the state of all ``running`` jobs back to ``queued``.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+
+    Returns
+    -------
+    int
+        Number of jobs queued again.
+    """
+    requeued = db.query(JobDB) \
+                 .filter(JobDB.state == JobState.running.value) \
+                 .update({JobDB.state: JobState.queued.value,
+                          JobDB.started: None},
+                         synchronize_session=False)
+    db.commit()
+    return requeued
+
+
+def _get_job_progress(db: Session, sim_id: str) -> JobProgressDB:
+    """Get progress of a job.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    sim_id : str
+        Simulation ID.
+
+    Returns
+    -------
+    ``sqlalchemy.orm.Query``
+        Query with the progress (``None`` if there is none yet).
+    """
+    return db.query(JobProgressDB) \
+             .filter(JobProgressDB.sim_id == sim_id).first()
+
+
+def _update_job_progress(db: Session, progress: JobProgressDBSchCreate) -> None:
+    """Inserts or replaces the progress of a job in ``job_progress`` table.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    progress : JobProgressDBSchCreate
+        Row of ``job_progress`` table.
+
+    Returns
+    -------
+    None
+    """
+    db.merge(JobProgressDB(**progress.dict()))
+    db.commit()
+    return
+
+
+def _get_cost_stats(db: Session, system: str, method: str) -> CostStatsDB:
+    """Get cost statistics of a system and integration method.
+
+    Rows already loaded in the session are not queried again, which keeps
+    cheap the cost checks of many requests (e.g. batches or sweeps).
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    system : str
+        Simulated system.
+    method : str
+        Integration method.
+
+    Returns
+    -------
+    ``sqlalchemy.orm.Query``
+        Query with the statistics (``None`` if there are none yet).
+    """
+    return db.query(CostStatsDB).get((system, method))
+
+
+def _get_all_cost_stats(db: Session) -> List[CostStatsDB]:
+    """Get cost statistics of all the systems and integration methods (a few
+    rows), with a single query.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+
+    Returns
+    -------
+    List[CostStatsDB]
+        Statistics of each system and integration method that has any.
+    """
+    return db.query(CostStatsDB).all()
+
+
+def _update_cost_stats(db: Session, cost_stats: CostStatsDBSchCreate) -> None:
+    """Inserts or replaces the cost statistics of a system and integration
+    method in ``cost_stats`` table.
+
+    Parameters
+    ----------
+    db : Session
+        Database Session.
+    cost_stats : CostStatsDBSchCreate
+        Row of ``cost_stats`` table.
+
+    Returns
+    -------
+    None
+    """
+    db.merge(CostStatsDB(**cost_stats.dict()))
+    db.commit()
+    return
+
+
+def _create_parameters(db: Session, parameters: List[ParameterDBSchCreate],
+                       commit: bool = True) -> None:
     """Insert parameter entry into parameters table.
     
     Parameters
@@ -165,6 +667,9 @@ def _create_parameters(db: Session,
         Database Session.
     parameters: List[ParameterDBSchCreate]
         Parameter row in ``parameters``' table.
+    commit : bool, optional
+        If ``False`` the changes are only flushed, so that several insertions
+        can be committed in a single transaction. Default is True.
     
     Returns
     -------
@@ -174,11 +679,14 @@ def _create_parameters(db: Session,
         ParameterDB(**parameter.dict()) for parameter in parameters
     ]
     db.bulk_save_objects(db_parameters)
-    db.commit()
+    if commit:
+        db.commit()
     return
 
 def _get_parameters(db: Session, sim_id: str,
-                    param_type: ParamType) -> Union[List[float], Dict[str, float]]:
+                    param_type: ParamType) -> Union[List[float],
+                                                    List[List[float]],
+                                                    Dict[str, float]]:
     """Get parameters from parameters table.
     
     Parameters
@@ -192,9 +700,10 @@ def _get_parameters(db: Session, sim_id: str,
 
     Returns
     -------
-    List[float] or Dict[str, float]
-        ``list`` of initial conditions or ``dict`` mapping parameter names to
-        parameter values.
+    List[float] or List[List[float]] or Dict[str, float]
+        ``list`` of initial conditions (``list`` of ``list`` for ensembles of
+        initial conditions) or ``dict`` mapping parameter names to parameter
+        values.
     """
     query = db.query(ParameterDB) \
                 .filter((ParameterDB.param_type == param_type) & (ParameterDB.sim_id == sim_id)) \
@@ -202,6 +711,13 @@ def _get_parameters(db: Session, sim_id: str,
                         .all()
 
     if param_type == ParamType.ini_cndtn:
+        # Members of ensembles are stored flattened, with the index of the
+        # member in param_key
+        if query and query[0].param_key is not None:
+            members = {}
+            for Param in query:
+                members.setdefault(int(Param.param_key), []).append(Param.value)
+            return [members[member_id] for member_id in sorted(members)]
         return [Param.value for Param in query]
     else:
         return {Param.param_key: Param.value for Param in query}
@@ -1,5 +1,6 @@
 """This program creates all the models and tables in the database"""
-from sqlalchemy import (Column, Integer, String, Boolean, Float, ForeignKey)
+from sqlalchemy import (Column, Integer, String, Boolean, Float, ForeignKey,
+                        Text)
 from sqlalchemy.orm import relationship
 
 from .db_manager import Base
@@ -140,9 +141,12 @@ class ParameterDB(Base):
     param_type = Column(String(17), nullable=False)
     """Parameter type, wether ``'initial condition'`` or ``'parameter'``."""
     # if param_type = "parameter" param_key is the name of the parameter
+    # if param_type = "initial condition" param_key is the index of the member
+    # of the ensemble (None if the initial condition is not an ensemble)
     param_key = Column(String(5))
     """Name of parameter. Must be one of the required parameters related to
-    the system being simulated."""
+    the system being simulated. For initial conditions of ensembles, index of
+    the member of the ensemble."""
     # if param_type = "initial condition" then init_cndtn_id is position in the array
     ini_cndtn_id = Column(Integer())
     """Initial condition position in array of initial conditions."""
@@ -160,4 +164,180 @@ class ParameterDB(Base):
                              f"param_type={self.param_type}, " \
                              f"param_key={self.param_key}, " \
                              f"init_cndtn_id={self.init_cndtn_id}, " \
-                             f"value={self.param_value})"
\ No newline at end of file
+                             f"value={self.param_value})"
+
+
+class SweepDB(Base):
+    """Parameter sweeps table model.
+
+    Maps each parameter sweep to the simulations of its points.
+
+    \f
+    Note
+    ----
+    ``sim_id`` is not a foreign key: rows of ``simulations`` table are only
+    created when each simulation finishes.
+    """
+    __tablename__ = "sweeps"
+
+    # Columns
+    sweep_point_id = Column(Integer(), primary_key=True)
+    """Primary key."""
+    sweep_id = Column(String(32), nullable=False, index=True)
+    """Sweep ID."""
+    sim_id = Column(String(32), nullable=False)
+    """Simulation ID of the point."""
+    point_id = Column(Integer(), nullable=False)
+    """Position of the point in the sweep."""
+
+    def __repr__(self):
+        return f"SweepDB(sweep_point_id={self.sweep_point_id}, " \
+                        f"sweep_id={self.sweep_id}, " \
+                        f"sim_id={self.sim_id}, " \
+                        f"point_id={self.point_id})"
+
+
+class ResultCacheDB(Base):
+    """Cache of simulation results table model.
+
+    Maps the hash of a simulation request to the simulation that holds its
+    results, so that identical requests are not simulated again.
+    """
+    __tablename__ = "result_cache"
+
+    # Columns
+    request_hash = Column(String(64), primary_key=True, nullable=False)
+    """SHA-256 hash of the canonical form of the simulation request."""
+    sim_id = Column(String(32), ForeignKey("simulations.sim_id"), nullable=False)
+    """Simulation ID of the simulation that holds the results."""
+    created = Column(Float, nullable=False)
+    """Time (UNIX timestamp) at which the entry was created."""
+    last_used = Column(Float, nullable=False, index=True)
+    """Time (UNIX timestamp) at which the entry was last used."""
+    hits = Column(Integer(), nullable=False, default=0)
+    """Number of requests served by this entry."""
+
+    def __repr__(self):
+        return f"ResultCacheDB(request_hash={self.request_hash}, " \
+                              f"sim_id={self.sim_id}, " \
+                              f"created={self.created}, " \
+                              f"last_used={self.last_used}, " \
+                              f"hits={self.hits})"
+
+
+class JobDB(Base):
+    """Jobs table model.
+
+    Queue of simulations: a row is created when a simulation is requested and
+    it is claimed by a worker when it starts running. Since the queue lives in
+    the database, it survives restarts of the server.
+
+    \f
+    Note
+    ----
+    ``sim_id`` is not a foreign key: rows of ``simulations`` table are only
+    created when each simulation finishes.
+    """
+    __tablename__ = "jobs"
+
+    # Columns
+    sim_id = Column(String(32), primary_key=True, nullable=False)
+    """Simulation ID."""
+    user_id = Column(Integer(), nullable=False)
+    """User ID."""
+    username = Column(String(20), nullable=False)
+    """Username."""
+    system = Column(String(100), nullable=False)
+    """Simulated system."""
+    method = Column(String(10))
+    """Integration method."""
+    state = Column(String(10), nullable=False, index=True)
+    """State of the job, see :class:`~simulation_api.controller.schemas.JobState`."""
+    request = Column(Text(), nullable=False)
+    """Simulation request (JSON)."""
+    submitted = Column(Float, nullable=False)
+    """Time (UNIX timestamp) at which the job was queued."""
+    started = Column(Float)
+    """Time (UNIX timestamp) at which a worker claimed the job."""
+    finished = Column(Float)
+    """Time (UNIX timestamp) at which the job finished."""
+    attempts = Column(Integer(), nullable=False, default=0)
+    """Number of times the job was submitted to the pool of workers again
+    because it failed before starting."""
+
+    def __repr__(self):
+        return f"JobDB(sim_id={self.sim_id}, " \
+                     f"user_id={self.user_id}, " \
+                     f"username={self.username}, " \
+                     f"system={self.system}, " \
+                     f"method={self.method}, " \
+                     f"state={self.state}, " \
+                     f"submitted={self.submitted}, " \
+                     f"started={self.started}, " \
+                     f"finished={self.finished}, " \
+                     f"attempts={self.attempts})"
+
+
+class JobProgressDB(Base):
+    """Job progress table model.
+
+    Progress of running simulations, published by the workers at a bounded
+    rate (see :data:`~simulation_api.config.PROGRESS_INTERVAL`).
+    """
+    __tablename__ = "job_progress"
+
+    # Columns
+    sim_id = Column(String(32), primary_key=True, nullable=False)
+    """Simulation ID."""
+    fraction = Column(Float, nullable=False)
+    """Fraction of ``t_span`` already integrated."""
+    elapsed = Column(Float, nullable=False)
+    """Wall time (seconds) since the integration started."""
+    nfev = Column(Integer(), nullable=False)
+    """Evaluations of the right hand side of the system so far."""
+    eta = Column(Float)
+    """Estimated time (seconds) until the integration finishes."""
+    updated = Column(Float, nullable=False)
+    """Time (UNIX timestamp) of the last update."""
+
+    def __repr__(self):
+        return f"JobProgressDB(sim_id={self.sim_id}, " \
+                             f"fraction={self.fraction}, " \
+                             f"elapsed={self.elapsed}, " \
+                             f"nfev={self.nfev}, " \
+                             f"eta={self.eta}, " \
+                             f"updated={self.updated})"
+
+
+class CostStatsDB(Base):
+    """Cost statistics table model.
+
+    Moving averages of the cost of the simulations of each system and
+    integration method. Used to estimate the cost of new requests, see
+    :mod:`~simulation_api.controller.cost`.
+    """
+    __tablename__ = "cost_stats"
+
+    # Columns
+    system = Column(String(100), primary_key=True)
+    """Simulated system."""
+    method = Column(String(10), primary_key=True)
+    """Integration method."""
+    n_samples = Column(Integer(), nullable=False)
+    """Number of simulations averaged."""
+    nfev_per_time = Column(Float, nullable=False)
+    """Evaluations of the right hand side per unit of simulated time."""
+    seconds_per_fev = Column(Float, nullable=False)
+    """Seconds per evaluation of the right hand side, per member of the
+    ensemble."""
+    seconds_per_sample = Column(Float, nullable=False)
+    """Seconds spent storing each point of the solution, per member of the
+    ensemble."""
+
+    def __repr__(self):
+        return f"CostStatsDB(system={self.system}, " \
+                           f"method={self.method}, " \
+                           f"n_samples={self.n_samples}, " \
+                           f"nfev_per_time={self.nfev_per_time}, " \
+                           f"seconds_per_fev={self.seconds_per_fev}, " \
+                           f"seconds_per_sample={self.seconds_per_sample})"
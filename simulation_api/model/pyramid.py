@@ -0,0 +1,98 @@
+"""This module builds the min-max pyramids of the trajectories of the
+simulations, stored along with their results (see
+:mod:`simulation_api.model.results`).
+
+A min-max pyramid holds, for buckets of consecutive points of several sizes,
+the indices of the minimum and the maximum of each series in each bucket.
+The extrema of any range of the series are then found reading a few buckets
+of the pyramid, instead of the whole range: trajectories are decimated with it
+(see :func:`~simulation_api.controller.decimation._pyramid_indices`) in a time
+proportional to the number of points served, not to the number of points
+stored.
+"""
+from typing import Tuple, List
+
+import numpy as np
+
+
+# Size of the buckets of the finest level of the min-max pyramids
+_PYRAMID_BASE = 4
+
+
+def _pyramid_levels(n_total: int) -> List[Tuple[int, int, int]]:
+    """Levels of the min-max pyramid of series of ``n_total`` points.
+
+    Level ``k`` splits the series in buckets of ``_PYRAMID_BASE * 2**k``
+    consecutive points (the last one may be shorter), down to a single bucket.
+
+    Returns
+    -------
+    List[Tuple[int, int, int]]
+        Size of the buckets, offset of the level in the pyramid and number of
+        buckets of each level, from the finest to the coarsest one.
+    """
+    levels = []
+    size, offset = _PYRAMID_BASE, 0
+    while True:
+        n_buckets = -(-n_total // size)
+        levels.append((size, offset, n_buckets))
+        if n_buckets <= 1:
+            return levels
+        offset += n_buckets
+        size *= 2
+
+
+def _minmax_pyramid(y: np.ndarray) -> np.ndarray:
+    """Min-max pyramid of series.
+
+    For each level of :func:`_pyramid_levels` and each bucket, the pyramid
+    holds the indices of the minimum and the maximum of each series in the
+    bucket. Each level is built from the previous one, the size of the pyramid
+    is half the number of points of the series.
+
+    Parameters
+    ----------
+    y : ndarray, shape (..., N)
+        Series.
+
+    Returns
+    -------
+    ndarray, shape (2, S, L)
+        Indices of the minima (``[0]``) and maxima (``[1]``) of each one of
+        the ``S`` series (``y`` flattened but the last axis) in each bucket,
+        levels one after the other.
+    """
+    y = np.asarray(y)
+    n_total = y.shape[-1]
+    series = y.reshape(-1, n_total)
+    n_series = series.shape[0]
+    levels = _pyramid_levels(n_total)
+    dtype = np.int32 if n_total < 2**31 else np.int64
+    pyramid = np.empty((2, n_series, levels[-1][1] + levels[-1][2]),
+                       dtype=dtype)
+
+    # Finest level, from the series
+    size, offset, n_buckets = levels[0]
+    padding = n_buckets * size - n_total
+    buckets = np.pad(series, [(0, 0), (0, padding)], mode='edge')
+    buckets = buckets.reshape(n_series, n_buckets, size)
+    starts = np.arange(n_buckets) * size
+    level = pyramid[:, :, offset:offset + n_buckets]
+    level[0] = np.minimum(buckets.argmin(axis=-1) + starts, n_total - 1)
+    level[1] = np.minimum(buckets.argmax(axis=-1) + starts, n_total - 1)
+
+    # Each bucket of the next levels is made of two buckets of the previous one
+    for (_, offset, n_buckets), (_, prev_offset, n_prev) in zip(levels[1:],
+                                                                levels):
+        for k, choose in enumerate((np.argmin, np.argmax)):
+            prev = pyramid[k, :, prev_offset:prev_offset + n_prev]
+            prev = np.pad(prev, [(0, 0), (0, 2 * n_buckets - n_prev)],
+                          mode='edge').reshape(n_series, n_buckets, 2)
+            values = np.take_along_axis(
+                series, prev.reshape(n_series, -1), axis=-1
+            ).reshape(n_series, n_buckets, 2)
+            pyramid[k, :, offset:offset + n_buckets] = np.take_along_axis(
+                prev, choose(values, axis=-1)[..., None], axis=-1
+            )[..., 0]
+
+    return pyramid
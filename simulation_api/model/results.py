@@ -0,0 +1,219 @@
+"""This module stores the results of the simulations –the ``OdeResult``
+returned by :meth:`~simulation_api.simulation.simulations.Simulation.simulate`–
+on disk, in a columnar layout.
+
+The results of each simulation are stored in the directory
+``<PATH_RESULTS>/<sim_id[:2]>/<sim_id>/`` (see
+:mod:`simulation_api.model.storage`):
+
+* ``t.npy`` and ``y.npy``: the arrays of the solution in NumPy's ``.npy``
+  format, i.e. a small header followed by the contiguous array.
+* ``meta.json``: the rest of the fields of the ``OdeResult`` (``nfev``,
+  ``message``, ``success``...). Fields that are not JSON scalars (e.g. dense
+  output) are not used by the API and are not stored.
+* ``pyramid.npy``: min-max pyramid of the trajectories ``y`` (see
+  :mod:`simulation_api.model.pyramid`), used to serve decimated views of
+  them.
+* ``results.pickle.gz``: the results as a pickle compressed with gzip, the
+  format in which they are downloaded. It is written the first time it is
+  requested (see :func:`_export_pickle_gzip`).
+
+The arrays are read as memory maps (see :func:`_load_results`), so only the
+parts actually used are read from disk: plotting a few members of an ensemble
+or serving a decimated trajectory does not need to deserialize the whole
+solution, as pickles did, and a window of the solution is found by binary
+search on ``t`` reading a few pages of it. Pickles are still available for
+download, they are generated from the stored arrays (see
+:func:`_export_pickle`).
+
+Results stored as pickles by older versions of the API can still be read.
+"""
+from typing import Dict, Any, Optional
+import gzip
+import json
+import os
+import pickle as pkl
+import shutil
+from io import BytesIO
+
+import numpy as np
+from scipy.integrate._ivp.ivp import OdeResult
+
+from simulation_api.config import PATH_RESULTS, PATH_PICKLES
+from .storage import _sharded_path, _write_file, _link_file, _tmp_path
+from .pyramid import _minmax_pyramid
+
+
+# Compression level of the pickles downloaded compressed. Each pickle is
+# compressed once, but higher levels are much slower for little gain: the
+# trajectories hardly compress
+_GZIP_LEVEL = 6
+
+
+def _results_dir(sim_id: str) -> str:
+    """Directory where the results of simulation ``sim_id`` are stored."""
+    return _sharded_path(PATH_RESULTS, sim_id, sim_id)
+
+
+def _legacy_pickle_path(sim_id: str) -> str:
+    """Path of the results of simulation ``sim_id`` stored as a pickle (older
+    versions of the API)."""
+    return PATH_PICKLES + sim_id + ".pickle"
+
+
+def _save_results(sim_id: str, sim_results: Dict[str, Any]) -> None:
+    """Stores the results of a simulation.
+
+    Files are written (see :func:`~simulation_api.model.storage._write_file`)
+    in a temporary directory which is then renamed, so the results of a
+    simulation are either missing or complete. Results already stored (e.g.
+    a recovered job that was interrupted after storing them) are kept.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID.
+    sim_results : Dict[str, Any]
+        Results of the simulation, as returned by ``dict(OdeResult)``.
+    """
+    if os.path.isdir(_results_dir(sim_id)):
+        return
+
+    tmp_dir = _tmp_path(_results_dir(sim_id))
+
+    meta = {}
+    for key, value in sim_results.items():
+        if key == "t":
+            _write_file(os.path.join(tmp_dir, "t.npy"), _npy_bytes(value))
+        elif key == "y":
+            _write_file(os.path.join(tmp_dir, "y.npy"), _npy_bytes(value))
+            _write_file(os.path.join(tmp_dir, "pyramid.npy"),
+                        _npy_bytes(_minmax_pyramid(value)))
+        elif isinstance(value, np.generic):
+            meta[key] = value.item()
+        elif value is None or isinstance(value, (bool, int, float, str)):
+            meta[key] = value
+
+    _write_file(os.path.join(tmp_dir, "meta.json"),
+                json.dumps(meta, sort_keys=True).encode())
+
+    _rename_results_dir(tmp_dir, _results_dir(sim_id))
+
+
+def _rename_results_dir(tmp_dir: str, results_dir: str) -> None:
+    """Renames the temporary directory ``tmp_dir`` to ``results_dir``. If
+    ``results_dir`` was created meanwhile it is kept (it is complete, as any
+    results directory) and ``tmp_dir`` is removed."""
+    try:
+        os.rename(tmp_dir, results_dir)
+    except OSError:
+        if not os.path.isdir(results_dir):
+            raise
+        shutil.rmtree(tmp_dir)
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    """``array`` (C order) in NumPy's ``.npy`` format."""
+    buffer = BytesIO()
+    np.save(buffer, np.ascontiguousarray(array))
+    return buffer.getvalue()
+
+
+def _results_exist(sim_id: str) -> bool:
+    """Whether the results of simulation ``sim_id`` are stored."""
+    return os.path.isdir(_results_dir(sim_id)) \
+           or os.path.isfile(_legacy_pickle_path(sim_id))
+
+
+def _load_results(sim_id: str, mmap: bool = True) -> OdeResult:
+    """Loads the results of a simulation.
+
+    Parameters
+    ----------
+    sim_id : str
+        Simulation ID.
+    mmap : bool, optional
+        If ``True`` the arrays are memory maps (read only), otherwise they are
+        read into memory. Default is True.
+
+    Returns
+    -------
+    OdeResult
+        Results of the simulation.
+    """
+    results_dir = _results_dir(sim_id)
+    if not os.path.isdir(results_dir):
+        with open(_legacy_pickle_path(sim_id), "rb") as file:
+            return OdeResult(**pkl.load(file))
+
+    with open(os.path.join(results_dir, "meta.json")) as file:
+        meta = json.load(file)
+    mmap_mode = "r" if mmap else None
+    y = np.load(os.path.join(results_dir, "y.npy"), mmap_mode=mmap_mode)
+    t = np.load(os.path.join(results_dir, "t.npy"), mmap_mode=mmap_mode)
+    return OdeResult(t=t, y=y, **meta)
+
+
+def _load_pyramid(sim_id: str) -> Optional[np.ndarray]:
+    """Loads (memory maps) the min-max pyramid of the trajectories of a
+    simulation, ``None`` if the results were stored without pyramid."""
+    path = os.path.join(_results_dir(sim_id), "pyramid.npy")
+    if not os.path.isfile(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def _export_pickle(sim_id: str) -> bytes:
+    """Results of a simulation as a pickle of ``dict(OdeResult)``, the format
+    in which they were downloaded from older versions of the API."""
+    return pkl.dumps(dict(_load_results(sim_id, mmap=False)))
+
+
+def _export_pickle_gzip(sim_id: str) -> Optional[str]:
+    """Path of the pickle of the results of a simulation (see
+    :func:`_export_pickle`) compressed with gzip, ``results.pickle.gz`` in the
+    directory of the results.
+
+    It is written (atomically, see
+    :func:`~simulation_api.model.storage._write_file`) the first time it is
+    requested, and then served as it is. Results that are never downloaded
+    do not take the disk space of a compressed copy.
+
+    Returns
+    -------
+    str or None
+        Path of the compressed pickle, ``None`` if the results were stored as
+        a pickle by an older version of the API.
+    """
+    results_dir = _results_dir(sim_id)
+    if not os.path.isdir(results_dir):
+        return None
+    path = os.path.join(results_dir, "results.pickle.gz")
+    if not os.path.isfile(path):
+        # Without time stamp, identical results have identical files
+        _write_file(path, gzip.compress(_export_pickle(sim_id),
+                                        compresslevel=_GZIP_LEVEL, mtime=0))
+    return path
+
+
+def _link_results(src_sim_id: str, dst_sim_id: str) -> None:
+    """Stores the results of simulation ``src_sim_id`` as the results of
+    simulation ``dst_sim_id``, with hard links (copies if the file system does
+    not support hard links). As in :func:`_save_results`, the results of
+    ``dst_sim_id`` are either missing or complete."""
+    src_dir = _results_dir(src_sim_id)
+    if not os.path.isdir(src_dir):
+        _link_file(_legacy_pickle_path(src_sim_id),
+                   _legacy_pickle_path(dst_sim_id))
+        return
+
+    tmp_dir = _tmp_path(_results_dir(dst_sim_id))
+    try:
+        for name in os.listdir(src_dir):
+            _link_file(os.path.join(src_dir, name),
+                       os.path.join(tmp_dir, name))
+    except BaseException:
+        # The links already made are removed, the objects they link are kept
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _rename_results_dir(tmp_dir, _results_dir(dst_sim_id))
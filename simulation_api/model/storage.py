@@ -0,0 +1,135 @@
+"""This module stores the files of the results of the simulations (arrays,
+pickles and plots) on disk.
+
+* Sharding: the files of a simulation are stored in a subdirectory named after
+  the first characters of its simulation ID, ``<root>/<sim_id[:2]>/`` (see
+  :func:`_sharded_path`). Simulation IDs are random, so files are evenly
+  spread and no directory grows to hundreds of thousands of entries, which
+  would slow down every lookup in it.
+* Content addressing: the content of each file is stored once, in
+  ``<PATH_OBJECTS>/<hash[:2]>/<hash>`` (``hash`` is the SHA-256 of the
+  content), and the files of the simulations are hard links to it (see
+  :func:`_write_file`). Identical files, e.g. the plots of identical results,
+  take disk space only once. The file system counts the links of each
+  object: an object with a single link is not used by any simulation anymore
+  (e.g. its files were replaced, or a write was interrupted) and it is deleted
+  by :func:`_collect_garbage`.
+* Atomic writes: files are written (or linked) with a temporary name and then
+  renamed, so a file is either missing or complete. Routes never serve a half
+  written file.
+
+Files stored by older versions of the API, without sharding, are still found.
+"""
+from hashlib import sha256
+import os
+import shutil
+import time
+from uuid import uuid4
+
+from simulation_api.config import PATH_OBJECTS, OBJECTS_GC_INTERVAL
+
+
+# Number of characters of the simulation ID (or hash) that name the shards
+_SHARD_CHARS = 2
+
+# Objects younger than this (in seconds) are never collected: they may have
+# just been written and not linked yet, see _write_file
+_GC_MIN_AGE = 60
+
+# Time (UNIX timestamp) of the last collection of this process, see
+# _collect_garbage
+_last_gc = 0.
+
+
+def _sharded_path(root: str, sim_id: str, name: str) -> str:
+    """Path of the file (or directory) ``name`` of simulation ``sim_id`` in
+    directory ``root``: ``<root>/<sim_id[:2]>/<name>``, or ``<root>/<name>``
+    if it was stored there by an older version of the API."""
+    path = os.path.join(root, sim_id[:_SHARD_CHARS], name)
+    unsharded_path = os.path.join(root, name)
+    if not os.path.exists(path) and os.path.exists(unsharded_path):
+        return unsharded_path
+    return path
+
+
+def _write_file(path: str, data: bytes) -> None:
+    """Writes ``data`` in ``path``, atomically and content addressed.
+
+    If there is no object with the same content it is written, then ``path``
+    is linked to the object (see :func:`_link_file`).
+    """
+    digest = sha256(data).hexdigest()
+    object_path = os.path.join(PATH_OBJECTS, digest[:_SHARD_CHARS], digest)
+    # Objects are written atomically too, if it exists it is complete
+    if not os.path.isfile(object_path):
+        _write_object(object_path, data)
+    try:
+        _link_file(object_path, path)
+    except FileNotFoundError:
+        # The object was collected meanwhile (see _collect_garbage)
+        _write_object(object_path, data)
+        _link_file(object_path, path)
+
+
+def _write_object(object_path: str, data: bytes) -> None:
+    """Writes the object ``object_path`` atomically."""
+    tmp_path = _tmp_path(object_path)
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, object_path)
+
+
+def _link_file(src: str, dst: str) -> None:
+    """Hard links ``dst`` to ``src`` (copies ``src`` if the file system does
+    not support hard links), atomically: ``dst`` is replaced if it exists."""
+    tmp_path = _tmp_path(dst)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def _tmp_path(path: str) -> str:
+    """Unique temporary path in the directory of ``path`` (which is created if
+    needed), so that it can be renamed to ``path``."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return f"{path}.{uuid4().hex}.tmp"
+
+
+def _collect_garbage(force: bool = False) -> int:
+    """Deletes the stored objects that no file links anymore (link count 1).
+
+    Walking all the objects takes a while, so it is done at most once every
+    :data:`~simulation_api.config.OBJECTS_GC_INTERVAL` seconds (per process),
+    unless ``force``. Objects written in the last ``_GC_MIN_AGE`` seconds are
+    kept, they may not be linked yet.
+
+    Parameters
+    ----------
+    force : bool, optional
+        Collect even if the last collection was recent. Default is False.
+
+    Returns
+    -------
+    int
+        Number of objects deleted.
+    """
+    global _last_gc
+    now = time.time()
+    if not force and now - _last_gc < OBJECTS_GC_INTERVAL:
+        return 0
+    _last_gc = now
+
+    deleted = 0
+    for root, _, names in os.walk(PATH_OBJECTS):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink == 1 and now - stat.st_mtime > _GC_MIN_AGE:
+                os.remove(path)
+                deleted += 1
+    return deleted
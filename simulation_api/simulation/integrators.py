@@ -0,0 +1,180 @@
+"""This module defines fixed-step integrators implemented with NumPy.
+
+They are an alternative to the adaptive methods of ``scipy.integrate.solve_ivp``
+and take exactly one step between consecutive times of ``t`` (the grid where
+the solution is stored), writing the solution directly into preallocated
+output arrays. Since there is no step size control nor dense output
+interpolation, they are cheaper than ``solve_ivp`` when a fine output grid is
+requested.
+
+Two kinds of integrators are available:
+
+* :func:`rk4`: classic 4th order Runge-Kutta, valid for any dynamical system
+  :math:`\\frac{d\\mathbf{y}}{dt} = \\mathbf{f}(t, \\mathbf{y})`.
+* :func:`leapfrog` and :func:`yoshida4`: symplectic integrators of order 2 and
+  4, valid for separable Hamiltonian systems
+  :math:`H(q, p) = T(p) + V(q)`. They are defined in terms of
+  :math:`\\frac{dq}{dt} = \\frac{\\partial H}{\\partial p}` and
+  :math:`\\frac{dp}{dt} = - \\frac{\\partial H}{\\partial q}`, and conserve
+  the energy of the system (up to a bounded oscillation) for arbitrarily long
+  runs.
+
+The state arrays may have shape ``(n,)`` or ``(n, M)`` (``M`` columns are
+integrated at once, e.g. the members of an ensemble). The output arrays have
+the shape of the state plus one last axis of length ``len(t)``.
+"""
+from typing import Callable
+
+import numpy as np
+
+
+# Coefficients of 4th order Yoshida integrator (drift: c, kick: d)
+_cbrt2 = 2 ** (1 / 3)
+_w1 = 1 / (2 - _cbrt2)
+_w0 = - _cbrt2 * _w1
+_yoshida_c = (_w1 / 2, (_w0 + _w1) / 2, (_w0 + _w1) / 2, _w1 / 2)
+_yoshida_d = (_w1, _w0, _w1)
+
+
+def _scalar_state(q0: np.ndarray, p0: np.ndarray, q_out: np.ndarray,
+                  p_out: np.ndarray) -> tuple:
+    """Prepares the state and output arrays of the symplectic integrators.
+
+    A single degree of freedom of a single simulation (``q0.shape == (1,)``)
+    is integrated with Python floats, which are much faster than NumPy arrays
+    of one element. The output arrays are then replaced by their only row.
+    """
+    q = np.array(q0, dtype=float)
+    p = np.array(p0, dtype=float)
+    if q.shape == (1,):
+        return float(q[0]), float(p[0]), q_out[0], p_out[0]
+    return q, p, q_out, p_out
+
+
+def rk4(fun: Callable, t: np.ndarray, y0: np.ndarray,
+        y_out: np.ndarray) -> int:
+    """Classic 4th order Runge-Kutta integrator.
+
+    Parameters
+    ----------
+    fun : callable
+        Right-hand side of the system, ``fun(t, y)``. It must accept and
+        return arrays with the shape of ``y0``.
+    t : ndarray, shape (n_points,)
+        Sorted times at which the solution is stored. One step is taken
+        between each pair of consecutive times.
+    y0 : ndarray, shape (n,) or (n, M)
+        Initial state, at time ``t[0]``.
+    y_out : ndarray, shape y0.shape + (n_points,)
+        Preallocated array where the solution is written.
+
+    Returns
+    -------
+    nfev : int
+        Number of evaluations of ``fun``.
+    """
+    y = np.array(y0, dtype=float)
+    y_out[..., 0] = y
+
+    # Python floats are faster than NumPy scalars
+    t = np.asarray(t, dtype=float).tolist()
+    for i, h in enumerate(np.diff(t).tolist()):
+        t_i = t[i]
+        k1 = fun(t_i, y)
+        k2 = fun(t_i + h / 2, y + (h / 2) * k1)
+        k3 = fun(t_i + h / 2, y + (h / 2) * k2)
+        k4 = fun(t_i + h, y + h * k3)
+        y = y + (h / 6) * (k1 + 2 * k2 + 2 * k3 + k4)
+        y_out[..., i + 1] = y
+
+    return 4 * (len(t) - 1)
+
+
+def leapfrog(dqdt: Callable, dpdt: Callable, t: np.ndarray, q0: np.ndarray,
+             p0: np.ndarray, q_out: np.ndarray, p_out: np.ndarray) -> int:
+    """Velocity Verlet (leapfrog, kick-drift-kick) symplectic integrator of
+    order 2.
+
+    Parameters
+    ----------
+    dqdt : callable
+        ``dqdt(t, p)``, derivative of the generalised coordinates,
+        :math:`\\partial H / \\partial p`.
+    dpdt : callable
+        ``dpdt(t, q)``, derivative of the generalised momenta,
+        :math:`- \\partial H / \\partial q`.
+    t : ndarray, shape (n_points,)
+        Sorted times at which the solution is stored. One step is taken
+        between each pair of consecutive times.
+    q0, p0 : ndarray, shape (d,) or (d, M)
+        Initial generalised coordinates and momenta, at time ``t[0]``.
+    q_out, p_out : ndarray, shape q0.shape + (n_points,)
+        Preallocated arrays where the solution is written.
+
+    Returns
+    -------
+    nfev : int
+        Number of evaluations of ``dqdt`` plus evaluations of ``dpdt``.
+
+    Note
+    ----
+    The force evaluated at the end of each step is reused at the beginning of
+    the next one, so each step costs one evaluation of ``dqdt`` and one of
+    ``dpdt``.
+    """
+    q, p, q_out, p_out = _scalar_state(q0, p0, q_out, p_out)
+    q_out[..., 0] = q
+    p_out[..., 0] = p
+
+    t = np.asarray(t, dtype=float).tolist()
+    force = dpdt(t[0], q)
+    for i, h in enumerate(np.diff(t).tolist()):
+        p_half = p + (h / 2) * force
+        q = q + h * dqdt(t[i] + h / 2, p_half)
+        force = dpdt(t[i] + h, q)
+        p = p_half + (h / 2) * force
+        q_out[..., i + 1] = q
+        p_out[..., i + 1] = p
+
+    return 1 + 2 * (len(t) - 1)
+
+
+def yoshida4(dqdt: Callable, dpdt: Callable, t: np.ndarray, q0: np.ndarray,
+             p0: np.ndarray, q_out: np.ndarray, p_out: np.ndarray) -> int:
+    """Yoshida symplectic integrator of order 4.
+
+    It is the composition of three leapfrog steps of sizes
+    :math:`w_1 h, w_0 h, w_1 h`, with :math:`w_1 = 1 / (2 - 2^{1/3})` and
+    :math:`w_0 = - 2^{1/3} w_1`. See :func:`leapfrog` for a description of the
+    parameters.
+
+    Returns
+    -------
+    nfev : int
+        Number of evaluations of ``dqdt`` plus evaluations of ``dpdt``.
+
+    References
+    ----------
+    .. [#] H. Yoshida, Construction of higher order symplectic integrators,
+       Physics Letters A 150 (1990), https://doi.org/10.1016/0375-9601(90)90092-3
+    """
+    q, p, q_out, p_out = _scalar_state(q0, p0, q_out, p_out)
+    q_out[..., 0] = q
+    p_out[..., 0] = p
+
+    t = np.asarray(t, dtype=float).tolist()
+    c1, c2, c3, c4 = _yoshida_c
+    d1, d2, d3 = _yoshida_d
+    for i, h in enumerate(np.diff(t).tolist()):
+        t_i = t[i]
+        q = q + (c1 * h) * dqdt(t_i, p)
+        p = p + (d1 * h) * dpdt(t_i + c1 * h, q)
+        q = q + (c2 * h) * dqdt(t_i + c1 * h, p)
+        p = p + (d2 * h) * dpdt(t_i + (c1 + c2) * h, q)
+        q = q + (c3 * h) * dqdt(t_i + (c1 + c2) * h, p)
+        p = p + (d3 * h) * dpdt(t_i + (c1 + c2 + c3) * h, q)
+        q = q + (c4 * h) * dqdt(t_i + (c1 + c2 + c3) * h, p)
+        q_out[..., i + 1] = q
+        p_out[..., i + 1] = p
+
+    return 7 * (len(t) - 1)
@@ -1,10 +1,18 @@
 """This module simulates mechanical systems"""
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Callable
 from math import pi
 
 from datetime import datetime
+import numpy as np
 from scipy.integrate import solve_ivp
 from scipy.integrate._ivp.ivp import OdeResult
+from scipy.sparse import block_diag
+
+from . import integrators
+
+
+class SimulationCancelled(Exception):
+    """Raised by a :attr:`Simulation.monitor` to stop the simulation."""
 
 
 class Simulation(object):
@@ -20,7 +28,9 @@ class Simulation(object):
         lie within t_span.
     ini_cndtn : array_like or None
         Initial condition of simulation, its specification depends on
-        the system being simulated.
+        the system being simulated. An array of shape ``(M, n)`` (a list of
+        ``M`` initial conditions) defines an ensemble that is integrated in a
+        single solver run.
     params : dict or None
         Contains all the parameters of the simulation (e.g. for the harmonic
         oscillator ``self.params = {"m": 1., "k": 1.}``)
@@ -32,9 +42,38 @@ class Simulation(object):
         UTC date and time of instantiation of object.
     results : ``scipy.integrate._ivp.ivp.OdeResult`` or None
         Results of simulation.
+    monitor : Callable or None
+        If it is not ``None``, it is called as ``monitor(t, nfev)`` every
+        :attr:`monitor_every` evaluations of the right hand side of the system
+        while simulating, where ``t`` is the time of the evaluation and
+        ``nfev`` the number of evaluations so far. It may stop the simulation
+        by raising :class:`SimulationCancelled` (or any other exception).
     """
     system = None
     """Name of system."""
+    dim = 2
+    """Dimension ``n`` of the phase space of the system."""
+    implicit_methods = ("Radau", "BDF", "LSODA")
+    """Integration methods of ``scipy.integrate.solve_ivp`` that make use of
+    the Jacobian of the dynamical system."""
+    fixed_step_methods = ("RK4", "Leapfrog", "Yoshida4")
+    """Integration methods implemented in
+    :mod:`~simulation_api.simulation.integrators`. They take one step between
+    consecutive times of :attr:`t_eval`."""
+    symplectic_methods = ("Leapfrog", "Yoshida4")
+    """Fixed step methods only available for :attr:`hamiltonian` systems."""
+    hamiltonian = False
+    """Tells if the system is a separable Hamiltonian system, i.e. if
+    :meth:`dqdt` and :meth:`dpdt` are defined. The phase space is then
+    ``y = [q, p]``, where ``q`` and ``p`` have ``dim // 2`` components."""
+    solvable = False
+    """Tells if the system has a closed form solution, i.e. if
+    :meth:`exact_solution` is defined. Only then the ``"analytic"`` method is
+    available."""
+    monitor_every = 100
+    """Number of evaluations of the right hand side between calls to
+    :attr:`monitor`."""
+
     def __init__(self,
                  t_span: Optional[List[float]] = None,
                  t_eval: Optional[list] = None,
@@ -50,28 +89,203 @@ class Simulation(object):
         self.method = method
         self.user_name = user_name
         self.results = None
+        self.monitor = None
         self.date = str(datetime.utcnow())
 
-    def dyn_sys_eqns(self, t: float, y: List[float]) -> List[float]:
+    def dyn_sys_eqns(self, t: float, y: np.ndarray) -> np.ndarray:
         """Trivial 2D dynamical system. Just for reference.
         
         Note
         ----
         The actual simulations that inherit this class will replace this method
         with the relevant dynamical equations.
+
+        Note
+        ----
+        ``y`` may have shape ``(n,)`` or ``(n, k)``. In the latter case each
+        column is a different state and the returned array must have the same
+        shape (``solve_ivp`` is called with ``vectorized=True``). Write the
+        equations with NumPy operations over the rows of ``y`` so that both
+        cases are handled at once.
         """
         # The vector is decomposed in its phase space variables.
         p, q = y
         
         # Then, the dynamical system is defined. In general, dydt = f(p, q, t)
         # but this is just the trivial dynamical system.
-        dydt = [0 * p, 0 * q]
+        dydt = np.array([0 * p, 0 * q])
         
         return dydt
 
+    def jacobian(self, t: float, y: np.ndarray) -> np.ndarray:
+        """Jacobian of the trivial 2D dynamical system. Just for reference.
+
+        Note
+        ----
+        The actual simulations that inherit this class may replace this method
+        with the analytic Jacobian :math:`J_{ij} = \\partial f_i / \\partial y_j`
+        of :meth:`dyn_sys_eqns`. It is passed to ``solve_ivp`` as ``jac`` when
+        one of the :attr:`implicit_methods` is used. If a simulation does not
+        override this method, ``solve_ivp`` approximates the Jacobian by finite
+        differences.
+
+        Parameters
+        ----------
+        t : float
+            Time.
+        y : array_like, shape (n,)
+            State of the system.
+
+        Returns
+        -------
+        jac : ndarray, shape (n, n)
+            Jacobian evaluated at ``(t, y)``.
+        """
+        return np.zeros((2, 2))
+
+    def dqdt(self, t: float, p: np.ndarray) -> np.ndarray:
+        """Derivative of the generalised coordinates,
+        :math:`\\partial H / \\partial p`, of a separable Hamiltonian system.
+
+        Note
+        ----
+        Only needed (and used) by the :attr:`symplectic_methods`. Simulations
+        of separable Hamiltonian systems replace this method and :meth:`dpdt`
+        and set :attr:`hamiltonian` to ``True``.
+
+        Parameters
+        ----------
+        t : float
+            Time.
+        p : ndarray, shape (dim // 2,) or (dim // 2, k)
+            Generalised momenta.
+        """
+        raise NotImplementedError(f"{self.system} is not a separable "
+                                  f"Hamiltonian system.")
+
+    def dpdt(self, t: float, q: np.ndarray) -> np.ndarray:
+        """Derivative of the generalised momenta,
+        :math:`- \\partial H / \\partial q`, of a separable Hamiltonian system.
+
+        Note
+        ----
+        See :meth:`dqdt`.
+
+        Parameters
+        ----------
+        t : float
+            Time.
+        q : ndarray, shape (dim // 2,) or (dim // 2, k)
+            Generalised coordinates.
+        """
+        raise NotImplementedError(f"{self.system} is not a separable "
+                                  f"Hamiltonian system.")
+
+    def exact_solution(self, t: np.ndarray, y0: np.ndarray) -> np.ndarray:
+        """Closed form solution of the system.
+
+        Note
+        ----
+        Only needed (and used) by the ``"analytic"`` method. Simulations of
+        analytically solvable systems replace this method and set
+        :attr:`solvable` to ``True``. It must be written as a vectorized NumPy
+        expression.
+
+        Parameters
+        ----------
+        t : ndarray, shape (n_points,)
+            Times at which the solution is evaluated.
+        y0 : ndarray, shape (n,) or (M, n)
+            Initial condition (or ensemble of initial conditions) at time
+            ``t_span[0]``.
+
+        Returns
+        -------
+        y : ndarray, shape (n, n_points) or (M, n, n_points)
+            Solution evaluated at ``t``.
+        """
+        raise NotImplementedError(f"{self.system} has no closed form "
+                                  f"solution.")
+
+    def _jac(self) -> Optional[Callable]:
+        """Returns :meth:`jacobian` if it is overridden by the simulation and
+        relevant for ``self.method``, otherwise ``None``."""
+        if self.method not in self.implicit_methods:
+            return None
+        if type(self).jacobian is Simulation.jacobian:
+            return None
+        return self.jacobian
+
+    def _monitored(self, fun: Callable) -> Callable:
+        """Wraps ``fun`` (a right hand side of the system, with the time as
+        first argument) so that it calls :attr:`monitor` every
+        :attr:`monitor_every` evaluations. Returns ``fun`` itself if there is
+        no monitor."""
+        monitor = self.monitor
+        if monitor is None:
+            return fun
+        every = self.monitor_every
+        nfev = 0
+
+        def monitored_fun(t, *args):
+            nonlocal nfev
+            nfev += 1
+            if not nfev % every:
+                monitor(t, nfev)
+            return fun(t, *args)
+
+        return monitored_fun
+
+    @property
+    def ensemble_size(self) -> Optional[int]:
+        """Number ``M`` of initial conditions if :attr:`ini_cndtn` defines an
+        ensemble, ``None`` if it is a single initial condition."""
+        ini_cndtn = np.asarray(self.ini_cndtn, dtype=float)
+        return ini_cndtn.shape[0] if ini_cndtn.ndim == 2 else None
+
+    def _ensemble_eqns(self, t: float, y: np.ndarray) -> np.ndarray:
+        """:meth:`dyn_sys_eqns` of the ``(M·n)``-dimensional system obtained by
+        stacking the ``M`` members of an ensemble.
+
+        The stacked state is ``[y_0, y_1, ..., y_{M-1}]``, where each ``y_i``
+        has shape ``(n,)``. Every member is passed at once to
+        :meth:`dyn_sys_eqns` as a column of an ``(n, M)`` array.
+
+        Parameters
+        ----------
+        t : float
+            Time.
+        y : ndarray, shape (M·n,) or (M·n, k)
+            Stacked state of the ensemble.
+
+        Returns
+        -------
+        dydt : ndarray, same shape as ``y``
+        """
+        n = self.dim
+        members = y.reshape(-1, n, *y.shape[1:])
+        states = np.moveaxis(members, 0, 1).reshape(n, -1)
+        dydt = self.dyn_sys_eqns(t, states).reshape(n, *members.shape[:1],
+                                                    *y.shape[1:])
+        return np.moveaxis(dydt, 0, 1).reshape(y.shape)
+
+    def _ensemble_jacobian(self, t: float, y: np.ndarray):
+        """Block diagonal Jacobian of the stacked ensemble system defined in
+        :meth:`_ensemble_eqns`.
+
+        It is a sparse matrix, except for ``LSODA`` which only accepts dense
+        Jacobians."""
+        members = y.reshape(-1, self.dim)
+        jac = block_diag([self.jacobian(t, y_i) for y_i in members],
+                         format="csc")
+        return jac.toarray() if self.method == "LSODA" else jac
+
     def simulate(self) -> OdeResult:
         """Simulates ``self.system`` abstracted in ``self.dyn_sys_eqns``
-        and using ``scipy.integrate.solve_ivp``.
+        and using ``scipy.integrate.solve_ivp`` or, if ``self.method`` is one
+        of the :attr:`fixed_step_methods`, one of the integrators defined in
+        :mod:`~simulation_api.simulation.integrators`. If ``self.method`` is
+        ``"analytic"``, :meth:`exact_solution` is evaluated instead.
         
         Returns
         -------
@@ -81,8 +295,10 @@ class Simulation(object):
                 
                 t : ndarray, shape (n_points,)
                     Time points.
-                y : ndarray, shape (n, n_points)
-                    Values of the solution at t.
+                y : ndarray, shape (n, n_points) or (M, n, n_points)
+                    Values of the solution at t. The second shape is
+                    returned when :attr:`ini_cndtn` is an ensemble of ``M``
+                    initial conditions.
                 sol : OdeSolution or None
                     Found solution as OdeSolution instance; None if 
                     dense_output was set to False.
@@ -109,11 +325,119 @@ class Simulation(object):
                     True if the solver reached the interval end or a
                     termination event occurred (status >= 0).
         """
-        # Update self.results with simulation results
-        self.results = solve_ivp(self.dyn_sys_eqns, self.t_span, self.ini_cndtn,
-                                 self.method, self.t_eval)
+        if self.method == "analytic":
+            self.results = self._simulate_analytic()
+        elif self.method in self.fixed_step_methods:
+            self.results = self._simulate_fixed_step()
+        else:
+            self.results = self._simulate_solve_ivp()
         return self.results
-        
+
+    def _simulate_solve_ivp(self) -> OdeResult:
+        """Simulates the system using ``scipy.integrate.solve_ivp``. See
+        :meth:`simulate`."""
+        ensemble_size = self.ensemble_size
+
+        # Implicit methods receive the analytic Jacobian (if available), so
+        # they do not need to approximate it by finite differences.
+        solver_options = {}
+        jac = self._jac()
+        if jac is not None:
+            solver_options["jac"] = jac
+
+        # An ensemble of M initial conditions is integrated as one
+        # (M·n)-dimensional system.
+        if ensemble_size is None:
+            fun = self.dyn_sys_eqns
+            y0 = self.ini_cndtn
+        else:
+            fun = self._ensemble_eqns
+            y0 = np.ravel(self.ini_cndtn)
+            if jac is not None:
+                solver_options["jac"] = self._ensemble_jacobian
+
+        results = solve_ivp(self._monitored(fun), self.t_span, y0,
+                            self.method, self.t_eval, vectorized=True,
+                            **solver_options)
+
+        # Unstack the ensemble: y has shape (M, n, n_points)
+        if ensemble_size is not None:
+            results.y = results.y.reshape(ensemble_size, self.dim, -1)
+
+        return results
+
+    def _simulate_analytic(self) -> OdeResult:
+        """Evaluates :meth:`exact_solution` at :attr:`t_eval`. See
+        :meth:`simulate`."""
+        if self.t_eval is None or len(self.t_eval) < 1:
+            raise ValueError("The analytic method needs t_eval (or t_steps).")
+        if not self.solvable:
+            raise ValueError(f"{self.system} has no closed form solution.")
+
+        t = np.asarray(self.t_eval, dtype=float)
+        y = self.exact_solution(t, np.asarray(self.ini_cndtn, dtype=float))
+
+        return OdeResult(t=t, y=y, sol=None, t_events=None, y_events=None,
+                         nfev=0, njev=0, nlu=0, status=0,
+                         message="Closed form solution evaluated at t_eval.",
+                         success=True)
+
+    def _simulate_fixed_step(self) -> OdeResult:
+        """Simulates the system using one of the fixed step integrators of
+        :mod:`~simulation_api.simulation.integrators`. See :meth:`simulate`.
+
+        One step is taken between consecutive times of :attr:`t_eval` (and
+        from ``t_span[0]`` to ``t_eval[0]``, if they differ).
+        """
+        if self.t_eval is None or len(self.t_eval) < 1:
+            raise ValueError("Fixed step integration methods need t_eval "
+                             "(or t_steps).")
+        if (self.method in self.symplectic_methods and not self.hamiltonian):
+            raise ValueError(f"{self.method} integration method is only "
+                             f"available for Hamiltonian systems.")
+
+        # The initial condition is given at t_span[0]
+        t = np.asarray(self.t_eval, dtype=float)
+        t_start = self.t_span[0] if self.t_span else t[0]
+        prepend = t[0] != t_start
+        if prepend:
+            t = np.concatenate([[t_start], t])
+
+        # Preallocated output. Ensembles are integrated as (n, M) arrays whose
+        # columns are the members, which are written into a (M, n, n_points)
+        # array through the view y_view.
+        y0 = np.asarray(self.ini_cndtn, dtype=float)
+        ensemble_size = self.ensemble_size
+        if ensemble_size is None:
+            y = np.empty((self.dim, len(t)))
+            y_view = y
+        else:
+            y0 = y0.T
+            y = np.empty((ensemble_size, self.dim, len(t)))
+            y_view = np.moveaxis(y, 0, 1)
+
+        if self.method == "RK4":
+            nfev = integrators.rk4(self._monitored(self.dyn_sys_eqns), t, y0,
+                                   y_view)
+        else:
+            integrator = {
+                "Leapfrog": integrators.leapfrog,
+                "Yoshida4": integrators.yoshida4,
+            }[self.method]
+            d = self.dim // 2
+            # Only evaluations of dpdt are monitored
+            nfev = integrator(self.dqdt, self._monitored(self.dpdt), t,
+                              y0[:d], y0[d:], y_view[:d], y_view[d:])
+
+        if prepend:
+            t = t[1:]
+            y = y[..., 1:]
+
+        return OdeResult(t=t, y=y, sol=None, t_events=None, y_events=None,
+                         nfev=nfev, njev=0, nlu=0, status=0,
+                         message=f"{self.method} reached the end of t_eval.",
+                         success=True)
+
 
 
 class HarmonicOsc1D(Simulation):
@@ -135,6 +459,9 @@ class HarmonicOsc1D(Simulation):
         H = \\frac{1}{2m}p^2 + \\frac{1}{2}k q^2
     """
     system = "Harmonic-Oscillator"
+    dim = 2
+    hamiltonian = True
+    solvable = True
 
     def __init__(self,
                  t_span: Optional[Tuple[float, float]] = [0, 2 * pi], 
@@ -151,13 +478,14 @@ class HarmonicOsc1D(Simulation):
         
         Parameters
         ----------
-        ini_cndtn : array_like, shape (2,)
+        ini_cndtn : array_like, shape (2,) or (M, 2)
             Initial condition of 1D Harmonic Oscillator. Convention: 
             :math:`\\texttt{ini_cndtn} = [q_0, p_0]` where :math:`q_0` is the initial
             generalised position and :math:`p_0` is the initial generalised
-            momentum. Default is ``[0., 1.]``. A list of initial conditions
-            can be used, in this case a list of solutions will be returned by
-            :meth:`Simulation.simulate`.
+            momentum. Default is ``[0., 1.]``. A list of ``M`` initial
+            conditions can be used, in this case the ensemble is integrated in
+            a single run and :meth:`Simulation.simulate` returns ``y`` with
+            shape ``(M, 2, n_points)``.
         params : dict, optional
             Contains all the parameters of the simulation. Schema must match::
 
@@ -172,7 +500,7 @@ class HarmonicOsc1D(Simulation):
         self.m = params["m"]
         self.k = params["k"]
 
-    def dyn_sys_eqns(self, t: float, y: List[float]) -> List[float]:
+    def dyn_sys_eqns(self, t: float, y: np.ndarray) -> np.ndarray:
         """Hamilton's equations for 1D-Harmonic Oscillator.
 
         Note
@@ -183,22 +511,84 @@ class HarmonicOsc1D(Simulation):
         ----------
         t : float
             Time of evaluation of Hamilton's equations.
-        y : array_like, shape (2,)
+        y : array_like, shape (2,) or (2, k)
             Canonical coordinates.
             Convention: :math:`\\texttt{y} = [q, p]` where :math:`q` is the
             generalised position and :math:`p` is the generalised momentum.
 
         Returns
         -------
-        dydt : array_like, shape (2,)
+        dydt : ndarray, shape (2,) or (2, k)
             Hamilton's equations for 1D Harmonic Oscillator.
             :math:`\\texttt{dydt} = \left[ \\frac{dq}{dt}, \\frac{dp}{dt} \\right] =
             \left[ \\frac{\partial H}{\partial p}, - \\frac{\partial H}{\partial q} \\right]`
         """
         q, p = y
-        dydt = [p / self.m, - q * self.k]
+        dydt = np.array([p / self.m, - q * self.k])
         return dydt
 
+    def jacobian(self, t: float, y: np.ndarray) -> np.ndarray:
+        """Jacobian of Hamilton's equations for 1D-Harmonic Oscillator.
+
+        Note
+        ----
+        Overwrites :meth:`Simulation.jacobian`.
+
+        Returns
+        -------
+        jac : ndarray, shape (2, 2)
+            Constant Jacobian
+            :math:`\\begin{pmatrix} 0 & 1/m \\\\ -k & 0 \\end{pmatrix}`.
+        """
+        return np.array([[0., 1. / self.m], [- self.k, 0.]])
+
+    def dqdt(self, t: float, p: np.ndarray) -> np.ndarray:
+        """:math:`\\frac{dq}{dt} = \\frac{\\partial H}{\\partial p} = p / m`.
+
+        Note
+        ----
+        Overwrites :meth:`Simulation.dqdt`.
+        """
+        return p / self.m
+
+    def dpdt(self, t: float, q: np.ndarray) -> np.ndarray:
+        """:math:`\\frac{dp}{dt} = - \\frac{\\partial H}{\\partial q} = - k q`.
+
+        Note
+        ----
+        Overwrites :meth:`Simulation.dpdt`.
+        """
+        return - self.k * q
+
+    def exact_solution(self, t: np.ndarray, y0: np.ndarray) -> np.ndarray:
+        """Closed form solution of the 1D-Harmonic Oscillator.
+
+        .. math::
+
+            q(t) &= q_0 \\cos \\omega \\tau + \\frac{p_0}{m \\omega} \\sin \\omega \\tau
+
+            p(t) &= p_0 \\cos \\omega \\tau - m \\omega q_0 \\sin \\omega \\tau
+
+        where :math:`\\omega = \\sqrt{k / m}` and :math:`\\tau = t - t_0`.
+
+        Note
+        ----
+        Overwrites :meth:`Simulation.exact_solution`. Only valid for ``k > 0``
+        and ``m > 0`` (the API rejects other parameters for this method).
+        """
+        omega = np.sqrt(self.k / self.m)
+        t0 = self.t_span[0] if self.t_span else 0.
+        cos = np.cos(omega * (t - t0))
+        sin = np.sin(omega * (t - t0))
+
+        # Shapes (1,) or (M, 1), broadcast against the times
+        q0 = y0[..., 0:1]
+        p0 = y0[..., 1:2]
+
+        q = q0 * cos + (p0 / (self.m * omega)) * sin
+        p = p0 * cos - (self.m * omega * q0) * sin
+        return np.stack([q, p], axis=-2)
+
 
 
 
@@ -235,6 +625,7 @@ class ChenLeeAttractor(Simulation):
     .. [#] https://doi.org/10.1142/S0218127403006509
     """
     system = "Chen-Lee-Attractor"
+    dim = 3
 
     def __init__(self,
                  t_span: Optional[Tuple[float, float]] = [0, 400], 
@@ -252,12 +643,13 @@ class ChenLeeAttractor(Simulation):
         
         Parameters
         ----------
-        ini_cndtn : array_like, shape (3,)
+        ini_cndtn : array_like, shape (3,) or (M, 3)
             Initial condition of 1D Harmonic Oscillator. Convention: 
             :math:`\\texttt{ini_cndtn} = [\omega_{x0}, \omega_{y0}, \omega_{z0}]`.
-            Default is ``[10, 10, 0]``. A list of initial conditions can be
-            used, in this case a list of solutions will be returned by
-            :py:meth:`Simulation.simulate`
+            Default is ``[10, 10, 0]``. A list of ``M`` initial conditions can
+            be used, in this case the ensemble is integrated in a single run
+            and :py:meth:`Simulation.simulate` returns ``y`` with shape
+            ``(M, 3, n_points)``.
         params : dict, optional
             Contains all the parameters of the simulation. Schema must match::
             
@@ -274,7 +666,7 @@ class ChenLeeAttractor(Simulation):
         self.b = params["b"]
         self.c = params["c"]
     
-    def dyn_sys_eqns(self, t: float, w: List[float]) -> List[float]:
+    def dyn_sys_eqns(self, t: float, w: np.ndarray) -> np.ndarray:
         """Chen-Lee Dynamical system definition
         
         Note
@@ -283,7 +675,7 @@ class ChenLeeAttractor(Simulation):
 
         Parameters
         ----------
-        w : array_like, shape (3,)
+        w : array_like, shape (3,) or (3, k)
             Vector of angular velocity.
             Convention: :math:`\\texttt{w} = [\omega_x, \omega_y, \omega_z]`.
         t : float
@@ -291,17 +683,43 @@ class ChenLeeAttractor(Simulation):
         
         Returns
         -------
-        dwdt : array_like, shape (3,)
+        dwdt : ndarray, shape (3,) or (3, k)
             Dynamical system equations of Chen Lee attractor evaluated at ``w``.
         """
         wx, wy, wz = w
-        dwdt = [
+        dwdt = np.array([
             - wy * wz + self.a * wx,
             wz * wx + self.b * wy,
             (wx * wy / 3.) + self.c * wz,
-        ]
+        ])
         return dwdt
 
+    def jacobian(self, t: float, w: np.ndarray) -> np.ndarray:
+        """Jacobian of Chen-Lee Dynamical system.
+
+        Note
+        ----
+        Overwrites :meth:`Simulation.jacobian`.
+
+        Parameters
+        ----------
+        t : float
+            Time.
+        w : array_like, shape (3,)
+            Vector of angular velocity.
+
+        Returns
+        -------
+        jac : ndarray, shape (3, 3)
+            Jacobian of Chen Lee attractor evaluated at ``w``.
+        """
+        wx, wy, wz = w
+        return np.array([
+            [self.a, - wz, - wy],
+            [wz, self.b, wx],
+            [wy / 3., wx / 3., self.c],
+        ])
+
 
 # NOTE Update this dict with all available simulations
 Simulations = {
@@ -0,0 +1,174 @@
+// Interactive plots of the trajectories of a simulation, drawn in the browser
+// from the decimated trajectories served (binary encoded) in route
+// /api/results/{sim_id}/series. Any component can be drawn against any other
+// one or against time; zoom with the mouse wheel, double click to reset. When
+// time is in the horizontal axis, zoomed views are requested to the API, so
+// that the detail is not lost.
+
+"use strict";
+
+const seriesColors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+                      "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"];
+
+// Decodes the binary encoding of the trajectories (see SeriesFormat schema)
+function parseSeries(buffer) {
+    const headerLength = new DataView(buffer).getUint32(0, true);
+    const header = JSON.parse(
+        new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength))
+    );
+    const shape = header.shape;
+    const nPoints = shape[shape.length - 1];
+    const size = shape.reduce((a, b) => a * b, 1);
+    const offset = 4 + headerLength;
+    return {
+        header: header,
+        nPoints: nPoints,
+        dim: shape[shape.length - 2],
+        members: shape.length === 3 ? shape[0] : 1,
+        t: new Float32Array(buffer, offset, nPoints),
+        y: new Float32Array(buffer, offset + 4 * nPoints, size),
+    };
+}
+
+// Values of time (key -1) or of component `key` of member `member`
+function seriesValues(series, key, member) {
+    if (key < 0) {
+        return series.t;
+    }
+    const start = (member * series.dim + key) * series.nPoints;
+    return series.y.subarray(start, start + series.nPoints);
+}
+
+function seriesRange(series, key) {
+    let min = Infinity, max = -Infinity;
+    for (let m = 0; m < series.members; m++) {
+        for (const value of seriesValues(series, key, m)) {
+            min = Math.min(min, value);
+            max = Math.max(max, value);
+        }
+    }
+    const margin = 0.05 * (max - min || 1);
+    return [min - margin, max + margin];
+}
+
+function drawSeries(canvas, series, xKey, yKey, view) {
+    const ctx = canvas.getContext("2d");
+    const pad = {left: 70, right: 20, top: 20, bottom: 50};
+    const width = canvas.width - pad.left - pad.right;
+    const height = canvas.height - pad.top - pad.bottom;
+    const toX = x => pad.left + (x - view.x[0]) / (view.x[1] - view.x[0]) * width;
+    const toY = y => pad.top + (view.y[1] - y) / (view.y[1] - view.y[0]) * height;
+
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.font = "14px sans-serif";
+    ctx.fillStyle = "black";
+    ctx.strokeStyle = "black";
+    ctx.strokeRect(pad.left, pad.top, width, height);
+
+    // Ticks
+    for (let i = 0; i <= 4; i++) {
+        const x = view.x[0] + i / 4 * (view.x[1] - view.x[0]);
+        const y = view.y[0] + i / 4 * (view.y[1] - view.y[0]);
+        ctx.textAlign = "center";
+        ctx.fillText(x.toPrecision(3), toX(x), pad.top + height + 18);
+        ctx.textAlign = "right";
+        ctx.fillText(y.toPrecision(3), pad.left - 6, toY(y) + 5);
+    }
+    const names = ["t"].concat(series.header.components);
+    ctx.textAlign = "center";
+    ctx.fillText(names[xKey + 1], pad.left + width / 2, canvas.height - 8);
+    ctx.save();
+    ctx.translate(16, pad.top + height / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.fillText(names[yKey + 1], 0, 0);
+    ctx.restore();
+
+    // Trajectories
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(pad.left, pad.top, width, height);
+    ctx.clip();
+    for (let m = 0; m < series.members; m++) {
+        const xs = seriesValues(series, xKey, m);
+        const ys = seriesValues(series, yKey, m);
+        ctx.strokeStyle = seriesColors[m % seriesColors.length];
+        ctx.beginPath();
+        ctx.moveTo(toX(xs[0]), toY(ys[0]));
+        for (let i = 1; i < xs.length; i++) {
+            ctx.lineTo(toX(xs[i]), toY(ys[i]));
+        }
+        ctx.stroke();
+    }
+    ctx.restore();
+
+    return {pad: pad, width: width, height: height};
+}
+
+function fetchSeries(url) {
+    return fetch(url).then(response => {
+        // Errors are answered in JSON, e.g. 422 for an invalid window
+        if (!response.ok) {
+            return response.json().then(error => {
+                throw new Error(JSON.stringify(error.detail));
+            });
+        }
+        return response.arrayBuffer();
+    }).then(parseSeries);
+}
+
+function seriesPlot(canvas, xSelect, ySelect, url) {
+    fetchSeries(url).then(overview => {
+        const names = ["t"].concat(overview.header.components);
+        names.forEach((name, i) => {
+            xSelect.add(new Option(name, i - 1, i === 0, i === 0));
+            ySelect.add(new Option(name, i - 1, i === 1, i === 1));
+        });
+
+        let series = overview, view, layout, zoomTimer;
+        const reset = () => {
+            clearTimeout(zoomTimer);
+            series = overview;
+            view = {x: seriesRange(series, +xSelect.value),
+                    y: seriesRange(series, +ySelect.value)};
+            redraw();
+        };
+        const redraw = () => {
+            layout = drawSeries(canvas, series, +xSelect.value,
+                                +ySelect.value, view);
+        };
+        const fetchView = () => {
+            const requested = view;
+            fetchSeries(`${url}&t0=${view.x[0]}&t1=${view.x[1]}`).then(zoomed => {
+                // Drop the response if the view changed in the meantime
+                if (requested === view && zoomed.nPoints > 1) {
+                    series = zoomed;
+                    redraw();
+                }
+            });
+        };
+
+        xSelect.addEventListener("change", reset);
+        ySelect.addEventListener("change", reset);
+        canvas.addEventListener("dblclick", reset);
+        canvas.addEventListener("wheel", event => {
+            event.preventDefault();
+            const rect = canvas.getBoundingClientRect();
+            const fx = (event.clientX - rect.left - layout.pad.left) / layout.width;
+            const fy = 1 - (event.clientY - rect.top - layout.pad.top) / layout.height;
+            const factor = event.deltaY < 0 ? 0.8 : 1.25;
+            const zoom = (range, f) => {
+                const center = range[0] + f * (range[1] - range[0]);
+                return [center - (center - range[0]) * factor,
+                        center + (range[1] - center) * factor];
+            };
+            view = {x: zoom(view.x, fx), y: zoom(view.y, fy)};
+            redraw();
+            if (+xSelect.value === -1) {
+                clearTimeout(zoomTimer);
+                zoomTimer = setTimeout(fetchView, 300);
+            }
+        });
+
+        reset();
+    });
+}
@@ -0,0 +1,114 @@
+"""Configuration of the tests.
+
+The database and the results of the simulations are stored in a temporary
+directory (see ``PATH_DB_DIR`` in :mod:`simulation_api.config`), so that the
+tests never modify the files of the repository. It must be set before
+``simulation_api`` is imported, which creates the tables of the database.
+"""
+from itertools import count
+from uuid import uuid4
+import os
+import shutil
+import tempfile
+import time
+
+import pytest
+
+
+_db_dir = tempfile.mkdtemp(prefix="simulation_api_tests_")
+os.environ["SIMULATION_API_DB_DIR"] = _db_dir
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_db_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Client of the API. The pools of workers are shut down at the end of the
+    session."""
+    from fastapi.testclient import TestClient
+    from simulation_api import app
+    from simulation_api.model.db_manager import engine
+
+    engine.echo = False
+    with TestClient(app) as client:
+        yield client
+
+
+# Each simulation requested by the tests is different (unless asked
+# otherwise), so that it is not reused from the cache of results
+_ini_cndtns = count(1)
+
+
+def ho_request(**kwargs):
+    """Request of a (short) simulation of the harmonic oscillator, with a new
+    initial condition. ``kwargs`` replace its fields."""
+    request = {
+        "system": "Harmonic-Oscillator",
+        "t_span": [0, 10],
+        "t_steps": 200,
+        "ini_cndtn": [1 + next(_ini_cndtns) / 1000, 0],
+        "params": {"m": 1, "k": 1},
+        "method": "RK45",
+        "username": "tests",
+    }
+    request.update(kwargs)
+    return request
+
+
+@pytest.fixture(scope="session")
+def simulate(client):
+    """Requests a simulation (see :func:`ho_request`) and waits until it
+    finishes. Returns its simulation ID."""
+    def simulate(request=None):
+        request = request or ho_request()
+        response = client.post(f"/api/simulate/{request['system']}",
+                               json=request)
+        sim_id = response.json()["sim_id"]
+        assert sim_id, response.json()
+        status = client.get(f"/api/simulate/status/{sim_id}",
+                            params={"wait": 60}).json()
+        assert status["success"], status
+        return sim_id
+    return simulate
+
+
+def create_job(state="queued", username="tests"):
+    """Stores the job of a new simulation (see :func:`ho_request`) in
+    ``jobs`` table, without submitting it to the pool of workers. Returns its
+    simulation ID."""
+    from simulation_api.controller.schemas import SimRequest, JobDBSchCreate
+    from simulation_api.model import crud
+    from simulation_api.model.db_manager import SessionLocal
+
+    sim_request = SimRequest(**ho_request(username=username),
+                             sim_id=uuid4().hex)
+    db = SessionLocal()
+    crud._create_jobs(db, [JobDBSchCreate(
+        sim_id=sim_request.sim_id,
+        user_id=0,
+        username=sim_request.username,
+        system=sim_request.system.value,
+        method=sim_request.method.value,
+        state=state,
+        request=sim_request.json(),
+        submitted=time.time(),
+    )])
+    db.close()
+    return sim_request.sim_id
+
+
+@pytest.fixture
+def pending_jobs():
+    """Queued jobs (never run) of user ``"admission"``, finished at the end of
+    the test so that they do not count in other tests."""
+    from simulation_api.model import crud
+    from simulation_api.model.db_manager import SessionLocal
+
+    sim_ids = [create_job(username="admission") for _ in range(3)]
+    yield sim_ids
+    db = SessionLocal()
+    for sim_id in sim_ids:
+        crud._finish_job(db, sim_id, time.time())
+    db.close()
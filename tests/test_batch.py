@@ -0,0 +1,82 @@
+"""Tests of the batches of simulation requests."""
+from simulation_api.controller import tasks
+from simulation_api.controller.schemas import sim_cached_message
+from simulation_api.model import crud, models
+from simulation_api.model.db_manager import SessionLocal
+
+from .conftest import ho_request
+
+
+def _wait(client, sim_id):
+    return client.get(f"/api/simulate/status/{sim_id}",
+                      params={"wait": 60}).json()
+
+
+def _data(client, sim_id):
+    return client.get(f"/api/results/{sim_id}/data",
+                      params={"format": "json"}).json()
+
+
+def test_batch(client, simulate):
+    """Invalid requests are rejected one by one, the rest are accepted.
+    Requests of cached simulations (also repeated in the batch) reuse their
+    results, which are linked once the batch is stored."""
+    cached = ho_request()
+    cached_sim_id = simulate(cached)
+    new = ho_request()
+    batch = [
+        cached,
+        new,
+        ho_request(params={"m": 1}),
+        dict(new, username="other"),
+        ho_request(ini_cndtn=[1, 0, 0]),
+        dict(cached, username="other"),
+    ]
+
+    response = client.post("/api/simulate/batch", json=batch)
+
+    assert response.status_code == 200
+    responses = response.json()
+    assert len(responses) == len(batch)
+    for i in (2, 4):
+        assert responses[i]["sim_id"] is None
+        assert responses[i]["message"].startswith("Error")
+    sim_ids = [responses[i]["sim_id"] for i in (0, 1, 3, 5)]
+    assert all(sim_ids) and len(set(sim_ids) | {cached_sim_id}) == 5
+    assert [responses[i]["username"] for i in (0, 1, 3, 5)] \
+           == ["tests", "tests", "other", "other"]
+
+    cached_data = _data(client, cached_sim_id)
+    for i in (0, 5):
+        assert responses[i]["message"] == sim_cached_message
+        data = _data(client, responses[i]["sim_id"])
+        assert (data["t"], data["y"]) == (cached_data["t"], cached_data["y"])
+
+    for i in (1, 3):
+        assert responses[i]["message"] != sim_cached_message
+        assert _wait(client, responses[i]["sim_id"])["success"]
+    data = [_data(client, responses[i]["sim_id"]) for i in (1, 3)]
+    assert (data[0]["t"], data[0]["y"]) == (data[1]["t"], data[1]["y"])
+
+
+def test_batch_not_admitted(client, simulate, monkeypatch, pending_jobs):
+    """If the new simulations do not fit in the queue, none of the requests
+    of the batch is accepted (not even the cached ones)."""
+    cached = ho_request()
+    simulate(cached)
+    monkeypatch.setattr(tasks, "MAX_PENDING_JOBS_PER_USER",
+                        len(pending_jobs) + 1)
+    db = SessionLocal()
+    n_pending = crud._count_pending_jobs(db)
+    n_simulations = db.query(models.SimulationDB).count()
+
+    batch = [dict(cached, username="admission"),
+             ho_request(username="admission"),
+             ho_request(username="admission")]
+    response = client.post("/api/simulate/batch", json=batch)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+    assert crud._count_pending_jobs(db) == n_pending
+    assert db.query(models.SimulationDB).count() == n_simulations
+    db.close()
@@ -0,0 +1,115 @@
+"""Tests of the estimates of the cost of simulations."""
+import numpy as np
+import pytest
+
+from simulation_api.config import MAX_OUTPUT_POINTS
+from simulation_api.controller import cost
+from simulation_api.controller.cost import _check_cost, _record_cost
+from simulation_api.controller.schemas import SimRequest
+from simulation_api.model import crud, models
+from simulation_api.model.db_manager import SessionLocal
+
+from .conftest import ho_request
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def _request(**kwargs):
+    return SimRequest(**ho_request(**kwargs))
+
+
+@pytest.mark.parametrize("method", ["RK4", "Leapfrog", "Yoshida4"])
+def test_fixed_step_over_quota_rejected(db, method):
+    """Fewer points would change the step of fixed step methods, so they are
+    rejected instead of downgraded."""
+    sim_params = _request(method=method, t_steps=2 * MAX_OUTPUT_POINTS)
+
+    cost_estimate, error_message = _check_cost(db, sim_params)
+
+    assert error_message
+    assert not cost_estimate.downgraded
+    assert sim_params.t_steps == 2 * MAX_OUTPUT_POINTS
+
+
+def test_adaptive_t_steps_downgraded(db):
+    sim_params = _request(method="RK45", t_steps=2 * MAX_OUTPUT_POINTS)
+
+    cost_estimate, error_message = _check_cost(db, sim_params)
+
+    assert not error_message
+    assert cost_estimate.downgraded
+    assert sim_params.t_steps == cost_estimate.n_points == MAX_OUTPUT_POINTS
+
+
+def test_adaptive_t_eval_downgraded(db):
+    """``t_eval`` is decimated, keeping its first point."""
+    t_eval = np.linspace(0, 10, 3 * MAX_OUTPUT_POINTS + 1).tolist()
+    sim_params = _request(method="LSODA", t_steps=0, t_eval=t_eval)
+
+    cost_estimate, error_message = _check_cost(db, sim_params)
+
+    assert not error_message
+    assert cost_estimate.downgraded
+    assert len(sim_params.t_eval) == cost_estimate.n_points \
+           <= MAX_OUTPUT_POINTS
+    assert sim_params.t_eval[0] == t_eval[0]
+    assert set(sim_params.t_eval) <= set(t_eval)
+
+
+def test_within_quota_unchanged(db):
+    sim_params = _request()
+    cost_estimate, error_message = _check_cost(db, sim_params)
+    assert not error_message
+    assert not cost_estimate.downgraded
+    assert sim_params.t_steps == cost_estimate.n_points == 200
+
+
+def test_memory_over_quota_after_downgrade(db, monkeypatch):
+    """An ensemble whose smallest output does not fit in memory is rejected,
+    even though it was downgraded."""
+    monkeypatch.setattr(cost, "MAX_MEMORY_ESTIMATE", 10 ** 4)
+    ensemble = [[1., float(i)] for i in range(100)]
+    sim_params = _request(method="RK45", ini_cndtn=ensemble)
+
+    cost_estimate, error_message = _check_cost(db, sim_params)
+
+    assert cost_estimate.downgraded
+    assert cost_estimate.memory > 10 ** 4
+    assert "memory" in error_message
+
+
+def test_record_cost_moving_average(db):
+    """The first simulation sets the statistics, the next ones update their
+    exponential moving average."""
+    db.query(models.CostStatsDB) \
+      .filter((models.CostStatsDB.system == "Harmonic-Oscillator")
+              & (models.CostStatsDB.method == "RK23")).delete()
+    db.commit()
+    sim_params = _request(method="RK23", ini_cndtn=[[1., 0.], [0., 1.]])
+    t_length = sim_params.t_span[1] - sim_params.t_span[0]
+
+    _record_cost(db, sim_params, nfev=1000, solve_time=0.2, n_points=500,
+                 output_time=0.01)
+    stats = crud._get_cost_stats(db, "Harmonic-Oscillator", "RK23")
+    assert stats.n_samples == 1
+    assert stats.nfev_per_time == pytest.approx(1000 / t_length)
+    assert stats.seconds_per_fev == pytest.approx(0.2 / (1000 * 2))
+    assert stats.seconds_per_sample == pytest.approx(0.01 / (500 * 2))
+
+    _record_cost(db, sim_params, nfev=3000, solve_time=0.2, n_points=500,
+                 output_time=0.01)
+    stats = crud._get_cost_stats(db, "Harmonic-Oscillator", "RK23")
+    smoothing = cost._STATS_SMOOTHING
+    assert stats.n_samples == 2
+    assert stats.nfev_per_time == pytest.approx(
+        (1 - smoothing) * 1000 / t_length + smoothing * 3000 / t_length
+    )
+    assert stats.seconds_per_fev == pytest.approx(
+        (1 - smoothing) * 0.2 / 2000 + smoothing * 0.2 / 6000
+    )
+    assert stats.seconds_per_sample == pytest.approx(0.01 / (500 * 2))
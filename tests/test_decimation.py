@@ -0,0 +1,118 @@
+"""Tests of the decimation of the trajectories, for plots and for clients."""
+import numpy as np
+import pytest
+
+from simulation_api.controller.decimation import (_minmax_decimate,
+                                                  _grid_decimate,
+                                                  _pyramid_indices,
+                                                  _minmax_indices)
+from simulation_api.model.pyramid import _minmax_pyramid
+
+
+def test_minmax_decimate_keeps_envelope():
+    """Each bucket keeps its extrema, in order, so the envelope of every
+    series is drawn exactly."""
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 1, 10001)
+    y = rng.standard_normal((3, 2, t.size)).cumsum(axis=-1)
+    n_buckets = 100
+
+    t_out, y_out = _minmax_decimate(t, y, n_buckets)
+
+    assert t_out.shape == y_out.shape
+    assert y_out.shape[:-1] == y.shape[:-1]
+    assert y_out.shape[-1] <= 2 * n_buckets
+    assert np.all(np.diff(t_out, axis=-1) >= 0)
+    np.testing.assert_array_equal(y_out.max(axis=-1), y.max(axis=-1))
+    np.testing.assert_array_equal(y_out.min(axis=-1), y.min(axis=-1))
+    # Points kept are points of the series
+    indices = np.searchsorted(t, t_out)
+    np.testing.assert_array_equal(np.take_along_axis(y, indices, axis=-1),
+                                  y_out)
+
+
+def test_minmax_decimate_short_series():
+    t = np.linspace(0, 1, 50)
+    y = np.sin(t)[None]
+    t_out, y_out = _minmax_decimate(t, y, 100)
+    np.testing.assert_array_equal(y_out, y)
+    np.testing.assert_array_equal(t_out[0], t)
+
+
+def test_grid_decimate():
+    """Consecutive points in the same cell are dropped, the ends are kept and
+    no cell of the curve is lost."""
+    s = np.linspace(0, 20 * np.pi, 100001)
+    y = np.stack([np.cos(s) * s, np.sin(s) * s])
+    resolution = 200
+
+    y_out = _grid_decimate(y, resolution)
+
+    assert y_out.shape[0] == 2
+    assert y_out.shape[-1] < y.shape[-1] // 10
+    np.testing.assert_array_equal(y_out[:, 0], y[:, 0])
+    np.testing.assert_array_equal(y_out[:, -1], y[:, -1])
+
+    def cells(points):
+        lower = y.min(axis=-1)[:, None]
+        scale = resolution / (y.max(axis=-1) - y.min(axis=-1))[:, None]
+        return set(map(tuple, np.floor((points - lower) * scale).T))
+    assert cells(y_out) == cells(y)
+
+
+def _random_window(rng, n_total):
+    start = int(rng.integers(0, n_total - 1))
+    stop = int(rng.integers(start + 1, n_total + 1))
+    return start, stop
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pyramid_indices_keep_window_extrema(seed):
+    """The decimation of a window keeps the minimum and maximum of each series
+    in the window, as found by brute force."""
+    rng = np.random.default_rng(seed)
+    n_series = int(rng.integers(1, 6))
+    n_total = int(rng.integers(100, 5000))
+    y = rng.standard_normal((n_series, n_total)).cumsum(axis=-1)
+    pyramid = _minmax_pyramid(y)
+
+    for _ in range(20):
+        start, stop = _random_window(rng, n_total)
+        n_points = int(rng.integers(6 * n_series + 2, 400))
+        indices = _pyramid_indices(y, pyramid, start, stop, n_points)
+
+        assert len(indices) <= n_points
+        assert np.all(np.diff(indices) > 0)
+        assert indices[0] == start and indices[-1] == stop - 1
+        window = y[:, start:stop]
+        kept = y[:, indices]
+        np.testing.assert_array_equal(kept.min(axis=-1), window.min(axis=-1))
+        np.testing.assert_array_equal(kept.max(axis=-1), window.max(axis=-1))
+
+
+def test_pyramid_indices_without_pyramid():
+    """Results stored without pyramid are decimated from the series."""
+    rng = np.random.default_rng(0)
+    y = rng.standard_normal((3, 1000))
+    indices = _pyramid_indices(y, None, 100, 900, 50)
+
+    assert len(indices) <= 50
+    assert indices[0] == 100 and indices[-1] == 899
+    window = y[:, 100:900]
+    np.testing.assert_array_equal(y[:, indices].max(axis=-1),
+                                  window.max(axis=-1))
+
+
+@pytest.mark.parametrize("n_points", [2, 10, 50])
+def test_decimation_budget_with_many_series(n_points):
+    """The number of points never exceeds the budget, even if it does not
+    allow a bucket for each series."""
+    rng = np.random.default_rng(1)
+    y = rng.standard_normal((40, 3000))
+    pyramid = _minmax_pyramid(y)
+
+    for indices in (_pyramid_indices(y, pyramid, 0, 3000, n_points),
+                    _pyramid_indices(y, pyramid, 17, 2500, n_points),
+                    _minmax_indices(y, n_points)):
+        assert 2 <= len(indices) <= n_points
+        assert np.all(np.diff(indices) > 0)
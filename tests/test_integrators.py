@@ -0,0 +1,48 @@
+"""Tests of the fixed step integrators."""
+import numpy as np
+import pytest
+
+from simulation_api.simulation.integrators import leapfrog, yoshida4
+
+
+# Pendulum, H = p**2 / 2 - cos(q): a non linear separable Hamiltonian
+def _dqdt(t, p):
+    return p
+
+
+def _dpdt(t, q):
+    return -np.sin(q)
+
+
+def _energy(q, p):
+    return p ** 2 / 2 - np.cos(q)
+
+
+@pytest.mark.parametrize("integrator, tolerance", [
+    (leapfrog, 1e-2),
+    (yoshida4, 1e-4),
+])
+@pytest.mark.parametrize("q0, p0", [
+    ([1.], [0.]),
+    ([[1., 2., 0.5]], [[0., 0.5, -1.]]),
+])
+def test_symplectic_energy_drift(integrator, tolerance, q0, p0):
+    """The energy oscillates within a small band and does not drift, over
+    tens of thousands of steps."""
+    q0 = np.array(q0)
+    p0 = np.array(p0)
+    t = np.linspace(0, 5000, 50001)
+    q_out = np.empty(q0.shape + t.shape)
+    p_out = np.empty(p0.shape + t.shape)
+
+    integrator(_dqdt, _dpdt, t, q0, p0, q_out, p_out)
+
+    energy = _energy(q_out, p_out)
+    energy0 = _energy(q0, p0)[..., None]
+    assert np.abs(energy - energy0).max() < tolerance
+    # No secular drift: the first and last tenths of the run have the same
+    # mean energy, up to a small fraction of the band
+    tenth = len(t) // 10
+    drift = energy[..., -tenth:].mean(axis=-1) \
+            - energy[..., :tenth].mean(axis=-1)
+    assert np.abs(drift).max() < tolerance / 10
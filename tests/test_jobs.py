@@ -0,0 +1,202 @@
+"""Tests of the queue of jobs (simulations run in the pool of workers)."""
+import pytest
+
+from simulation_api.config import MAX_JOB_ATTEMPTS
+from simulation_api.controller import tasks
+from simulation_api.controller.schemas import (JobState,
+                                               sim_cancelled_message,
+                                               sim_cancelling_message,
+                                               sim_cancel_finished_message)
+from simulation_api.model import crud, models
+from simulation_api.model.db_manager import SessionLocal
+
+from .conftest import ho_request, create_job
+
+
+def _job(sim_id):
+    db = SessionLocal()
+    job = crud._get_job(db, sim_id)
+    db.close()
+    return job
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """Records the jobs submitted to the pool of workers, instead of
+    submitting them."""
+    sim_ids = []
+    monkeypatch.setattr(tasks, "_submit_job", sim_ids.append)
+    return sim_ids
+
+
+def test_recover_jobs(client, submitted):
+    """Jobs that were running or queued when the server stopped are submitted
+    once more at startup, and run once."""
+    running = create_job(JobState.running)
+    queued = create_job(JobState.queued)
+
+    tasks._recover_jobs()
+
+    assert submitted.count(running) == submitted.count(queued) == 1
+    assert submitted.index(running) < submitted.index(queued)
+    assert _job(running).state == JobState.queued.value
+
+    # Only the first worker that claims the job runs it
+    assert tasks._run_job(running) == running
+    assert tasks._run_job(running) is None
+    assert _job(running).state == JobState.done.value
+    status = client.get(f"/api/simulate/status/{running}").json()
+    assert status["success"]
+
+
+def test_job_attempts(client, submitted):
+    """A job that fails before a worker claims it is submitted again, and
+    fails after MAX_JOB_ATTEMPTS attempts."""
+    sim_id = create_job()
+    report_error = tasks._simulation_error_reporter(sim_id)
+
+    for attempt in range(MAX_JOB_ATTEMPTS):
+        report_error(RuntimeError("broken pool"))
+        assert submitted.count(sim_id) == attempt + 1
+        assert _job(sim_id).state == JobState.queued.value
+
+    report_error(RuntimeError("broken pool"))
+    assert submitted.count(sim_id) == MAX_JOB_ATTEMPTS
+    assert _job(sim_id).state == JobState.done.value
+    status = client.get(f"/api/simulate/status/{sim_id}").json()
+    assert status["success"] is False
+    assert "broken pool" in status["message"]
+
+
+def test_system_mismatch_is_forbidden(client):
+    """A request posted to the path of another system is rejected before
+    anything is stored."""
+    request = ho_request(username="forbidden")
+    db = SessionLocal()
+    n_pending = crud._count_pending_jobs(db)
+
+    response = client.post("/api/simulate/Chen-Lee-Attractor", json=request)
+
+    assert response.status_code == 403
+    assert crud._count_pending_jobs(db) == n_pending
+    assert not db.query(models.UserDB) \
+                 .filter(models.UserDB.username == "forbidden").count()
+    db.close()
+
+
+def _assert_retry_after(response, status_code):
+    assert response.status_code == status_code
+    retry_after = response.json()["retry_after"]
+    assert isinstance(retry_after, int) and retry_after >= 1
+    assert response.headers["Retry-After"] == str(retry_after)
+
+
+def test_admission_per_user(client, monkeypatch, pending_jobs):
+    """Users with too many pending simulations get 429 with Retry-After, the
+    rest of users are admitted."""
+    monkeypatch.setattr(tasks, "MAX_PENDING_JOBS_PER_USER", len(pending_jobs))
+
+    response = client.post("/api/simulate/Harmonic-Oscillator",
+                           json=ho_request(username="admission"))
+    _assert_retry_after(response, 429)
+
+    response = client.post("/api/simulate/Harmonic-Oscillator",
+                           json=ho_request(username="other"))
+    assert response.status_code == 200
+    assert response.json()["sim_id"]
+
+
+def test_admission_full_queue(client, simulate, monkeypatch, pending_jobs):
+    """If the queue is full every new simulation gets 503 with Retry-After,
+    but identical simulations are still served from the cache."""
+    cached_request = ho_request()
+    simulate(cached_request)
+    db = SessionLocal()
+    monkeypatch.setattr(tasks, "MAX_PENDING_JOBS",
+                        crud._count_pending_jobs(db))
+    db.close()
+
+    response = client.post("/api/simulate/Harmonic-Oscillator",
+                           json=ho_request())
+    _assert_retry_after(response, 503)
+
+    response = client.post("/api/simulate/Harmonic-Oscillator",
+                           json=cached_request)
+    assert response.status_code == 200
+    assert response.json()["sim_id"]
+
+
+def test_admission_request_too_large(client, monkeypatch):
+    """A request that does not fit in an empty queue gets 413, without
+    Retry-After."""
+    monkeypatch.setattr(tasks, "MAX_PENDING_JOBS_PER_USER", 0)
+    response = client.post("/api/simulate/Harmonic-Oscillator",
+                           json=ho_request())
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+
+
+def test_retry_after(monkeypatch):
+    """Retry-After is the time the queue needs to drain the excess of jobs at
+    the rate of the last finished jobs."""
+    db = SessionLocal()
+    window = tasks.RETRY_AFTER_WINDOW
+    monkeypatch.setattr(crud, "_count_finished_jobs", lambda db, after: 0)
+    assert tasks._retry_after(db, 10) == tasks.RETRY_AFTER_DEFAULT
+    monkeypatch.setattr(crud, "_count_finished_jobs",
+                        lambda db, after: window)
+    assert tasks._retry_after(db, 10) == 10
+    assert tasks._retry_after(db, 0) == 1
+    db.close()
+
+
+def test_cancel_queued(client):
+    """A queued simulation is cancelled right away and never runs. Cancelling
+    it again answers with the same status."""
+    sim_id = create_job()
+
+    response = client.delete(f"/api/simulate/{sim_id}")
+    assert response.status_code == 200
+    status = response.json()
+    assert status["job_state"] == JobState.cancelled.value
+    assert status["success"] is False
+    assert status["message"] == sim_cancelled_message
+    assert tasks._run_job(sim_id) is None
+
+    response = client.delete(f"/api/simulate/{sim_id}")
+    assert response.status_code == 200
+    for key in ("job_state", "success", "message", "finished"):
+        assert response.json()[key] == status[key]
+    assert _job(sim_id).state == JobState.cancelled.value
+
+
+def test_cancel_running(client, submitted):
+    """A running simulation is marked as cancelled until its worker (or the
+    next startup, if the worker died) stores it as cancelled."""
+    sim_id = create_job(JobState.running)
+
+    for _ in range(2):
+        status = client.delete(f"/api/simulate/{sim_id}").json()
+        assert status["job_state"] == JobState.cancelled.value
+        assert status["success"] is None
+        assert status["message"] == sim_cancelling_message
+
+    tasks._recover_jobs()
+    assert sim_id not in submitted
+    status = client.get(f"/api/simulate/status/{sim_id}").json()
+    assert status["success"] is False
+    assert status["message"] == sim_cancelled_message
+
+
+def test_cancel_finished(client, simulate):
+    """Finished simulations are not modified."""
+    sim_id = simulate()
+    status = client.delete(f"/api/simulate/{sim_id}").json()
+    assert status["success"]
+    assert status["job_state"] == JobState.done.value
+    assert status["message"].endswith(sim_cancel_finished_message)
+
+
+def test_cancel_not_found(client):
+    response = client.delete("/api/simulate/nonexistent")
+    assert response.status_code == 404
@@ -0,0 +1,152 @@
+"""Tests of the routes of the API and their helpers."""
+import os
+import pickle
+
+import numpy as np
+import pytest
+from starlette.requests import Request
+
+from simulation_api.controller.main import _accepts_encoding
+from simulation_api.controller.schemas import (data_window_message,
+                                               series_not_found_message)
+from simulation_api.model.results import _export_pickle_gzip
+
+
+def _request(accept_encoding):
+    headers = []
+    if accept_encoding is not None:
+        headers.append((b"accept-encoding", accept_encoding.encode()))
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize("accept_encoding, accepted", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("GZip", True),
+    ("deflate, gzip;q=0.5", True),
+    ("br", False),
+    ("gzip;q=0", False),
+    ("gzip;q=0.0", False),
+    ("gzip; q=0.000", False),
+    ("deflate, gzip;q=0", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("*, gzip;q=0", False),
+    ("*;q=0, gzip", True),
+    ("gzip;q=abc", False),
+])
+def test_accepts_encoding(accept_encoding, accepted):
+    assert _accepts_encoding(_request(accept_encoding), "gzip") is accepted
+
+
+def test_download_pickle(client, simulate):
+    """The pickle is sent compressed to clients that accept gzip, from a file
+    written once, and uncompressed to the rest."""
+    sim_id = simulate()
+    url = f"/api/results/{sim_id}/pickle"
+
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.status_code == 200
+    assert compressed.headers["content-encoding"] == "gzip"
+    gzip_path = _export_pickle_gzip(sim_id)
+    written = os.stat(gzip_path).st_mtime_ns
+    assert int(compressed.headers["content-length"]) \
+           == os.path.getsize(gzip_path)
+
+    client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert os.stat(gzip_path).st_mtime_ns == written
+
+    identity = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    # The client decompresses the first response
+    results = pickle.loads(compressed.content)
+    expected = pickle.loads(identity.content)
+    np.testing.assert_array_equal(results["t"], expected["t"])
+    np.testing.assert_array_equal(results["y"], expected["y"])
+
+
+def test_download_pickle_not_found(client):
+    response = client.get("/api/results/nope/pickle",
+                          headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 404
+
+
+@pytest.fixture(scope="module")
+def ho_sim_id(simulate):
+    """Simulation of the harmonic oscillator with ``t_span`` ``[0, 10]`` and
+    200 points."""
+    return simulate()
+
+
+def _data(client, sim_id, **params):
+    return client.get(f"/api/results/{sim_id}/data", params=params)
+
+
+@pytest.mark.parametrize("t0, t1", [
+    (None, None),
+    (2.5, 5.),
+    (-5., 100.),
+    (10., None),
+    (None, 0.),
+])
+def test_data_window(client, ho_sim_id, t0, t1):
+    """The window includes both of its bounds, and may extend past
+    ``t_span``."""
+    t = np.linspace(0, 10, 200)
+    in_window = (t >= (-np.inf if t0 is None else t0)) \
+                & (t <= (np.inf if t1 is None else t1))
+    params = {key: value for key, value in (("t0", t0), ("t1", t1))
+              if value is not None}
+
+    data = _data(client, ho_sim_id, **params).json()
+
+    assert data["n_points"] == 200
+    assert data["start"] == np.argmax(in_window)
+    np.testing.assert_allclose(data["t"], t[in_window])
+    assert np.shape(data["y"]) == (2, in_window.sum())
+
+
+@pytest.mark.parametrize("t0, t1, start", [
+    (0.01, 0.02, 1),
+    (20., 30., 200),
+    (-10., -5., 0),
+])
+def test_data_empty_window(client, ho_sim_id, t0, t1, start):
+    """Windows between two points or outside ``t_span`` are empty."""
+    data = _data(client, ho_sim_id, t0=t0, t1=t1).json()
+    assert data["t"] == []
+    assert data["y"] == [[], []]
+    assert data["start"] == start
+
+
+def test_data_stride_and_components(client, ho_sim_id):
+    data = _data(client, ho_sim_id, t0=1., stride=7, components="p").json()
+    full = _data(client, ho_sim_id).json()
+    start = data["start"]
+    assert data["components"] == ["p"]
+    assert data["t"] == full["t"][start::7]
+    assert data["y"] == [full["y"][1][start::7]]
+
+
+def test_data_reversed_window(client, ho_sim_id):
+    response = _data(client, ho_sim_id, t0=5., t1=2.)
+    assert response.status_code == 422
+    assert response.json() == {"detail": data_window_message}
+
+
+def test_api_errors_in_json(client):
+    """Errors of the API are answered in JSON, the rest of the routes render
+    the 404 page."""
+    response = _data(client, "nonexistent")
+    assert response.status_code == 404
+    assert response.json() == {"detail": series_not_found_message}
+
+    response = client.get("/api/nonexistent")
+    assert response.status_code == 404
+    assert response.headers["content-type"] == "application/json"
+    assert "detail" in response.json()
+
+    response = client.get("/nonexistent")
+    assert response.headers["content-type"].startswith("text/html")
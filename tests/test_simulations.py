@@ -0,0 +1,128 @@
+"""Tests of the simulations of the systems."""
+import numpy as np
+import pytest
+from scipy.integrate import solve_ivp
+
+from simulation_api.simulation.simulations import (HarmonicOsc1D,
+                                                   ChenLeeAttractor)
+
+from .conftest import ho_request
+
+
+_ensembles = {
+    HarmonicOsc1D: [[1., 0.], [0., 1.], [-0.5, 2.], [3., -1.]],
+    ChenLeeAttractor: [[10., 10., 0.], [5., -3., 1.], [-2., 4., 8.]],
+}
+_t_spans = {
+    HarmonicOsc1D: [0, 10],
+    ChenLeeAttractor: [0, 0.5],
+}
+
+
+@pytest.mark.parametrize("Sim", [HarmonicOsc1D, ChenLeeAttractor])
+@pytest.mark.parametrize("method", ["RK45", "Radau", "LSODA"])
+def test_ensemble_matches_single_solves(Sim, method):
+    """An ensemble of ``M`` initial conditions, integrated in one batched
+    solve, matches the ``M`` single solves. Radau uses the sparse block
+    diagonal Jacobian, LSODA the dense one.
+
+    The batched solve takes other steps than the single solves, so they are
+    compared up to the error of the single solves (measured against a solve
+    with tight tolerances), which is large for the chaotic Chen-Lee system.
+    """
+    ensemble = _ensembles[Sim]
+    t_span = _t_spans[Sim]
+    t_eval = np.linspace(*t_span, 101)
+    params = {"m": 1., "k": 1.} if Sim is HarmonicOsc1D \
+             else {"a": 3., "b": -5., "c": -1.}
+
+    results = Sim(t_span, t_eval, ensemble, params, method).simulate()
+
+    assert results.success
+    assert results.y.shape == (len(ensemble), Sim.dim, len(t_eval))
+    for member, y in zip(ensemble, results.y):
+        single = Sim(t_span, t_eval, member, params, method)
+        exact = solve_ivp(single.dyn_sys_eqns, t_span, member, t_eval=t_eval,
+                          rtol=1e-10, atol=1e-10).y
+        single = single.simulate().y
+        error = max(np.abs(single - exact).max(), 1e-3 * np.abs(exact).max())
+        np.testing.assert_allclose(y, single, rtol=0, atol=3 * error)
+
+
+def test_ensemble_jacobian_is_block_diagonal():
+    ensemble = _ensembles[ChenLeeAttractor]
+    for method, dense in (("Radau", False), ("LSODA", True)):
+        sim = ChenLeeAttractor(ini_cndtn=ensemble, method=method)
+        jac = sim._ensemble_jacobian(0., np.ravel(ensemble))
+        assert isinstance(jac, np.ndarray) == dense
+        jac = np.asarray(jac.todense() if not dense else jac)
+        for i, member in enumerate(ensemble):
+            block = slice(3 * i, 3 * i + 3)
+            np.testing.assert_array_equal(jac[block, block],
+                                          sim.jacobian(0., member))
+        assert np.count_nonzero(jac) \
+               == sum(np.count_nonzero(sim.jacobian(0., member))
+                      for member in ensemble)
+
+
+def test_one_member_ensemble(client, simulate):
+    """An ensemble of one member is stored and returned as an ensemble, not
+    as a single initial condition."""
+    ensemble = ho_request()["ini_cndtn"]
+    sim_id = simulate(ho_request(ini_cndtn=[ensemble]))
+
+    status = client.get(f"/api/simulate/status/{sim_id}").json()
+    assert status["ini_cndtn"] == [ensemble]
+    data = client.get(f"/api/results/{sim_id}/data",
+                      params={"format": "json"}).json()
+    assert np.shape(data["y"])[:2] == (1, 2)
+
+    sim_id = simulate(ho_request(ini_cndtn=ensemble))
+    status = client.get(f"/api/simulate/status/{sim_id}").json()
+    assert status["ini_cndtn"] == ensemble
+
+
+@pytest.mark.parametrize("ini_cndtn", [[1., 0.5], [[1., 0.5], [-2., 3.]]])
+@pytest.mark.parametrize("params", [{"m": 1., "k": 1.}, {"m": 2.5, "k": 0.3}])
+def test_analytic_matches_solve_ivp(ini_cndtn, params):
+    """The closed form solution of the harmonic oscillator (also for
+    ensembles, and for ``t_span`` not starting at 0) matches an accurate
+    numerical solution."""
+    t_span = [2., 30.]
+    t_eval = np.linspace(*t_span, 500)
+    analytic = HarmonicOsc1D(t_span, t_eval, ini_cndtn, params, "analytic")
+
+    results = analytic.simulate()
+
+    assert results.success
+    np.testing.assert_array_equal(results.t, t_eval)
+    assert results.y.shape == np.shape(ini_cndtn)[:-1] + (2, len(t_eval))
+    for y0, y in zip(np.reshape(ini_cndtn, (-1, 2)),
+                     np.reshape(results.y, (-1, 2, len(t_eval)))):
+        numeric = solve_ivp(analytic.dyn_sys_eqns, t_span, y0, t_eval=t_eval,
+                            rtol=1e-10, atol=1e-10)
+        np.testing.assert_allclose(y, numeric.y, rtol=0, atol=1e-7)
+
+
+def test_analytic_needs_t_eval():
+    with pytest.raises(ValueError):
+        HarmonicOsc1D(method="analytic").simulate()
+
+
+@pytest.mark.parametrize("params", [{"m": 1, "k": 0}, {"m": 1, "k": -1},
+                                    {"m": 0, "k": 1}, {"m": -1, "k": 1}])
+def test_analytic_rejects_non_oscillatory(client, params):
+    """The closed form solution is only valid for ``k > 0`` and ``m > 0``,
+    other parameters are rejected before anything is simulated."""
+    request = ho_request(method="analytic", params=params)
+    response = client.post("/api/simulate/Harmonic-Oscillator", json=request)
+
+    assert response.status_code == 200
+    assert response.json()["sim_id"] is None
+    assert "k > 0 and m > 0" in response.json()["message"]
+
+    # Other methods accept these parameters (unless they divide by m)
+    if params["m"] > 0:
+        response = client.post("/api/simulate/Harmonic-Oscillator",
+                               json=dict(request, method="RK45"))
+        assert response.json()["sim_id"] is not None
@@ -0,0 +1,110 @@
+"""Tests of the storage of the files of the results on disk."""
+import os
+
+import numpy as np
+import pytest
+
+from simulation_api.model import results, storage
+
+
+@pytest.fixture(autouse=True)
+def tmp_storage(tmp_path, monkeypatch):
+    """Objects and results are stored in a temporary directory."""
+    monkeypatch.setattr(storage, "PATH_OBJECTS", str(tmp_path / "objects"))
+    monkeypatch.setattr(results, "PATH_RESULTS", str(tmp_path / "results"))
+    return tmp_path
+
+
+def _objects(tmp_path):
+    return [path for path in (tmp_path / "objects").rglob("*")
+            if path.is_file()]
+
+
+def test_write_file_content_addressed(tmp_path):
+    """Identical files are links to a single object."""
+    storage._write_file(str(tmp_path / "a" / "file"), b"data")
+    storage._write_file(str(tmp_path / "b" / "file"), b"data")
+    storage._write_file(str(tmp_path / "c" / "file"), b"other data")
+
+    inodes = [os.stat(tmp_path / name / "file").st_ino for name in "abc"]
+    assert inodes[0] == inodes[1] != inodes[2]
+    assert len(_objects(tmp_path)) == 2
+    assert os.stat(tmp_path / "a" / "file").st_nlink == 3
+    assert (tmp_path / "b" / "file").read_bytes() == b"data"
+
+
+def test_link_file_replaces_atomically(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"new")
+    dst = tmp_path / "dir" / "dst"
+    storage._write_file(str(dst), b"old")
+
+    storage._link_file(str(src), str(dst))
+
+    assert dst.read_bytes() == b"new"
+    assert os.path.samefile(src, dst)
+    assert sorted(os.listdir(dst.parent)) == ["dst"]
+
+
+def test_link_file_copies_without_hard_links(tmp_path, monkeypatch):
+    """File systems without hard links get a copy."""
+    def link(src, dst):
+        raise OSError("hard links not supported")
+    monkeypatch.setattr(storage.os, "link", link)
+    src = tmp_path / "src"
+    src.write_bytes(b"data")
+    dst = tmp_path / "dir" / "dst"
+
+    storage._link_file(str(src), str(dst))
+
+    assert dst.read_bytes() == b"data"
+    assert not os.path.samefile(src, dst)
+    assert sorted(os.listdir(dst.parent)) == ["dst"]
+
+
+def _save(sim_id):
+    t = np.linspace(0, 1, 50)
+    results._save_results(sim_id, {"t": t, "y": np.stack([t, t ** 2]),
+                                   "success": True, "message": "ok"})
+
+
+def test_link_results(tmp_path):
+    _save("aa01")
+    results._link_results("aa01", "bb02")
+
+    src, dst = results._results_dir("aa01"), results._results_dir("bb02")
+    assert sorted(os.listdir(src)) == sorted(os.listdir(dst))
+    for name in os.listdir(src):
+        assert os.path.samefile(os.path.join(src, name),
+                                os.path.join(dst, name))
+    loaded = results._load_results("bb02")
+    np.testing.assert_array_equal(loaded.y, results._load_results("aa01").y)
+
+
+def test_link_results_all_or_nothing(tmp_path, monkeypatch):
+    """If a link fails the results are missing, not partial, and linking
+    again succeeds."""
+    _save("aa01")
+    link_file = results._link_file
+    n_links = 0
+
+    def failing_link_file(src, dst):
+        nonlocal n_links
+        n_links += 1
+        if n_links == 2:
+            raise OSError("disk full")
+        link_file(src, dst)
+    monkeypatch.setattr(results, "_link_file", failing_link_file)
+
+    with pytest.raises(OSError):
+        results._link_results("aa01", "bb02")
+
+    assert n_links == 2
+    assert not results._results_exist("bb02")
+    # Nor is the temporary directory left behind
+    assert os.listdir(os.path.dirname(results._results_dir("bb02"))) == []
+
+    results._link_results("aa01", "bb02")
+    assert results._results_exist("bb02")
+    assert sorted(os.listdir(results._results_dir("bb02"))) \
+           == sorted(os.listdir(results._results_dir("aa01")))
@@ -0,0 +1,82 @@
+"""Tests of the parameter sweeps."""
+import time
+
+from simulation_api.controller import tasks
+from simulation_api.controller.tasks import _sweep_points
+
+from .conftest import ho_request
+
+
+def test_sweep_points_grid():
+    """A ``dict`` of lists is expanded into its cartesian product, in order."""
+    points = _sweep_points({"m": [1., 2.], "k": [0.5, 1., 1.5]})
+    assert points == [
+        {"m": 1., "k": 0.5}, {"m": 1., "k": 1.}, {"m": 1., "k": 1.5},
+        {"m": 2., "k": 0.5}, {"m": 2., "k": 1.}, {"m": 2., "k": 1.5},
+    ]
+    assert _sweep_points({"m": [1.], "k": []}) == []
+
+
+def test_sweep_points_list():
+    points = [{"m": 1., "k": 2.}, {"m": 3., "k": 4.}]
+    assert _sweep_points(points) == points
+
+
+def _sweep_request(params):
+    request = ho_request()
+    request["params"] = params
+    return request
+
+
+def test_sweep_status(client):
+    """The status of the sweep lists its simulations in the order of the
+    points, and counts them as they finish."""
+    params = {"m": [1., 2.], "k": [1., 3.]}
+    response = client.post("/api/sweep/Harmonic-Oscillator",
+                           json=_sweep_request(params)).json()
+    assert response["n_points"] == 4
+    assert len(response["sim_ids"]) == 4
+
+    deadline = time.time() + 60
+    while True:
+        status = client.get(response["sweep_status_path"]).json()
+        if status["n_finished"] == status["n_points"] \
+                or time.time() > deadline:
+            break
+        time.sleep(0.1)
+
+    assert status["sweep_id"] == response["sweep_id"]
+    assert status["n_points"] == status["n_finished"] \
+           == status["n_success"] == 4
+    assert [sim["sim_id"] for sim in status["simulations"]] \
+           == response["sim_ids"]
+    assert [sim["params"] for sim in status["simulations"]] \
+           == _sweep_points(params)
+
+
+def test_sweep_status_not_found(client):
+    response = client.get("/api/sweep/status/nonexistent")
+    assert response.status_code == 404
+
+
+def test_sweep_max_points(client, monkeypatch):
+    """Sweeps with too many points are rejected and nothing is queued."""
+    monkeypatch.setattr(tasks, "SWEEP_MAX_POINTS", 3)
+    response = client.post("/api/sweep/Harmonic-Oscillator",
+                           json=_sweep_request({"m": [1., 2.],
+                                                "k": [1., 3.]}))
+    assert response.status_code == 200
+    assert response.json()["sweep_id"] is None
+    assert "maximum number of points" in response.json()["message"]
+
+
+def test_sweep_too_large_for_queue(client, monkeypatch):
+    """A sweep that does not fit in the queue on its own is rejected with 413
+    and without Retry-After: retrying would not help."""
+    monkeypatch.setattr(tasks, "MAX_PENDING_JOBS_PER_USER", 3)
+    response = client.post("/api/sweep/Harmonic-Oscillator",
+                           json=_sweep_request({"m": [1., 2.],
+                                                "k": [1., 3.]}))
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+    assert response.json()["retry_after"] is None
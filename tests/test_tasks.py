@@ -0,0 +1,120 @@
+"""Tests of the background tasks of the controller."""
+import os
+import time
+
+import numpy as np
+
+from simulation_api.controller.schemas import (SimRequest,
+                                               ResultCacheDBSchCreate,
+                                               sim_cached_message)
+from simulation_api.controller.tasks import _sim_request_hash
+from simulation_api.model import crud, storage
+from simulation_api.model.db_manager import SessionLocal
+
+from .conftest import ho_request
+
+
+def _request(**kwargs):
+    request = {
+        "system": "Harmonic-Oscillator",
+        "t_span": [0, 10],
+        "t_steps": 100,
+        "ini_cndtn": [1, 0],
+        "params": {"m": 1, "k": 1},
+        "method": "RK45",
+    }
+    request.update(kwargs)
+    return SimRequest(**request)
+
+
+def test_sim_request_hash_ints_and_floats():
+    """``1`` and ``1.0`` are the same value."""
+    assert _sim_request_hash(_request()) == _sim_request_hash(_request(
+        t_span=[0., 10.],
+        ini_cndtn=[1., 0.],
+        params={"m": 1., "k": 1.},
+    ))
+
+
+def test_sim_request_hash_ignores_user():
+    assert _sim_request_hash(_request(username="a")) \
+           == _sim_request_hash(_request(username="b"))
+
+
+def test_sim_request_hash_t_steps_as_t_eval():
+    """``t_steps`` defines the same simulation as the equivalent
+    ``t_eval``."""
+    t_eval = np.linspace(0, 10, 100).tolist()
+    assert _sim_request_hash(_request()) \
+           == _sim_request_hash(_request(t_steps=0, t_eval=t_eval))
+
+
+def test_sim_request_hash_differs():
+    request_hash = _sim_request_hash(_request())
+    assert request_hash != _sim_request_hash(_request(params={"m": 1,
+                                                              "k": 2}))
+    assert request_hash != _sim_request_hash(_request(ini_cndtn=[0, 1]))
+    assert request_hash != _sim_request_hash(_request(method="RK4"))
+    assert request_hash != _sim_request_hash(_request(t_steps=101))
+
+
+def test_identical_request_reuses_results(client, simulate):
+    """An identical request gets a new simulation ID, with the results of the
+    first one and nothing simulated."""
+    request = ho_request()
+    sim_id = simulate(request)
+
+    response = client.post("/api/simulate/Harmonic-Oscillator",
+                           json=dict(request, username="other")).json()
+    assert response["sim_id"] not in (None, sim_id)
+    assert response["message"] == sim_cached_message
+    status = client.get(f"/api/simulate/status/{response['sim_id']}").json()
+    assert status["success"]
+
+    series = [client.get(f"/api/results/{s}/data", params={"format": "json"})
+              .json() for s in (sim_id, response["sim_id"])]
+    assert series[0]["t"] == series[1]["t"]
+    assert series[0]["y"] == series[1]["y"]
+
+
+def test_evict_cached_results(client):
+    db = SessionLocal()
+    now = time.time()
+    for i, created in enumerate((now - 100, now - 10, now - 5, now - 1)):
+        crud._create_cached_result(db, ResultCacheDBSchCreate(
+            request_hash=f"evict{i}", sim_id=f"sim{i}", created=created,
+            last_used=created
+        ))
+    hashes = [f"evict{i}" for i in range(4)]
+
+    # Expired entries
+    assert crud._evict_cached_results(db, 10**6, now - 50) >= 1
+    assert crud._get_cached_result(db, "evict0") is None
+    # Explicitly deleted entries, without a default list shared by calls
+    assert crud._evict_cached_results(db, 10**6, 0, ["evict1"]) == 1
+    assert crud._evict_cached_results(db, 10**6, 0) == 0
+    assert crud._get_cached_result(db, "evict2") is not None
+    crud._evict_cached_results(db, 10**6, 0, hashes)
+    db.close()
+
+
+def test_collect_garbage(tmp_path, monkeypatch):
+    """Objects that no file links are deleted, linked objects are kept."""
+    monkeypatch.setattr(storage, "PATH_OBJECTS", str(tmp_path / "objects"))
+    linked = tmp_path / "results" / "linked"
+    storage._write_file(str(linked), b"linked")
+    storage._write_file(str(tmp_path / "results" / "unlinked"), b"unlinked")
+    os.remove(tmp_path / "results" / "unlinked")
+    old = time.time() - 2 * storage._GC_MIN_AGE
+    for path in (tmp_path / "objects").rglob("*"):
+        if path.is_file():
+            os.utime(path, (old, old))
+
+    assert storage._collect_garbage(force=True) == 1
+    assert linked.read_bytes() == b"linked"
+    assert len([p for p in (tmp_path / "objects").rglob("*")
+                if p.is_file()]) == 1
+
+    # Collected objects are written again when needed
+    storage._write_file(str(tmp_path / "results" / "again"), b"unlinked")
+    assert (tmp_path / "results" / "again").read_bytes() == b"unlinked"